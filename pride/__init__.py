@@ -3,6 +3,7 @@ import sys
 import traceback
 import os
 import heapq
+import operator
 
 _alert_handler_config = dict()
 
@@ -46,6 +47,9 @@ import heapq
 import timeit
 import platform
 import mmap
+import threading
+import collections
+import atexit
 CURRENT_PLATFORM = platform.system()
 timestamp = timeit.default_timer
 
@@ -71,9 +75,30 @@ class Instruction(object):
         Note that Instructions must be executed to have any effect, and
         that they do not happen inline even if the priority is 0.0. In
         order to access the result of the executed function, a callback
-        function can be provided."""
+        function can be provided.
+
+        Executed instructions are stored in Instruction.instructions, which
+        is a heap by default. A different queue, such as a
+        pride.components.datastructures.Timing_Wheel, may be installed via
+        Instruction.set_queue."""
 
     instructions = []
+    _push = staticmethod(heapq.heappush)
+    _pop = staticmethod(heapq.heappop)
+    _peek = staticmethod(operator.itemgetter(0))
+
+    # index the entries that are waiting in the queue by component reference
+    # and by Instruction, so purge and unschedule do not scan the whole queue
+    # the inner dictionaries map id(entry) : entry
+    # entries are indexed under the component_name of their Instruction, which
+    # is the target component even when the call is routed to a thread pool
+    _component_entries = {}
+    _instruction_entries = {}
+
+    # set by shard.Shard_Manager; instructions for references that start with
+    # one of the _remote_prefixes are passed to _route(instruction, priority, callback)
+    _remote_prefixes = ()
+    _route = None
 
     def __init__(self, component_name, method, *args, **kwargs):
         super(Instruction, self).__init__()
@@ -83,29 +108,114 @@ class Instruction(object):
         self.args = args
         self.kwargs = kwargs
 
-    def execute(self, priority=0.0, callback=None):
-        """ usage: instruction.execute(priority=0.0, callback=None)
+    def execute(self, priority=0.0, callback=None, thread_pool=''):
+        """ usage: instruction.execute(priority=0.0, callback=None,
+                                       thread_pool='')
 
             Submits an instruction to the processing queue.
             The instruction will be executed in priority seconds.
             An optional callback function can be provided if the return value
-            of the instruction is needed. """
-        heapq.heappush(self.instructions, [timestamp() + priority, self,
-                                           callback, self.component_name,
-                                           self.method, self.args, self.kwargs,
-                                           True])
+            of the instruction is needed.
+
+            If thread_pool is the reference of a workerpool.Thread_Pool, the
+            method is called on one of the pools worker threads instead of
+            the Processor thread. The callback is still called on the
+            Processor thread. Until it is due, the instruction is pending for
+            component_name, not for the thread pool, so purging the component
+            cancels it.
+
+            Instructions for components pinned to a different shard are
+            sent to that shard; see pride.components.shard. """
+        if (self.component_name.startswith(self._remote_prefixes) and
+            self._route(self, priority, callback)):
+            return
+        if thread_pool:
+            component_name, method = thread_pool, "call"
+            args = (self.component_name, self.method) + self.args
+        else:
+            component_name, method, args = self.component_name, self.method, self.args
+        entry = [timestamp() + priority, self, callback, component_name,
+                 method, args, self.kwargs, True]
+        self._push(self.instructions, entry)
+
+        entry_id = id(entry)
+        try:
+            self._component_entries[self.component_name][entry_id] = entry
+        except KeyError:
+            self._component_entries[self.component_name] = {entry_id : entry}
+        try:
+            self._instruction_entries[self][entry_id] = entry
+        except KeyError:
+            self._instruction_entries[self] = {entry_id : entry}
+
+    @classmethod
+    def set_queue(cls, queue, push, pop, peek):
+        """ usage: Instruction.set_queue(queue, push, pop, peek)
+
+            Replaces the queue that stores executed instructions. push and
+            pop are called as push(queue, entry) and pop(queue) => entry,
+            in the same manner as heapq.heappush and heapq.heappop.
+            peek(queue) => entry returns the entry that pop would return
+            without removing it, like queue[0] for a heap.
+            Instructions that are already scheduled are moved to the new queue.
+
+            The queue should be set before the Processor begins running. """
+        old_queue = cls.instructions
+        cls.instructions = queue
+        cls._push = staticmethod(push)
+        cls._pop = staticmethod(pop)
+        cls._peek = staticmethod(peek)
+        for entry in old_queue:
+            push(queue, entry)
 
     @classmethod
     def purge(cls, reference):
-        instructions = cls.instructions
-        for entry in instructions:
-            if entry[3] == reference:
-                entry[-1] = False
+        """ usage: Instruction.purge(reference)
+
+            Cancels all pending instructions for the component reference. """
+        instruction_entries = cls._instruction_entries
+        for entry_id, entry in cls._component_entries.pop(reference, {}).items():
+            entry[-1] = False
+            entries = instruction_entries[entry[1]]
+            del entries[entry_id]
+            if not entries:
+                del instruction_entries[entry[1]]
 
     def unschedule(self):
-        for entry in self.instructions:
-            if entry[1] == self:
-                entry[-1] = False
+        """ usage: instruction.unschedule()
+
+            Cancels all pending executions of this instruction. """
+        component_entries = self._component_entries
+        for entry_id, entry in self._instruction_entries.pop(self, {}).items():
+            entry[-1] = False
+            entries = component_entries[self.component_name]
+            del entries[entry_id]
+            if not entries:
+                del component_entries[self.component_name]
+
+    @classmethod
+    def _remove_from_index(cls, entry):
+        """ Called by the Processor when a pending entry leaves the queue """
+        entry_id = id(entry)
+        component_name = entry[1].component_name
+        component_entries = cls._component_entries
+        entries = component_entries[component_name]
+        del entries[entry_id]
+        if not entries:
+            del component_entries[component_name]
+
+        instruction_entries = cls._instruction_entries
+        entries = instruction_entries[entry[1]]
+        del entries[entry_id]
+        if not entries:
+            del instruction_entries[entry[1]]
+
+    @classmethod
+    def pending_count(cls, reference):
+        """ usage: Instruction.pending_count(reference) => int
+
+            Returns the number of pending instructions for the component reference. """
+        return len(cls._component_entries.get(reference, ()))
 
     def __str__(self):
         return "Instruction({}.{}, {}, {})".format(self.component_name, self.method,
@@ -136,7 +246,15 @@ class Alert_Handler(base.Base):
 
     defaults = {"log_level" : '0+v', "print_level" : '0',
                 "log_name" : os.path.join(site_config.LOG_DIRECTORY, "Alerts.log"),
-                "log_is_persistent" : False, "parse_args" : True}
+                "log_is_persistent" : False, "parse_args" : True,
+                # records are buffered in memory and written by a background
+                # thread every log_flush_interval seconds or when
+                # log_buffer_size bytes are waiting. when the log file would
+                # exceed log_max_size bytes, it is renamed to log_name.1, and
+                # log_backup_count previous log files are kept. a log_max_size
+                # of 0 disables rotation.
+                "log_buffer_size" : 64 * 1024, "log_flush_interval" : 1.0,
+                "log_max_size" : 10 * 1024 * 1024, "log_backup_count" : 4}
     defaults.update(_alert_handler_config.get("defaults", dict()))
 
     parser_args = ("log_level", "print_level", "log_name")
@@ -144,9 +262,13 @@ class Alert_Handler(base.Base):
     parser_modifiers = {"exit_on_help" : False}
     parser_modifiers.update(_alert_handler_config.get("parser_modifiers", dict()))
 
-    auto_verbosity_ignore = ("append_to_log", )
+    auto_verbosity_ignore = ("append_to_log", "get_gates", "invalidate_gates", "flush")
     auto_verbosity_ignore += _alert_handler_config.get("auto_verbosity_ignore", tuple())
 
+    _print_level = _log_level = frozenset()
+    _gates = {}
+    _debug = False
+
     def _get_print_level(self):
         return self._print_level
     def _set_print_level(self, value):
@@ -156,6 +278,7 @@ class Alert_Handler(base.Base):
             print_level.remove('0')
             print_level.append(0)
         self._print_level = set(print_level)
+        self.invalidate_gates()
     print_level = property(_get_print_level, _set_print_level)
 
     def _get_log_level(self):
@@ -167,31 +290,183 @@ class Alert_Handler(base.Base):
             log_level.remove('0')
             log_level.append(0)
         self._log_level = set(log_level)
+        self.invalidate_gates()
     log_level = property(_get_log_level, _set_log_level)
 
+    def invalidate_gates(self):
+        """ usage: alert_handler.invalidate_gates()
+
+            Discards the cached decisions of whether each verbosity level of
+            each class is printed and/or logged. Called automatically when
+            print_level or log_level is set; should be called after modifying
+            the verbosity of a class at runtime. """
+        self._gates = {}
+        self._debug = "debug" in self._print_level or "debug" in self._log_level
+
+    def get_gates(self, cls, verbosity):
+        """ usage: alert_handler.get_gates(cls, verbosity) => gates
+
+            Returns a dictionary that maps the keys of verbosity to
+            (print_enabled, log_enabled) for the current print_level and
+            log_level. The dictionary is cached for cls. """
+        try:
+            return self._gates[cls]
+        except KeyError:
+            print_level, log_level = self._print_level, self._log_level
+            print_debug, log_debug = "debug" in print_level, "debug" in log_level
+            gates = self._gates[cls] = dict((key, (level in print_level or level is 0 or print_debug,
+                                                   level in log_level or level is 0 or log_debug)) for
+                                            key, level in verbosity.items())
+            return gates
+
     def __init__(self, **kwargs):
         super(Alert_Handler, self).__init__(**kwargs)
         self.log = open(self.log_name, 'a+')
+        self.log.seek(0, 2)
+        self._log_size = self.log.tell()
+        self._records = collections.deque()
+        self._buffered_size = 0
+        # _records_lock guards _records, _buffered_size and _writer, and is
+        # not held while writing, so alerts do not wait for the log file
+        self._records_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._writer = None # started when the first record is buffered
+        self._exiting = False
+        atexit.register(self._stop_writer)
+
+    def reset_after_fork(self):
+        """ usage: alert_handler.reset_after_fork()
+
+            Should be called in the child process after os.fork. The records
+            buffered before the fork are discarded, because the parent
+            writes them. The lock and the writer thread do not survive the
+            fork and are replaced; the writer restarts with the next record. """
+        self._records.clear()
+        self._buffered_size = 0
+        self._records_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._writer = None
+
+    def _start_writer(self):
+        self._writer = threading.Thread(target=self._write_records)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _write_records(self):
+        flush_requested = self._flush_requested
+        while not self._exiting:
+            flush_requested.wait(self.log_flush_interval)
+            flush_requested.clear()
+            self.flush()
+
+    def _stop_writer(self):
+        # a daemon thread that wakes up while the interpreter is tearing
+        # down modules raises errors, so it is stopped before exit
+        self._exiting = True
+        if self._writer is not None:
+            self._flush_requested.set()
+            self._writer.join(1.0)
+        self.flush()
 
     def append_to_log(self, message, level):
-        self.log.seek(0, 1) # windows might complain about files in + mode if this isn't done
-        self.log.write(str(level) + message + "\n")
+        record = str(level) + message + "\n"
+        with self._records_lock:
+            self._records.append(record)
+            if self._writer is None:
+                self._start_writer()
+            self._buffered_size += len(record)
+            if self._buffered_size >= self.log_buffer_size:
+                if not self._writer.is_alive() and not self._exiting: # forked without reset_after_fork
+                    self._start_writer()
+                self._flush_requested.set()
+
+    def flush(self):
+        """ usage: alert_handler.flush()
+
+            Writes the buffered log records to the log file, rotating the
+            log file first if it would exceed log_max_size. """
+        with self._log_lock:
+            # records are taken while holding _log_lock, so concurrent
+            # flushes write them in the order they were appended
+            with self._records_lock:
+                if not self._records:
+                    return
+                data = ''.join(self._records)
+                self._records.clear()
+                self._buffered_size = 0
+            if self.log_max_size and self._log_size and self._log_size + len(data) > self.log_max_size:
+                self._rotate()
+            log = self.log
+            log.seek(0, 2) # windows might complain about files in + mode if this isn't done
+            log.write(data)
+            log.flush()
+            self._log_size += len(data)
+
+    def _rotate(self):
+        self.log.close()
+        segment_names = self._segment_names(self.log_backup_count + 1)
+        if os.path.exists(segment_names[-1]):
+            os.remove(segment_names[-1])
+        for index in reversed(range(len(segment_names) - 1)):
+            if os.path.exists(segment_names[index]):
+                os.rename(segment_names[index], segment_names[index + 1])
+        self.log = open(self.log_name, 'a+')
+        self._log_size = 0
+
+    def _segment_names(self, count=None):
+        """ Returns the names of the log file and rotated log files, newest first """
+        count = self.log_backup_count + 1 if count is None else count
+        return [self.log_name] + ["{}.{}".format(self.log_name, index) for index in range(1, count)]
 
     def dump_log(self, byte_count=0, lines=0):
-        log = self.log
-        backup_position = log.tell()
-        if byte_count:
-            log.seek(backup_position - byte_count)
-            output = log.read(byte_count)
-        elif lines:
-            mmap_log = self._open_mmap(log)
-            output = self._tail_lines(mmap_log, lines)
-            mmap_log.close()
-        else:
-            log.seek(0)
-            output = log.read()
-        log.seek(backup_position)
-        return output
+        """ usage: alert_handler.dump_log(byte_count=0, lines=0) => log_contents
+
+            Returns the last byte_count bytes or lines lines of the log, or
+            the entire log if neither is specified. Rotated log files are
+            included when the current log file does not contain enough. """
+        self.flush()
+        with self._log_lock:
+            log = self.log
+            backup_position = log.tell()
+            output = []
+            for segment_name in self._segment_names():
+                if segment_name == self.log_name:
+                    _file = log
+                else:
+                    try:
+                        _file = open(segment_name, 'r')
+                    except IOError:
+                        break
+                try:
+                    _file.seek(0, 2)
+                    size = _file.tell()
+                    if byte_count:
+                        read_size = min(byte_count, size)
+                        _file.seek(size - read_size)
+                        output.append(_file.read(read_size))
+                        byte_count -= read_size
+                        if not byte_count:
+                            break
+                    elif lines:
+                        if not size:
+                            continue
+                        mmap_log = self._open_mmap(_file)
+                        tail, line_count = self._tail_lines(mmap_log, lines)
+                        mmap_log.close()
+                        output.append(tail)
+                        lines -= line_count
+                        if not lines:
+                            break
+                    else:
+                        _file.seek(0)
+                        output.append(_file.read())
+                finally:
+                    if _file is not log:
+                        _file.close()
+            log.seek(backup_position)
+        return ''.join(reversed(output))
 
     @staticmethod
     def _open_mmap(_file):
@@ -204,12 +479,18 @@ class Alert_Handler(base.Base):
 
     @staticmethod
     def _tail_lines(string_like_object, line_count):
-        index = string_like_object.rfind('\n')
-        count = 1
+        """ Returns the end of string_like_object, starting from the
+            line_count-th newline from the end, and the number of newlines
+            found, which is less than line_count if there are not enough. """
+        index = len(string_like_object)
+        count = 0
         while count < line_count:
-            index = string_like_object.rfind('\n', 0, index - 1)
+            new_index = string_like_object.rfind('\n', 0, index)
+            if new_index == -1:
+                return string_like_object[:], count
+            index = new_index
             count += 1
-        return string_like_object[index:]
+        return string_like_object[index:], count
 
 del _alert_handler_config
 alert_handler = Alert_Handler()
@@ -91,4 +91,35 @@ def system_update():
 def shutdown():
     raise SystemExit(0)
 
-objects = {}#Objects_Dictionary()
+class Objects_Dictionary(dict):
+    """ The pride.objects dictionary. A component may be registered with
+        add_factory before it exists; it is created by calling the factory
+        the first time its reference is looked up with objects[reference].
+        Membership tests and .get do not create the component. A factory
+        is only called when its reference is missing; the owner of the
+        factory should remove it with remove_factory when it is deleted. """
+
+    def __init__(self, *args, **kwargs):
+        super(Objects_Dictionary, self).__init__(*args, **kwargs)
+        self.factories = {}
+
+    def add_factory(self, reference, factory):
+        """ usage: objects.add_factory(reference, factory)
+
+            factory is called with no arguments and should create the
+            component with the specified reference. """
+        self.factories[reference] = factory
+
+    def remove_factory(self, reference):
+        """ usage: objects.remove_factory(reference) => factory or None """
+        return self.factories.pop(reference, None)
+
+    def __missing__(self, reference):
+        try:
+            factory = self.factories.pop(reference)
+        except KeyError:
+            raise KeyError(reference)
+        factory()
+        return dict.__getitem__(self, reference)
+
+objects = Objects_Dictionary()
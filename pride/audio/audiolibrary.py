@@ -7,7 +7,7 @@ import pride.components.base as base
 import pride.components.scheduler as scheduler
 import pride.components.fileio as fileio
 import pride.functions.utilities
-from pride.components.datastructures import Latency
+from pride.components.datastructures import Latency, Ordered_Set
 #objects = pride.objects
 Instruction = pride.Instruction
 
@@ -217,7 +217,7 @@ class Audio_Manager(base.Base):
     def __init__(self, **kwargs):
         device_names = self.device_names = {}
         super(Audio_Manager, self).__init__(**kwargs)
-        self.objects.setdefault("Audio_Input", [])
+        self.objects.setdefault("Audio_Input", Ordered_Set())
 
         self.load_api()
 
@@ -1,4 +1,6 @@
 # for subcomponents
+from copy import deepcopy
+
 # cannot be in base.py because a reference to Config is needed in metaclass
 def deep_update(d1, d2):
     for key, value in d2.items():
@@ -28,6 +30,9 @@ class Config(dict):
                     except KeyError:
                         self[key] = value
                     else:
+                        # old_value may be shared with a base class
+                        old_value = self[key] = Component(old_value.type,
+                                                          **deepcopy(old_value.kwargs))
                         if value.type is not None:
                             old_value.type = value.type
                         deep_update(old_value.kwargs, value.kwargs)
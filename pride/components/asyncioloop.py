@@ -0,0 +1,297 @@
+""" pride.components.asyncioloop - Runs pride components on an asyncio event loop.
+
+    The Processor and Network of this module replace scheduler.Processor and
+    network.Network in Program.startup_components. Instructions are scheduled
+    with loop.call_at, and sockets are registered with the readers and writers
+    of the loop instead of being polled with select. This allows pride to
+    share a thread with other asyncio code.
+
+    On python 2, the trollius package provides asyncio. Coroutines returned by
+    the method of an Instruction are run as tasks, and the callback of the
+    Instruction receives the result. to_future converts the Pending_Result
+    returned by a remote_procedure_call into an awaitable future. """
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+import traceback
+from functools import partial
+
+import pride
+import pride.components.scheduler
+import pride.components.network
+
+Pending_Result = pride.components.scheduler.Pending_Result
+timestamp = pride.components.scheduler.timestamp
+
+def to_future(pending_result, loop=None):
+    """ usage: to_future(pending_result, loop=None) => future
+
+        Returns an asyncio Future that resolves with the result of
+        pending_result. Exceptions, such as a remote traceback, are
+        set as the exception of the future. """
+    future = asyncio.Future(loop=loop)
+    def _resolve(result):
+        if not future.cancelled():
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    pending_result.add_callback(_resolve)
+    return future
+
+
+class _Loop_Queue(object):
+    """ Takes the place of the instruction queue; each pushed entry is
+        scheduled on the event loop for the time it is due. """
+
+    def __init__(self, loop, execute_entry):
+        self.loop = loop
+        self.execute_entry = execute_entry
+        self.entries = {}
+
+    def push(self, entry):
+        loop = self.loop
+        self.entries[id(entry)] = entry
+        loop.call_at(loop.time() + (entry[0] - timestamp()), self.execute_entry, entry)
+
+    def pop(self):
+        raise IndexError("Instructions are executed by the event loop")
+
+    peek = pop
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries.values()))
+
+
+class Processor(pride.components.scheduler.Processor):
+    """ Executes Instructions from an asyncio event loop. The loop is
+        event_loop, or the default event loop of the thread if event_loop
+        is None. The run method runs the loop; when pride is embedded in an
+        application that runs the loop itself, run does not need to be called.
+
+        Instruction methods may be coroutine functions; the callback of the
+        Instruction is called with the result when the task finishes. """
+
+    defaults = {"event_loop" : None}
+
+    def __init__(self, **kwargs):
+        super(Processor, self).__init__(**kwargs)
+        if self.event_loop is None:
+            self.event_loop = asyncio.get_event_loop()
+        self._queue = _Loop_Queue(self.event_loop, self._execute_entry)
+        pride.Instruction.set_queue(self._queue, _Loop_Queue.push, _Loop_Queue.pop, _Loop_Queue.peek)
+
+    def run(self):
+        self.event_loop.run_forever()
+
+    def __getstate__(self):
+        state = super(Processor, self).__getstate__()
+        state["event_loop"] = None
+        del state["_queue"]
+        return state
+
+    def on_load(self, state):
+        super(Processor, self).on_load(state)
+        self.event_loop = asyncio.get_event_loop()
+        self._queue = _Loop_Queue(self.event_loop, self._execute_entry)
+        pride.Instruction.set_queue(self._queue, _Loop_Queue.push, _Loop_Queue.pop, _Loop_Queue.peek)
+
+    def _execute_entry(self, entry):
+        (execute_at, instruction, callback,
+         component_name, method, args, kwargs,
+         execute_flag) = entry
+        del self._queue.entries[id(entry)]
+        if not execute_flag: # facilitates Instruction.purge and Instruction.unschedule
+            return
+        pride.Instruction._remove_from_index(entry)
+
+        verbosity = self.verbosity
+        try:
+            call = getattr(pride.objects[component_name], method)
+        except KeyError:
+            self.alert("{0}:\n    '{1}' component does not exist".format(instruction, component_name),
+                       level=verbosity["component_alert"])
+            return
+        except AttributeError as error:
+            self.alert("{0}:\n    {1}".format(instruction, error),
+                       level=verbosity["component_alert"])
+            return
+
+        self.lazy_alert("instruction_execution", "executing instruction {}", instruction)
+        try:
+            result = call(*args, **kwargs)
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except BaseException as error:
+            self._handle_exception(component_name, method, error, callback, traceback.format_exc())
+            return
+
+        if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+            task = asyncio.ensure_future(result, loop=self.event_loop)
+            task.add_done_callback(partial(self._task_done, component_name, method, callback))
+        elif callback:
+            if isinstance(result, Pending_Result):
+                result.add_callback(callback)
+            else:
+                self._run_callback(callback, result)
+
+    def _task_done(self, component_name, method, callback, task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            stack_trace = ''.join(traceback.format_exception(type(error), error, None))
+            self._handle_exception(component_name, method, error, callback, stack_trace)
+        elif callback:
+            self._run_callback(callback, task.result())
+
+    def _run_callback(self, callback, result):
+        try:
+            callback(result)
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except BaseException:
+            self.alert("Exception in callback '{}'\n{}".format(callback, traceback.format_exc()),
+                       level=self.verbosity["callback_exception"])
+
+    def _handle_exception(self, component_name, method, error, callback, stack_trace):
+        self.alert("\nException encountered when processing {0}.{1}\n{2}".format(component_name, method,
+                                                                                stack_trace),
+                   level=self.verbosity["exception_alert"])
+        try:
+            handler = pride.objects[component_name].handle_instruction_exception
+        except (KeyError, AttributeError):
+            pass
+        else:
+            handler(method, error, callback, None)
+
+
+class Network(pride.components.network.Network):
+    """ Registers sockets with the readers and writers of an asyncio event
+        loop instead of polling them with select. Connecting sockets are
+        checked for connect timeouts every priority seconds. """
+
+    # sockets are registered with the event loop rather than a poller
+    defaults = {"running" : False, "event_loop" : None, "readiness_backend" : "select"}
+
+    predefaults = {"_checking_connections" : False}
+
+    mutable_defaults = {"_file_descriptors" : dict}
+
+    def __init__(self, **kwargs):
+        super(Network, self).__init__(**kwargs)
+        if self.event_loop is None:
+            self.event_loop = asyncio.get_event_loop()
+
+    def add(self, sock):
+        super(Network, self).add(sock)
+        file_descriptor = self._file_descriptors[sock] = sock.fileno()
+        self.event_loop.add_reader(file_descriptor, self._handle_readable, [sock])
+
+    def remove(self, sock):
+        super(Network, self).remove(sock)
+        file_descriptor = self._file_descriptors.pop(sock)
+        self.event_loop.remove_reader(file_descriptor)
+        self.event_loop.remove_writer(file_descriptor)
+        self.connecting.discard(sock)
+
+    def add_connecting(self, sock):
+        super(Network, self).add_connecting(sock)
+        if not self._checking_connections:
+            self._checking_connections = True
+            self.event_loop.call_later(self.priority, self._check_connections)
+
+    def _update_events(self, sock):
+        try:
+            file_descriptor = self._file_descriptors[sock]
+        except KeyError: # may have been deleted
+            return
+        event_loop = self.event_loop
+        if sock in self.paused_readers:
+            event_loop.remove_reader(file_descriptor)
+        else:
+            event_loop.add_reader(file_descriptor, self._handle_readable, [sock])
+        if sock in self.connecting or sock in self.writers:
+            event_loop.add_writer(file_descriptor, self._handle_write_ready, sock)
+        else:
+            event_loop.remove_writer(file_descriptor)
+
+    def _handle_write_ready(self, sock):
+        if sock in self.connecting:
+            self._handle_connecting([sock])
+        if sock in self.writers:
+            self._handle_writable([sock])
+
+    def _check_connections(self):
+        self._handle_connecting(())
+        if self.connecting:
+            self.event_loop.call_later(self.priority, self._check_connections)
+        else:
+            self._checking_connections = False
+
+    def run(self):
+        pass
+
+    def wait(self, timeout=None):
+        raise NotImplementedError("Sockets are handled by the event loop")
+
+    def on_load(self, state):
+        super(Network, self).on_load(state)
+        self.event_loop = asyncio.get_event_loop()
+
+    def __getstate__(self):
+        state = super(Network, self).__getstate__()
+        state["event_loop"] = None
+        state["_file_descriptors"] = {}
+        state["_checking_connections"] = False
+        return state
+
+
+def test_asyncio_processor():
+    import heapq
+    import operator
+    import pride.components.base
+    loop = asyncio.new_event_loop()
+    processor = Processor(event_loop=loop)
+
+    class Coroutine_Component(pride.components.base.Base):
+
+        @asyncio.coroutine
+        def delayed_double(self, value):
+            yield asyncio.From(asyncio.sleep(.01, loop=loop))
+            raise asyncio.Return(value * 2)
+
+        def double(self, value):
+            return value * 2
+
+    component = Coroutine_Component()
+    results = []
+    def callback(result):
+        results.append(result)
+        if len(results) == 3:
+            loop.stop()
+
+    pride.Instruction(component.reference, "delayed_double", 1).execute(callback=callback)
+    pride.Instruction(component.reference, "double", 2).execute(priority=.05, callback=callback)
+    pride.Instruction(component.reference, "double", 3).execute(priority=.02, callback=callback)
+    cancelled = pride.Instruction(component.reference, "double", 4)
+    cancelled.execute(priority=.01, callback=callback)
+    cancelled.unschedule()
+    loop.run_forever()
+    assert results == [2, 6, 4], results
+    assert not len(pride.Instruction.instructions)
+
+    pending_result = Pending_Result()
+    future = to_future(pending_result, loop=loop)
+    loop.call_soon(pending_result.set_result, "response")
+    assert loop.run_until_complete(future) == "response"
+    pride.Instruction.set_queue([], heapq.heappush, heapq.heappop, operator.itemgetter(0))
+    loop.close()
+    print("Passed asyncio Processor unit test")
+
+if __name__ == "__main__":
+    test_asyncio_processor()
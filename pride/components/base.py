@@ -8,10 +8,16 @@ import heapq
 import pprint
 import inspect
 import importlib
+import io
 from six import with_metaclass
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 import pride
 import pride.components.metaclass
+import pride.components.datastructures
 import pride.functions.utilities as utilities
 import pride.functions.contextmanagers
 import pride.functions.module_utilities
@@ -20,58 +26,127 @@ from pride.components import deep_update
 
 __all__ = ["DeleteError", "AddError", "load", "Base", "Reactor", "Wrapper", "Proxy"]
 
-def rebuild_object(saved_data):
-    """ usage: load(saved_data) => restored_instance, attributes """
-    #user = pride.objects["/User"]
-    #attributes = user.load_data(saved_data)
-    #repo_id = user.generate_tag(user.username)
-    #version_control = pride.objects["/Program/Version_Control"]
-    #_required_modules = []
-    #module_info = attributes.pop("_required_modules")
-    #class_name = saved_data["_required_modules"].pop()
-    #module_object = importlib.import_module(module_info[-1])
-    #for module_name in module_info:
-        #source = version_control.load_module(module_name, module_id, repo_id)
-        #module_object = pride.functions.module_utilities.create_module(module_name, source)
-    #    _required_modules.append((module_name, module_id, module_object))
-    saved_data = utilities.load_data(saved_data)
-    module_name, class_name = saved_data.pop("_type_info")
-    module_object = importlib.import_module(module_name)
-    self_class = getattr(module_object, class_name)
-    #attributes["_required_modules"] = _required_modules
-
-    self = self_class.__new__(self_class)
-    return self, saved_data
-
-def restore_attributes(new_self, attributes):
-    """ Loads and instance from a bytestream or file produced by pride.components.base.Base.save.
-        Currently being reimplemented"""
-
-    saved_objects = attributes["objects"]
-    assert not attributes["objects"]
-    objects = attributes["objects"] = {}
-    print repr(new_self), "restoring"
-    for instance_type, saved_instances in saved_objects.items():
-        assert saved_instances
-        objects[instance_type] = [load(instance) for instance in saved_instances]
-    import pprint
-    pprint.pprint(objects)
-
-    attribute_modifier = attributes.pop("_attribute_type")
-    for key, value in attributes.items():
-        modifier = attribute_modifier.get(key, '')
-        if modifier == "reference":
-            attributes[key] = pride.objects[value]
-        elif modifier == "save":
-            attributes[key] = load(value)
-    print repr(new_self), "Calling on load"
-    new_self.on_load(attributes)
-    return new_self
-
-def load(saved_object):
-    raise NotImplementedError()
-    new_self, attributes = rebuild_object(saved_object)
-    return restore_attributes(new_self, attributes)
+Ordered_Set = pride.components.datastructures.Ordered_Set
+
+# references are allocated from per parent/class name counters. freed
+# suffixes are kept in a heap, so the lowest free reference is reused
+_reference_counters = {} # base name -> one more than the highest suffix allocated
+_freed_suffixes = {} # base name -> heap of freed suffixes below the counter
+
+def _allocate_reference(base_name):
+    """ usage: _allocate_reference(base_name) => reference
+
+        Returns the first unused reference from base_name, base_name1,
+        base_name2, ... in constant time. References registered with
+        objects.add_factory are in use. """
+    factories = objects.factories
+    reserved = [] # suffixes of references registered with objects.add_factory
+    name = None
+    freed = _freed_suffixes.get(base_name)
+    while freed:
+        suffix = heapq.heappop(freed)
+        if not freed:
+            del _freed_suffixes[base_name]
+        candidate = base_name + str(suffix) if suffix else base_name
+        if candidate in factories:
+            reserved.append(suffix)
+        elif candidate not in objects: # may have been assigned without allocation
+            name = candidate
+            break
+
+    if name is None:
+        suffix = _reference_counters.get(base_name, 0)
+        name = base_name + str(suffix) if suffix else base_name
+        while name in objects or name in factories:
+            if name in factories:
+                reserved.append(suffix)
+            suffix += 1
+            name = base_name + str(suffix)
+        _reference_counters[base_name] = suffix + 1
+
+    if reserved: # available again once the factory has been called
+        freed = _freed_suffixes.setdefault(base_name, [])
+        for suffix in reserved:
+            heapq.heappush(freed, suffix)
+    return name
+
+def _release_reference(reference, base_name):
+    """ usage: _release_reference(reference, base_name)
+
+        Makes reference available to _allocate_reference again. """
+    suffix = reference[len(base_name):]
+    if not reference.startswith(base_name) or (suffix and not suffix.isdigit()):
+        return
+    suffix = int(suffix) if suffix else 0
+    counter = _reference_counters.get(base_name, 0)
+    if suffix >= counter:
+        return
+    freed = _freed_suffixes.setdefault(base_name, [])
+    if len(freed) + 1 == counter: # every allocated suffix is free
+        del _freed_suffixes[base_name]
+        del _reference_counters[base_name]
+    else:
+        heapq.heappush(freed, suffix)
+
+def _checkpoint_components(root):
+    # the components saved with root in preorder, and the references of the
+    # components that are not saved because dont_save is set
+    components, dropped = [], set()
+    pending = [root]
+    while pending:
+        component = pending.pop()
+        if component.dont_save and component is not root:
+            dropped.add(component.reference)
+            dropped.update(child.reference for child in _checkpoint_components(component)[0])
+        else:
+            components.append(component)
+            pending.extend(reversed(list(component.children)))
+    return components, dropped
+
+def _persistent_id(_object):
+    # components are saved by reference so that the graph is restored intact
+    if isinstance(_object, Base):
+        return _object.reference
+
+def load(checkpoint):
+    """ usage: load(checkpoint) => component
+
+        Restores the components saved by Base.save from the bytes or file
+        like object checkpoint. Each component is created without calling
+        __init__, then on_load is called with its saved state, parents
+        before children. Components that are referenced but were not saved
+        are looked up in pride.objects; references to components that were
+        not saved because dont_save is set are restored as None.
+
+        Returns the component that save was called on. If its parent exists,
+        the component is added to it. """
+    if not hasattr(checkpoint, "read"):
+        checkpoint = io.BytesIO(checkpoint)
+    unpickler = pickle.Unpickler(checkpoint)
+    component_types, dropped = unpickler.load()
+    restored = {}
+    for reference, module_name, class_name in component_types:
+        component_type = getattr(importlib.import_module(module_name), class_name)
+        restored[reference] = component_type.__new__(component_type)
+
+    def persistent_load(reference):
+        try:
+            return restored[reference]
+        except KeyError:
+            if reference in dropped:
+                return None
+            return objects[reference]
+    unpickler.persistent_load = persistent_load
+    states = unpickler.load()
+    for (reference, module_name, class_name), state in zip(component_types, states):
+        restored[reference].on_load(state)
+
+    root = restored[component_types[0][0]]
+    parent = objects.get(root.parent_name) if root.parent_name else None
+    if parent is not None and root not in parent.objects.get(type(root).__name__, ()):
+        root.references_to.discard(parent.reference)
+        parent.add(root)
+    return root
 
 class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
     """ The root inheritance object. Provides many features:
@@ -229,9 +304,10 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
     # verbosity is an inherited class attribute used to store the verbosity
     # level of a particular message.
     verbosity = {"delete" : "vv", "initialized" : "vv", "remove" : "vv",
-                 "add" : "vv", "update" : "v", "save" : "vv"}
+                 "add" : "vv", "update" : "v", "save" : "vv",
+                 "load" : 'v'}
 
-    auto_verbosity_ignore = ("alert", )
+    auto_verbosity_ignore = ("alert", "lazy_alert")
 
     # A command line argument parser is generated automatically for
     # every Base class based upon the attributes contained in the
@@ -306,20 +382,21 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
 
     post_initializer = ''
 
+    # when True, instances of the class and its subclasses store their
+    # defaults, predefaults, mutable_defaults and bookkeeping attributes in
+    # __slots__ instead of a __dict__. See metaclass.Compact_Instances
+    compact = False
+
     def __init__(self, **kwargs):
         super(Base, self).__init__() # facilitates complicated inheritance - otherwise does nothing
-        self.references_to = []
+        self.references_to = Ordered_Set()
         parent_name = self.parent_name = pride._last_creator
         # the following line fixes a bug where:
         #       base object A creates base object B
         #       base object B instantiates base object C (not via 'create')
         #       base object C would become a child of base object A
         pride._last_creator = ''
-        instance_count = 0
-        _name = name = parent_name + "/" + self.__class__.__name__
-        while name in objects:
-            instance_count += 1
-            name = _name + str(instance_count)
+        name = _allocate_reference(parent_name + "/" + self.__class__.__name__)
 
         self.reference = name
         objects[self.reference] = self
@@ -327,21 +404,35 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
         # the objects attribute keeps track of instances created by this self
         self.objects = {}
 
-        for attribute, value_type in self.mutable_defaults.items():
-            if attribute not in kwargs:
-                setattr(self, attribute, value_type())
-
         subcomponents = self.subcomponents
-        for attribute, value in itertools.chain(self.predefaults.items(),
-                                                self.defaults.items(),
-                                                kwargs.items()):
-            if attribute in kwargs:
+        if type(self)._assign_directly:
+            # see metaclass.Direct_Assignment
+            attributes = self.__dict__
+            for attribute, value_type in self.mutable_defaults.items():
+                if attribute not in kwargs:
+                    attributes[attribute] = value_type()
+            attributes.update(self.predefaults)
+            attributes.update(self.defaults)
+            for attribute in list(kwargs.keys()):
                 if (attribute[-len("_kwargs"):] == "_kwargs" and
                     attribute.rsplit('_', 1)[0] in subcomponents):
                     continue
                 setattr(self, attribute, kwargs.pop(attribute))
-            else:
-                setattr(self, attribute, value)
+        else:
+            for attribute, value_type in self.mutable_defaults.items():
+                if attribute not in kwargs:
+                    setattr(self, attribute, value_type())
+
+            for attribute, value in itertools.chain(self.predefaults.items(),
+                                                    self.defaults.items(),
+                                                    kwargs.items()):
+                if attribute in kwargs:
+                    if (attribute[-len("_kwargs"):] == "_kwargs" and
+                        attribute.rsplit('_', 1)[0] in subcomponents):
+                        continue
+                    setattr(self, attribute, kwargs.pop(attribute))
+                else:
+                    setattr(self, attribute, value)
 
         if subcomponents:
             for name, component in self.subcomponents.items():
@@ -373,7 +464,7 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
                 except AttributeError:
                     if hasattr(self, attribute):
                         raise
-                    import pprint # note: subcomponents above pops from kwargs
+                    # note: subcomponents above pops from kwargs
                     pprint.pprint(kwargs)
                     raise ArgumentError("{}: Required attribute '{}' not assigned".format(self.reference, attribute))
 
@@ -386,7 +477,7 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
             self.parent.add(self)
 
         try:
-            self.alert("Initialized", level=self.verbosity["initialized"])
+            self.lazy_alert("initialized", "Initialized")
         except (AttributeError, KeyError):
             # Alert handler can not exist in some situations or not have its log yet
             pass
@@ -440,16 +531,18 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
             for name in self.references_to[:]:
                 objects[name].remove(self)
         del objects[self.reference]
+        _release_reference(self.reference, self.parent_name + "/" + self.__class__.__name__)
         self.deleted = True
 
     def delete_children(self):
+        """ usage: object.delete_children()
+
+            Deletes every child object. Children created while deleting are
+            deleted as well. """
         while any(self.objects.values()):
-            keys = self.objects.keys()
-            for key in keys:
-                values = self.objects[key]
-                while values:
-                    for child in values:
-                        child.delete()
+            for child in list(self.children):
+                if not child.deleted: # deleting one child may delete another
+                    child.delete()
         assert not list(self.children)
         #children = list(self.children)
         #while children:
@@ -483,13 +576,13 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
             ancestor version that performs bookkeeping.
 
             Make sure to overload remove if you modify add (if necessary)"""
-        self.alert("Adding: {}".format(instance), level=self.verbosity["add"])
+        self.lazy_alert("add", "Adding: {}", instance)
         self_objects = self.objects
         instance_class = type(instance).__name__
         try:
             siblings = self_objects[instance_class]
         except KeyError:
-            self_objects[instance_class] = siblings = [instance]
+            self_objects[instance_class] = Ordered_Set((instance, ))
         else:
             if instance in siblings:
                 raise AddError
@@ -504,7 +597,7 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
             and instance.references_to.
 
             The default alert level for object removal is 'vv'"""
-        self.alert("Removing {}".format(instance), level=self.verbosity["remove"])
+        self.lazy_alert("remove", "Removing {}", instance)
         self.objects[type(instance).__name__].remove(instance)
         instance.references_to.remove(self.reference)
 
@@ -525,15 +618,51 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
 
         An objects verbosity can be modified via the site_config module. """
         alert_handler = objects["/Alert_Handler"]
-        message = "{}: {}".format(display_name or self.reference, message)
-        if level in alert_handler._print_level or level is 0 or "debug" in alert_handler._print_level:
-            sys.stdout.write(message + "\n")
-            sys.stdout.flush()
-        if level in alert_handler._log_level or level is 0 or "debug" in alert_handler._log_level:
-            alert_handler.append_to_log(message, level)
+        print_level, log_level = alert_handler._print_level, alert_handler._log_level
+        print_enabled = level in print_level or level is 0 or "debug" in print_level
+        log_enabled = level in log_level or level is 0 or "debug" in log_level
+        if print_enabled or log_enabled:
+            message = "{}: {}".format(display_name or self.reference, message)
+            if print_enabled:
+                sys.stdout.write(message + "\n")
+                sys.stdout.flush()
+            if log_enabled:
+                alert_handler.append_to_log(message, level)
+
+    def lazy_alert(self, verbosity_key, message, *args, **kwargs):
+        """ usage: base.lazy_alert(verbosity_key, message, *args, **kwargs)
+
+            Alerts message.format(*args, **kwargs) at the level given by
+            self.verbosity[verbosity_key]. Whether that level is printed or
+            logged is decided once per class and cached by the Alert_Handler,
+            and the message is only formatted if it will be displayed or
+            logged. Preferable to alert in frequently executed code. """
+        alert_handler = objects["/Alert_Handler"]
+        try:
+            print_enabled, log_enabled = alert_handler._gates[self.__class__][verbosity_key]
+        except KeyError:
+            gates = alert_handler.get_gates(self.__class__, self.verbosity)
+            print_enabled, log_enabled = gates[verbosity_key]
+        if print_enabled or log_enabled:
+            if args or kwargs:
+                message = message.format(*args, **kwargs)
+            message = "{}: {}".format(self.reference, message)
+            if print_enabled:
+                sys.stdout.write(message + "\n")
+                sys.stdout.flush()
+            if log_enabled:
+                alert_handler.append_to_log(message, self.verbosity[verbosity_key])
 
     def __getstate__(self):
-        return self.__dict__.copy()
+        state = self.__dict__.copy()
+        if self.compact:
+            for _class in type(self).__mro__:
+                for attribute in _class.__dict__.get("__slots__", ()):
+                    try:
+                        state[attribute] = getattr(self, attribute)
+                    except AttributeError:
+                        pass
+        return state
 
     def __setstate__(self, state):
         self.on_load(state)
@@ -543,59 +672,62 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
         return self.reference
 
     def save(self, _file=None):
-        """ usage: base_object.save(_file=None)
-
-            Saves the state of the calling objects __dict__. If _file is not
-            specified, a serialized stream is returned. If _file is specified,
-            the stream is written to the supplied file like object and then
-            returned.
-
-            This method and load are being reimplemented"""
-        raise NotImplementedError()
-        self.alert("Saving", level=self.verbosity["save"])
-        attributes = self.__getstate__()
-        self_objects = attributes.pop("objects", {})
-        saved_objects = attributes["objects"] = {}
-        found_objects = []
-        for component_type, values in self_objects.items():
-            saved_objects[component_type] = new_values = []
-            for value in sorted(values, key=operator.attrgetter("reference")):
-                if hasattr(value, "save"):
-                    found_objects.append(value)
-                    if not getattr(value, "dont_save", False):
-                        new_values.append(value.save())
-
-        attribute_type = attributes["_attribute_type"] = {}
-        for key, value in attributes.items():
-            if value in found_objects:
-                attributes[key] = value.reference
-                attribute_type[key] = "reference"
-            elif hasattr(value, "save") and not getattr(value, "dont_save"):
-                attributes[key] = value.save()
-                attribute_type[key] = "saved"
-
-        #required_modules = pride.functions.module_utilities.get_all_modules_for_class(type(self))
-        #version_control = objects["/Program/Version_Control"]
-        #user = objects["/User"]
-        #hash_function = user.generate_tag
-        #repo_id = hash_function(user.username)
-        #_required_modules = []
-        #for module_name, source, module_object in required_modules:
-            #module_id = hash_function(source)
-            #version_control.save_module(module_name, source, module_id, repo_id)
-            #_required_modules.append(module_name)
-
-        #attributes["_required_modules"] = _required_modules + [self.__class__.__name__]
-        attributes["_type_info"] = (self.__module__, self.__class__.__name__)
-        #try:
-        #    saved_data = pride.objects["/User"].save_data(attributes)
-        #except TypeError:
-        #    self.alert("Unable to save attributes '{}'".format(pprint.pformat(attributes)), level=0)
-        #    raise
-        saved_data = utilities.save_data(attributes)
+        """ usage: base_object.save(_file=None) => checkpoint
+
+            Saves the state of the component and of its children, as
+            returned by __getstate__, to a binary checkpoint. Components
+            found in the saved state are stored by reference, so the object
+            graph is restored intact by load. Children with dont_save set
+            are not saved. If _file is specified, the checkpoint is written
+            to the supplied file like object and then returned.
+
+            The default alert level for save is 'vv' """
+        self.lazy_alert("save", "Saving")
+        components, dropped = _checkpoint_components(self)
+        component_types = []
+        states = []
+        class_defaults = {}
+        for component in components:
+            component_type = type(component)
+            component_types.append((component.reference, component_type.__module__,
+                                    component_type.__name__))
+            state = component.__getstate__()
+            # values that are still the class defaults are restored by on_load
+            try:
+                defaults = class_defaults[component_type]
+            except KeyError:
+                defaults = class_defaults[component_type] = dict(component_type.predefaults,
+                                                                 **component_type.defaults)
+            for key, value in list(state.items()):
+                if key in defaults and defaults[key] is value:
+                    del state[key]
+            if dropped and state.get("objects"):
+                saved_objects = state["objects"] = {}
+                for name, children in component.objects.items():
+                    children = [child for child in children if child.reference not in dropped]
+                    if children:
+                        saved_objects[name] = Ordered_Set(children)
+            states.append(state)
+
+        stream = io.BytesIO()
+        pickler = pickle.Pickler(stream, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = _persistent_id
+        pickler.dump((component_types, dropped))
+        try:
+            pickler.dump(states)
+        except (pickle.PicklingError, TypeError) as error:
+            for component, state in zip(components, states):
+                _pickler = pickle.Pickler(io.BytesIO(), pickle.HIGHEST_PROTOCOL)
+                _pickler.persistent_id = _persistent_id
+                try:
+                    _pickler.dump(state)
+                except (pickle.PicklingError, TypeError) as error:
+                    raise pickle.PicklingError("Unable to save {}: {}".format(component.reference, error))
+            raise
+        checkpoint = stream.getvalue()
         if _file:
-            _file.write(saved_data)
-        return saved_data
+            _file.write(checkpoint)
+        return checkpoint
 
     load = staticmethod(load)
 
@@ -608,15 +740,23 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
             times this will implement similar functionality as the objects
             __init__ method does (i.e. opening a file or database).
 
-            NOTE: Currently being reimplemented"""
-        raise NotImplementedError()
-        [setattr(self, key, value) for key, value in attributes.items()]
+            attributes is the state returned by __getstate__ when the object
+            was saved; extensions should call super first. Attributes that
+            are missing from attributes are set to their default values. """
+        _class = type(self)
+        if self.compact:
+            for key, value in itertools.chain(_class.predefaults.items(), _class.defaults.items(),
+                                              attributes.items()):
+                setattr(self, key, value)
+        else:
+            self_dict = self.__dict__
+            self_dict.update(_class.predefaults)
+            self_dict.update(_class.defaults)
+            self_dict.update(attributes)
 
         if self.replace_reference_on_load:
-            #print "Replacing instance", self
-            pride.objects[self.reference] = self
-            #print "Done"
-        self.alert("Loaded", level='v')
+            objects[self.reference] = self
+        self.lazy_alert("load", "Loaded")
 
     def update(self, update_children=False, _already_updated=None):
         """usage: base_instance.update() => updated_base
@@ -668,7 +808,7 @@ class Base(with_metaclass(pride.components.metaclass.Metaclass, object)):
 
         pride.objects[self.reference] = new_self
         if update_children:
-            for child in self.children:
+            for child in list(self.children):
                 if child.reference not in _already_updated:
                     _already_updated.append(child.reference)
                     child.update(True, _already_updated)
@@ -727,6 +867,15 @@ class Proxy(Base):
        assigned, the action is performed on the proxy instead. This
        prioritization is the opposite of the Wrapper class.
 
+       The callable attributes of the wrapped object, such as its methods,
+       are bound to the proxy when wraps is called, so calling them costs
+       the same as calling them on the wrapped object. Assigning an
+       attribute through the proxy updates its binding; callables assigned
+       to the wrapped object directly are bound when wraps is called again.
+       Other attributes are read from the wrapped object when the proxy
+       does not have them. Attributes defined on the class of the proxy,
+       such as properties, take precedence over them.
+
        This class also supports a wrapped_object_name attribute. See
        Base.Wrapper for more information."""
 
@@ -734,13 +883,12 @@ class Proxy(Base):
     auto_verbosity_ignore = ("wraps", )
 
     def __init__(self, **kwargs):
-        wraps = super(Proxy, self).__getattribute__("wraps")
         try:
             wrapped_object = kwargs.pop("wrapped_object")
         except KeyError:
             pass
         else:
-            wraps(wrapped_object)
+            self.wraps(wrapped_object)
         super(Proxy, self).__init__(**kwargs)
 
     def wraps(self, _object):
@@ -748,18 +896,37 @@ class Proxy(Base):
 
             Makes the supplied object the object that is wrapped
             by the Proxy. """
-        set_attr = super(Proxy, self).__setattr__
-        set_attr("wrapped_object", _object)
+        attributes = self.__dict__
+        for attribute in attributes.pop("_forwarded", ()):
+            attributes.pop(attribute, None)
+        get_wrapped = super(type(_object), _object).__getattribute__
+        object_type = type(_object)
+        forwarded = set()
+        for attribute in dir(_object):
+            # properties are not evaluated; they are read from the object
+            if attribute[:2] == "__" or hasattr(getattr(object_type, attribute, None), "__set__"):
+                continue
+            try:
+                value = get_wrapped(attribute)
+            except AttributeError:
+                continue
+            if callable(value):
+                attributes[attribute] = value
+                forwarded.add(attribute)
+            else: # the wrapped object takes precedence over the proxy
+                attributes.pop(attribute, None)
+        attributes["_forwarded"] = forwarded
+        attributes["_get_wrapped"] = get_wrapped
+        attributes["wrapped_object"] = _object
         if self.wrapped_object_name:
-            set_attr(self.wrapped_object_name, _object)
+            attributes[self.wrapped_object_name] = _object
 
-    def __getattribute__(self, attribute):
+    def __getattr__(self, attribute):
         try:
-            wrapped_object = super(Proxy, self).__getattribute__("wrapped_object")
-            value = super(type(wrapped_object), wrapped_object).__getattribute__(attribute)
-        except AttributeError:
-            value = super(Proxy, self).__getattribute__(attribute)
-        return value
+            get_wrapped = super(Proxy, self).__getattribute__("_get_wrapped")
+        except AttributeError: # wraps has not been called yet
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, attribute))
+        return get_wrapped(attribute)
 
     def __setattr__(self, attribute, value):
         super_object = super(Proxy, self)
@@ -768,13 +935,24 @@ class Proxy(Base):
             super(type(wrapped_object), wrapped_object).__setattr__(attribute, value)
         except AttributeError:
             super_object.__setattr__(attribute, value)
+        else:
+            attributes = super_object.__getattribute__("__dict__")
+            forwarded = attributes["_forwarded"]
+            attributes.pop(attribute, None)
+            forwarded.discard(attribute)
+            if callable(value):
+                attributes[attribute] = attributes["_get_wrapped"](attribute)
+                forwarded.add(attribute)
 
 
 class Adapter(Base):
     """ Modifies the interface of the wrapped object. Effectively supplies
         the keys in the adaptations dictionary as attributes. The value
         associated with that key in the dictionary is the corresponding
-        attribute on the wrapped object that has the appropriate value. """
+        attribute on the wrapped object that has the appropriate value.
+
+        Adapted attributes that are callable are bound to the adapter when
+        wraps is called, and rebound when they are assigned through it. """
     adaptations = {}
 
     wrapped_object_name = ''
@@ -788,24 +966,31 @@ class Adapter(Base):
         super(Adapter, self).__init__(**kwargs)
 
     def wraps(self, _object):
+        attributes = self.__dict__
+        for attribute, _attribute in self.adaptations.items():
+            attributes.pop(attribute, None)
+            value = getattr(_object, _attribute, None)
+            if callable(value):
+                attributes[attribute] = value
         self.wrapped_object = _object
         if self.wrapped_object_name:
             setattr(self, self.wrapped_object_name, _object)
 
-    def __getattribute__(self, attribute):
-        get_attribute = super(Adapter, self).__getattribute__
-        _attribute = get_attribute("adaptations").get(attribute, None)
-        if _attribute is not None:
-            result = getattr(get_attribute("wrapped_object"), _attribute)
-        else:
-            result = get_attribute(attribute)
-        return result
+    def __getattr__(self, attribute):
+        _attribute = type(self).adaptations.get(attribute, None)
+        if _attribute is None:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, attribute))
+        return getattr(self.wrapped_object, _attribute)
 
     def __setattr__(self, attribute, value):
-        get_attribute = super(Adapter, self).__getattribute__
-        _attribute = get_attribute("adaptations").get(attribute, None)
+        _attribute = self.adaptations.get(attribute, None)
         if _attribute is not None:
-            setattr(self.wrapped_object, _attribute, value)
+            wrapped_object = self.wrapped_object
+            setattr(wrapped_object, _attribute, value)
+            attributes = self.__dict__
+            attributes.pop(attribute, None)
+            if callable(value):
+                attributes[attribute] = getattr(wrapped_object, _attribute)
         else:
             super(Adapter, self).__setattr__(attribute, value)
 
@@ -843,3 +1028,378 @@ class Static_Wrapper(Base):
         self.wrapped_object = _object
         if self.wrapped_object_name:
             setattr(self, self.wrapped_object_name, _object)
+
+
+def _test_program():
+    # sockets are added to the Network, and Rpc_Socket uses the Rpc_Workers
+    if "/Program" in objects:
+        return objects["/Program"]
+    import pride.components.base
+    class Program(pride.components.base.Base): pass
+    program = Program()
+    program.create("pride.components.network.Network")
+    program.create("pride.components.rpc.Rpc_Worker")
+    return program
+
+def _resolve_test_type(component_type):
+    if component_type.startswith("pride.gui"):
+        try:
+            import sdl2
+        except ImportError: # importing pride.gui without sdl2 prompts to install it
+            print("{}: skipped; sdl2 is not installed".format(component_type))
+            return None
+    return utilities.resolve_string(component_type)
+
+def test_initializer_throughput(component_types=("pride.components.base.Base",
+                                                 "pride.gui.gui.Button",
+                                                 "pride.components.rpc.Rpc_Socket"),
+                                count=10000):
+    """ Measures instances/second for the specified component types with
+        the defaults assigned by updating the instance __dict__ and with one
+        setattr call per attribute. Instances are deleted as they are
+        created. Button requires the sdl2 package. """
+    import timeit
+    timestamp = timeit.default_timer
+
+    program = _test_program()
+    for component_type in component_types:
+        _type = _resolve_test_type(component_type)
+        if _type is None:
+            continue
+        assign_directly = _type.__dict__["_assign_directly"]
+        rates = []
+        for _type._assign_directly in (assign_directly, False):
+            elapsed = 0.0
+            for _count in range(count):
+                started_at = timestamp()
+                instance = program.create(_type)
+                elapsed += timestamp() - started_at
+                instance.delete()
+            rates.append(count / elapsed)
+        _type._assign_directly = assign_directly
+        print("{}: {:.0f} instances/second; {:.0f} with setattr ({:.2f}x)".format(component_type, rates[0],
+                                                                                rates[1], rates[0] / rates[1]))
+
+def test_reference_allocation(count=50000):
+    import timeit
+    import pride.components.base
+    Base = pride.components.base.Base
+    parent = Base()
+    children = [parent.create(Base) for _count in range(3)]
+    assert [child.reference for child in children] == [parent.reference + "/Base" + suffix for
+                                                       suffix in ('', '1', '2')]
+    children[1].delete()
+    children[0].delete()
+    assert parent.create(Base).reference == parent.reference + "/Base"
+    assert parent.create(Base).reference == parent.reference + "/Base1"
+    assert parent.create(Base).reference == parent.reference + "/Base3"
+    parent.delete_children()
+    assert parent.create(Base).reference == parent.reference + "/Base"
+    parent.delete_children()
+
+    parent.delete()
+
+    # instances without a parent are not added to one
+    started_at = timeit.default_timer()
+    instances = [Base() for _count in range(count)]
+    elapsed = timeit.default_timer() - started_at
+    assert instances[-1].reference == "/Base{}".format(count - 1)
+    for instance in instances:
+        instance.delete()
+    print("Created {} instances of one class in {:.2f} seconds".format(count, elapsed))
+
+def test_child_bookkeeping(count=50000):
+    import timeit
+    import pride.components.base
+    Base = pride.components.base.Base
+    timestamp = timeit.default_timer
+    parent = Base()
+    started_at = timestamp()
+    children = [parent.create(Base) for _count in range(count)]
+    created_in = timestamp() - started_at
+    assert list(parent.children) == children
+
+    started_at = timestamp()
+    for child in children[::2]:
+        child.delete()
+    removed_in = timestamp() - started_at
+    assert list(parent.children) == children[1::2]
+    assert parent.objects["Base"][0] is children[1]
+
+    started_at = timestamp()
+    parent.delete_children()
+    deleted_in = timestamp() - started_at
+    assert not list(parent.children) and not children[-1].references_to
+    parent.delete()
+    print("{} children: created in {:.2f}s, deleted half in {:.2f}s, deleted the rest in {:.2f}s".format(count, created_in,
+                                                                                                   removed_in, deleted_in))
+
+def _owned_size(_object):
+    # the size of _object and the objects that only it refers to
+    import gc
+    size = sys.getsizeof(_object)
+    for referent in gc.get_referents(_object):
+        if sys.getrefcount(referent) <= 4: # _object, referents, referent, getrefcount
+            size += _owned_size(referent)
+    return size
+
+def test_compact_instances(component_types=("pride.gui.gui.Button",
+                                            "pride.components.network.Tcp_Socket"),
+                           count=1000):
+    """ Reports the memory used per instance of the specified component types
+        and of compact subclasses of them. The wrapped socket of a
+        Tcp_Socket is included. Button requires the sdl2 package. """
+    program = _test_program()
+    for component_type in component_types:
+        _type = _resolve_test_type(component_type)
+        if _type is None:
+            continue
+        compact_type = type(_type.__name__, (_type, ), {"compact" : True,
+                                                        "__slots__" : (_type.wrapped_object_name, ) if
+                                                                      getattr(_type, "wrapped_object_name", '') else ()})
+        sizes = []
+        for instance_type in (_type, compact_type):
+            instances = [program.create(instance_type) for _count in range(count)]
+            sizes.append(sum(_owned_size(instance) for instance in instances) / float(count))
+            for instance in instances:
+                instance.delete()
+        print("{}: {:.0f} bytes per instance; {:.0f} bytes compact".format(component_type, *sizes))
+
+def test_proxy_forwarding(count=200000):
+    import timeit
+    import pride.components.base
+
+    class Wrapped(object):
+
+        value = 1
+
+        def draw_rect(self, area):
+            return area
+
+        def delete(self):
+            return "wrapped delete"
+
+    class Adapter(pride.components.base.Adapter):
+        adaptations = {"draw" : "draw_rect", "amount" : "value"}
+
+    wrapped = Wrapped()
+    proxy = pride.components.base.Proxy(wrapped_object=wrapped)
+    adapter = Adapter(wrapped_object=wrapped)
+    assert proxy.draw_rect == wrapped.draw_rect and proxy.delete() == "wrapped delete"
+    assert adapter.draw(1) == 1 and adapter.amount == 1
+    proxy.value = 2 # assigned on the wrapped object
+    assert wrapped.value == proxy.value == 2
+
+    other = Wrapped()
+    other.draw_rect = lambda area: "other"
+    proxy.wraps(other)
+    adapter.wraps(other)
+    assert proxy.draw_rect(None) == adapter.draw(None) == "other"
+
+    assert not hasattr(proxy, "resize") and not hasattr(proxy, "scale")
+    other.resize = lambda size: size
+    other.scale = 2
+    assert proxy.resize(1) == 1 and proxy.scale == 2
+    proxy.draw_rect = lambda area: "reassigned"
+    adapter.draw = lambda area: "adapted"
+    assert proxy.draw_rect(None) == "reassigned" and adapter.draw(None) == "adapted"
+
+    proxy.wraps(wrapped)
+    adapter.wraps(wrapped)
+    timestamp = timeit.default_timer
+    for name, access in (("direct call", lambda: wrapped.draw_rect(None)),
+                         ("proxy call", lambda: proxy.draw_rect(None)),
+                         ("proxy attribute", lambda: proxy.value),
+                         ("proxy own attribute", lambda: proxy.reference),
+                         ("adapter call", lambda: adapter.draw(None)),
+                         ("adapter own attribute", lambda: adapter.reference)):
+        started_at = timestamp()
+        for _count in range(count):
+            access()
+        print("{}: {:.3f}us".format(name, (timestamp() - started_at) / count * 1000000))
+    proxy.delete()
+    adapter.delete()
+
+def test_class_creation(component_type="pride.components.network.Tcp_Socket", depth=200):
+    """ Measures the time taken to create a chain of depth subclasses of
+        component_type, and checks that inherited subcomponents are not
+        modified by the subclasses that override them. """
+    import timeit
+    from pride.components import Component
+    timestamp = timeit.default_timer
+    new_class = _resolve_test_type(component_type)
+    started_at = timestamp()
+    for count in range(depth):
+        new_class = type(new_class)("Subclass_{}".format(count), (new_class, ),
+                                    {"defaults" : {"option_{}".format(count) : count}})
+    elapsed = timestamp() - started_at
+    assert new_class().option_0 == 0
+
+    class Configured(Base):
+        subcomponents = {"child" : Component("pride.components.base.Base", options={"a" : 1})}
+
+    class Reconfigured(Configured):
+        subcomponents = {"child" : Component(None, options={"b" : 2})}
+
+    assert Configured.subcomponents["child"].kwargs == {"options" : {"a" : 1}}
+    assert Reconfigured.subcomponents["child"].kwargs == {"options" : {"a" : 1, "b" : 2}}
+
+    class Nested_Defaults(Base):
+        defaults = {"options" : {"a" : [1]}, "name" : "nested"}
+
+    class Nested_Subclass(Nested_Defaults): pass
+
+    class Configured_Subclass(Configured): pass
+
+    Nested_Subclass.defaults["options"]["a"].append(2)
+    Nested_Subclass.defaults["options"]["b"] = 3
+    Configured_Subclass.subcomponents["child"].kwargs["options"]["c"] = 4
+    assert Nested_Defaults.defaults["options"] == {"a" : [1]}
+    assert Nested_Subclass.defaults["options"] == {"a" : [1, 2], "b" : 3}
+    assert Configured.subcomponents["child"].kwargs == {"options" : {"a" : 1}}
+    assert Nested_Subclass.defaults["name"] is Nested_Defaults.defaults["name"]
+    print("{}: {} nested subclasses created in {:.3f}s".format(component_type, depth, elapsed))
+
+def test_lazy_components():
+    objects = pride.objects
+    parent = Base()
+    reference = parent.reference + "/Base"
+    objects.add_factory(reference, lambda: parent.create(Base))
+    assert reference not in objects and objects.get(reference) is None
+    sibling = parent.create(Base)
+    assert sibling.reference == reference + "1"
+    child = objects[reference]
+    assert child.reference == reference and child in parent.children
+    assert reference not in objects.factories and objects[reference] is child
+    assert parent.create(Base).reference == reference + "2"
+    objects.add_factory(reference + "3", lambda: None)
+    try:
+        objects[reference + "3"]
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("Factory that does not create its component did not raise KeyError")
+    parent.delete()
+    print("Passed lazy component unit test")
+
+class _Checkpoint_Component(Base):
+
+    defaults = {"value" : 0, "label" : ''}
+
+    mutable_defaults = {"history" : list}
+
+
+def test_checkpoint(count=5000):
+    """ Compares the time taken to create a tree of count components with the
+        time taken to restore it from a checkpoint made by Base.save. The
+        tree includes a sqlite Database, which is reopened by its on_load,
+        and a Tcp_Socket, which is not saved because dont_save is set. """
+    import os
+    import tempfile
+    import timeit
+    import pride.components.base
+    import pride.components.database
+    import pride.components.network
+    # the module, rather than __main__, defines the classes that are saved
+    Base = pride.components.base.Base
+    _Checkpoint_Component = pride.components.base._Checkpoint_Component
+    _checkpoint_components = pride.components.base._checkpoint_components
+    timestamp = timeit.default_timer
+    _test_program()
+    database_name = os.path.join(tempfile.mkdtemp(), "checkpoint.db")
+
+    started_at = timestamp()
+    root = Base()
+    database = root.create(pride.components.database.Database, database_name=database_name)
+    for number in range(count // 5):
+        parent = root.create(_Checkpoint_Component, value=number, label=str(number))
+        for _count in range(4):
+            parent.create(_Checkpoint_Component, value=number).history.append(parent)
+    root.connection = root.create(pride.components.network.Tcp_Socket)
+    created_in = timestamp() - started_at
+
+    references = [component.reference for component in _checkpoint_components(root)[0]]
+    started_at = timestamp()
+    checkpoint = root.save()
+    saved_in = timestamp() - started_at
+    root.delete()
+
+    started_at = timestamp()
+    restored = Base.load(checkpoint)
+    restored_in = timestamp() - started_at
+    assert restored is objects[restored.reference]
+    assert [component.reference for component in _checkpoint_components(restored)[0]] == references
+    assert restored.connection is None and "Tcp_Socket" not in restored.objects
+    first, last = restored.objects["_Checkpoint_Component"][0], restored.objects["_Checkpoint_Component"][-1]
+    assert first.label == '0' and last.value == count // 5 - 1
+    grandchild = list(last.children)[0]
+    assert grandchild.history == [last] and grandchild.parent is last
+    assert objects[grandchild.reference] is grandchild
+    database = objects[database.reference]
+    assert database.cursor.execute("SELECT 1").fetchone()[0] == 1
+    restored.delete()
+    print("{} components: created in {:.3f}s, saved in {:.3f}s ({} bytes), restored in {:.3f}s".format(len(references),
+          created_in, saved_in, len(checkpoint), restored_in))
+
+class _Checkpoint_Program(Base):
+    # the startup components of interpreter.Program that keep runtime state
+    defaults = {"startup_components" : ("pride.components.scheduler.Processor",
+                                        "pride.components.workerpool.Thread_Pool",
+                                        "pride.components.workerpool.Process_Pool",
+                                        "pride.components.shard.Shard_Manager",
+                                        "pride.components.schedulerstats.Scheduler_Stats")}
+
+    def __init__(self, **kwargs):
+        super(_Checkpoint_Program, self).__init__(**kwargs)
+        for component_type in self.startup_components:
+            component = self.create(component_type)
+            setattr(self, component.__class__.__name__.lower(), component.reference)
+
+
+def test_checkpoint_program():
+    """ Saves and loads a program with the startup components of
+        interpreter.Program that hold threads, processes and statistics,
+        then uses the restored Thread_Pool. """
+    import pride.components.base
+    Base = pride.components.base.Base
+    _test_program()
+    program = pride.components.base._Checkpoint_Program()
+    thread_pool = objects[program.thread_pool]
+    results = []
+    def callback(result):
+        results.append(result)
+        raise SystemExit()
+    def run_processor():
+        processor = objects[program.processor]
+        processor.running = True
+        try:
+            processor.run()
+        except SystemExit:
+            pass
+    thread_pool.call(program.reference, "__getattribute__", "reference").add_callback(callback)
+    run_processor()
+    assert thread_pool.completed_count == 1 and thread_pool.wait_time.size == 1
+
+    checkpoint = program.save()
+    program.delete()
+    program = Base.load(checkpoint)
+    thread_pool = objects[program.thread_pool]
+    assert thread_pool.completed_count == 1 and thread_pool.wait_time.size == 1
+    assert objects[program.process_pool]._pool is None
+    thread_pool.call(program.reference, "__getattribute__", "reference").add_callback(callback)
+    run_processor()
+    assert results == [program.reference] * 2, results
+    assert thread_pool.completed_count == 2 and thread_pool.wait_time.size == 2
+    program.delete()
+    print("Passed Program checkpoint unit test")
+
+if __name__ == "__main__":
+    test_checkpoint()
+    test_checkpoint_program()
+    test_lazy_components()
+    test_class_creation()
+    test_proxy_forwarding()
+    test_compact_instances()
+    test_reference_allocation()
+    test_child_bookkeeping()
+    test_initializer_throughput()
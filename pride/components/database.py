@@ -309,6 +309,9 @@ class Database(pride.base.Wrapper):
         connection, self.cursor = self.open_database(self.database_name,
                                                      self.text_factory)
         self.wraps(connection)
+        finalizer = pride.objects["/Finalizer"]
+        finalizer.remove_callback((self.reference, "delete"), 0)
+        finalizer.add_callback((self.reference, "delete"), 0)
 
     def delete(self):
         self.close()
@@ -317,9 +320,13 @@ class Database(pride.base.Wrapper):
 
 
 def test_db():
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp()
+
     class Test_Database(Database):
 
-        defaults = {"database_name" : "test_database.db"}
+        defaults = {"database_name" : os.path.join(directory, "test_database.db")}
         schema = {"Test" : ("test_name TEXT PRIMARY_KEY UNIQUE", "test_data BLOB")}
         primary_key = {"Test" : "test_name"}
 
@@ -332,6 +339,8 @@ def test_db():
     test.insert_into("Test", ("no_duplicates", "0"))
     test.insert_or_replace("Test", ("no_duplicates", '1'))
     test.query("Test", retrieve_fields=("test_name", "test_data"), where={"test_name" : "no_duplicates"})
+    test.delete()
+    shutil.rmtree(directory)
 
 if __name__ == "__main__":
     test_db()
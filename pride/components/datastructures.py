@@ -5,6 +5,8 @@
     Objects defined here should not rely on pride for anything - regular python only. """    
 import collections
 import heapq
+import itertools
+import operator
 import timeit
 
 timestamp = timeit.default_timer 
@@ -113,6 +115,16 @@ class Average(object):
         if self._meta_average:
             self._meta_average.add(self.average)
 
+    def __getstate__(self):
+        # add is a bound method, which can not be pickled
+        state = self.__dict__.copy()
+        del state["add"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.add = self._full_add if self.size == self.max_size else self._partial_add
+
                    
 class LRU_Cache(object):
     """A dictionary with a max size that keeps track of
@@ -288,4 +300,490 @@ class Index_Preserving_List(object):
         
         l.remove(0)
         l.append("testing!")
-        assert l.list == ["testing!", 1, 2, 27, 4]
\ No newline at end of file
+        assert l.list == ["testing!", 1, 2, 27, 4]
+
+class Timing_Wheel(object):
+    """ usage: Timing_Wheel(resolution=.001, slot_count=256,
+                            level_count=3, now=None) => timing_wheel
+
+        A hierarchical timing wheel that orders entries by deadline.
+        Entries are sequences whose first item is the time at which the
+        entry is due, such as the entries of pride.Instruction.instructions.
+
+        Time is divided into ticks of resolution seconds. Level 0 holds
+        slot_count slots of one tick each, level 1 holds slot_count slots of
+        slot_count ticks each, and so on. push places an entry into the slot
+        for its deadline in O(1); as time advances, the slots of the outer
+        levels are cascaded into the inner levels. Deadlines beyond the
+        outermost level are stored in an overflow heap until the wheel
+        approaches them.
+
+        pop returns the entry with the earliest tick. Entries that fall
+        within the same tick are returned in the order they were pushed.
+        Raises IndexError when the wheel is empty, like heapq.heappop.
+        peek returns the same entry without removing it. """
+
+    def __init__(self, resolution=.001, slot_count=256, level_count=3, now=None):
+        super(Timing_Wheel, self).__init__()
+        self.resolution = resolution
+        self.slot_count = slot_count
+        self.level_count = level_count
+        # spans[level] is the number of ticks covered by one slot of level
+        self.spans = [slot_count ** level for level in range(level_count + 1)]
+        self.levels = [[collections.deque() for slot in range(slot_count)]
+                       for level in range(level_count)]
+        self.level_sizes = [0] * level_count
+        # bit n of occupied[level] is set when slot n of level is not empty
+        self.occupied = [0] * level_count
+        self.overflow = []
+        self._overflow_counter = itertools.count()
+        self.current_tick = int((timestamp() if now is None else now) / resolution)
+        self.size = 0
+
+    def push(self, entry):
+        """ usage: timing_wheel.push(entry)
+
+            Schedules entry according to the deadline stored in entry[0]. """
+        self.size += 1
+        self._place(entry, int(entry[0] / self.resolution))
+
+    def _place(self, entry, tick):
+        delta = tick - self.current_tick
+        slot_count = self.slot_count
+        if delta < slot_count:
+            if delta < 0: # overdue entries are due now
+                tick = self.current_tick
+            index = tick % slot_count
+            self.levels[0][index].append(entry)
+            self.level_sizes[0] += 1
+            self.occupied[0] |= 1 << index
+        else:
+            spans = self.spans
+            for level in range(1, self.level_count):
+                if delta < spans[level + 1]:
+                    index = (tick // spans[level]) % slot_count
+                    self.levels[level][index].append(entry)
+                    self.level_sizes[level] += 1
+                    self.occupied[level] |= 1 << index
+                    break
+            else:
+                heapq.heappush(self.overflow, (tick, next(self._overflow_counter), entry))
+
+    def peek(self):
+        """ usage: timing_wheel.peek() => entry
+
+            Returns the entry that pop would return without removing it.
+            Unlike pop, the wheel does not advance, so entries pushed
+            afterwards are still ordered correctly. """
+        if not self.size:
+            raise IndexError("peek from empty Timing_Wheel")
+        current_tick = self.current_tick
+        slot_count = self.slot_count
+        resolution = self.resolution
+        best_tick = best_entry = None
+        # where ticks are equal, pop prefers inner levels over outer levels
+        for level in range(self.level_count):
+            if not self.level_sizes[level]:
+                continue
+            span = self.spans[level]
+            slot_number = current_tick // span
+            index = slot_number % slot_count
+            occupied = self.occupied[level]
+            if not level and occupied & (1 << index):
+                return self.levels[0][index][0]
+            later_slots = occupied >> (index + 1)
+            if later_slots:
+                offset = (later_slots & -later_slots).bit_length()
+            else: # the next occupied slot is in the next revolution
+                offset = (occupied & -occupied).bit_length() + slot_count - index - 1
+            slot_number += offset
+            if best_tick is not None and slot_number * span >= best_tick:
+                continue
+            slot = self.levels[level][slot_number % slot_count]
+            if level:
+                tick, entry = min(((int(entry[0] / resolution), entry) for entry in slot),
+                                  key=operator.itemgetter(0))
+            else:
+                tick, entry = slot_number, slot[0]
+            if best_tick is None or tick < best_tick:
+                best_tick, best_entry = tick, entry
+        if self.overflow and (best_tick is None or self.overflow[0][0] < best_tick):
+            return self.overflow[0][2]
+        return best_entry
+
+    def pop(self):
+        """ usage: timing_wheel.pop() => entry
+
+            Removes and returns the entry with the earliest deadline. The
+            wheel advances to the tick of the entry, even if that tick is
+            in the future; callers that may push earlier entries afterwards
+            should peek and wait until the entry is due before popping. """
+        first_level = self.levels[0]
+        slot_count = self.slot_count
+        while True:
+            index = self.current_tick % slot_count
+            slot = first_level[index]
+            if slot:
+                self.size -= 1
+                self.level_sizes[0] -= 1
+                entry = slot.popleft()
+                if not slot:
+                    self.occupied[0] &= ~(1 << index)
+                return entry
+            if not self.size:
+                raise IndexError("pop from empty Timing_Wheel")
+            self._advance()
+
+    def _advance(self):
+        # move current_tick to the next slot that holds entries, without
+        # crossing a boundary where an outer level would need to cascade
+        level_sizes = self.level_sizes
+        spans = self.spans
+        for level in range(self.level_count):
+            if level_sizes[level]:
+                span = spans[level]
+                slot_number = self.current_tick // span
+                later_slots = self.occupied[level] >> ((slot_number % self.slot_count) + 1)
+                if later_slots:
+                    self.current_tick = (slot_number + (later_slots & -later_slots).bit_length()) * span
+                else:
+                    span = spans[level + 1]
+                    self.current_tick = ((self.current_tick // span) + 1) * span
+                break
+        else:
+            # only the overflow heap holds entries
+            self.current_tick = max(self.current_tick, self.overflow[0][0])
+            self._drain_overflow()
+            return
+        self._cascade()
+
+    def _cascade(self):
+        current_tick = self.current_tick
+        spans = self.spans
+        slot_count = self.slot_count
+        top_level = self.level_count - 1
+        if not current_tick % spans[top_level]:
+            self._drain_overflow()
+        for level in range(top_level, 0, -1):
+            span = spans[level]
+            if not current_tick % span:
+                index = (current_tick // span) % slot_count
+                slot = self.levels[level][index]
+                if slot:
+                    self.level_sizes[level] -= len(slot)
+                    self.occupied[level] &= ~(1 << index)
+                    entries = list(slot)
+                    slot.clear()
+                    for entry in entries:
+                        self._place(entry, int(entry[0] / self.resolution))
+
+    def _drain_overflow(self):
+        overflow = self.overflow
+        limit = self.current_tick + self.spans[self.level_count]
+        while overflow and overflow[0][0] < limit:
+            tick, _, entry = heapq.heappop(overflow)
+            self._place(entry, tick)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for level in self.levels:
+            for slot in level:
+                for entry in slot:
+                    yield entry
+        for tick, _, entry in self.overflow:
+            yield entry
+
+
+class Histogram(object):
+    """ usage: Histogram(bucket_count=32, smallest=.000001) => histogram
+
+        Counts values in exponentially sized buckets: bucket 0 counts values
+        below smallest, and bucket n counts values below smallest * 2 ** n.
+        The last bucket counts everything larger. Memory use is fixed by
+        bucket_count regardless of how many values are added.
+
+        The count, total and maximum of the added values are kept exactly;
+        percentiles are estimated from the bucket boundaries. """
+
+    def _get_average(self):
+        return self.total / self.count if self.count else 0.0
+    average = property(_get_average)
+
+    def __init__(self, bucket_count=32, smallest=.000001):
+        super(Histogram, self).__init__()
+        self.smallest = smallest
+        self.buckets = [0] * bucket_count
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+        if value < self.smallest:
+            self.buckets[0] += 1
+        else:
+            buckets = self.buckets
+            index = int(value / self.smallest).bit_length()
+            buckets[index if index < len(buckets) else -1] += 1
+
+    def percentile(self, fraction):
+        """ usage: histogram.percentile(.99) => upper_bound
+
+            Returns the upper bound of the bucket that contains the value at
+            the specified fraction of the added values. """
+        target = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target and seen:
+                return min(self.smallest * 2 ** index, self.maximum)
+        return self.maximum
+
+    def clear(self):
+        self.buckets = [0] * len(self.buckets)
+        self.count = 0
+        self.total = self.maximum = 0.0
+
+
+class Ordered_Set(object):
+    """ usage: Ordered_Set(iterable=()) => ordered_set
+
+        A set that iterates in insertion order and supports enough of the
+        list interface to stand in for one: append, remove, len, indexing
+        and slicing. append, remove, add, discard and membership tests are
+        O(1). Removed items leave a hole that is skipped when iterating;
+        the holes are compacted away when they outnumber the items, or
+        before indexing.
+
+        Iteration is over the set itself, not a copy; iterate over
+        list(ordered_set) to modify the set while iterating. """
+
+    __slots__ = ("_items", "_positions", "_hole_count")
+
+    _hole = object()
+
+    def __init__(self, iterable=()):
+        super(Ordered_Set, self).__init__()
+        self._items = []
+        self._positions = {}
+        self._hole_count = 0
+        for item in iterable:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def append(self, item):
+        """ usage: ordered_set.append(item)
+
+            Adds item to the end. Raises ValueError if item is already present. """
+        if item in self._positions:
+            raise ValueError("{} is already in the Ordered_Set".format(item))
+        self._positions[item] = len(self._items)
+        self._items.append(item)
+
+    def remove(self, item):
+        """ usage: ordered_set.remove(item)
+
+            Raises ValueError if item is not present, as list.remove does. """
+        try:
+            position = self._positions.pop(item)
+        except KeyError:
+            raise ValueError("{} is not in the Ordered_Set".format(item))
+        items = self._items
+        if position == len(items) - 1:
+            items.pop()
+        else:
+            items[position] = self._hole
+            self._hole_count += 1
+            if self._hole_count > len(self._positions):
+                self._compact()
+
+    def discard(self, item):
+        try:
+            self.remove(item)
+        except ValueError:
+            pass
+
+    def clear(self):
+        del self._items[:]
+        self._positions.clear()
+        self._hole_count = 0
+
+    def _compact(self):
+        hole = self._hole
+        items = self._items = [item for item in self._items if item is not hole]
+        positions = self._positions
+        for position, item in enumerate(items):
+            positions[item] = position
+        self._hole_count = 0
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __iter__(self):
+        hole = self._hole
+        for item in self._items:
+            if item is not hole:
+                yield item
+
+    def __getitem__(self, index):
+        if self._hole_count:
+            self._compact()
+        return self._items[index]
+
+    def __getslice__(self, start, stop): # python 2 slices old style classes and lists this way
+        return self[max(start, 0):max(stop, 0):]
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __getstate__(self):
+        # the hole marker would not be the same object after unpickling
+        if self._hole_count:
+            self._compact()
+        return (self._items, self._positions)
+
+    def __setstate__(self, state):
+        self._items, self._positions = state
+        self._hole_count = 0
+
+    def __repr__(self):
+        return "Ordered_Set({})".format(list(self))
+
+
+class Buffer_Pool(object):
+    """ usage: Buffer_Pool(smallest=4096, largest=2 ** 24,
+                           max_pooled_size=2 ** 24) => buffer_pool
+
+        Hands out reusable bytearrays in power of two size classes. acquire
+        returns a buffer of at least the requested size, taken from the
+        buffers of its size class that were released, if there are any.
+        release returns a buffer to the pool.
+
+        At most max_pooled_size bytes of released buffers are kept; buffers
+        released beyond that, and buffers larger than largest, are left to
+        the garbage collector. A buffer must not be used after it has been
+        released, including through memoryviews of it, because the next
+        caller of acquire may receive it. """
+
+    def __init__(self, smallest=4096, largest=2 ** 24, max_pooled_size=2 ** 24):
+        super(Buffer_Pool, self).__init__()
+        self.smallest = smallest
+        self.largest = largest
+        self.max_pooled_size = max_pooled_size
+        self.pooled_size = 0
+        self.allocation_count = 0
+        self.free_buffers = {}
+
+    def acquire(self, size):
+        if size <= self.smallest:
+            size = self.smallest
+        elif size & (size - 1): # not a power of two
+            size = 1 << size.bit_length()
+        try:
+            _buffer = self.free_buffers[size].pop()
+        except (KeyError, IndexError):
+            self.allocation_count += 1
+            return bytearray(size)
+        self.pooled_size -= size
+        return _buffer
+
+    def release(self, _buffer):
+        size = len(_buffer)
+        if (self.smallest <= size <= self.largest and not size & (size - 1) and
+            self.pooled_size + size <= self.max_pooled_size):
+            try:
+                self.free_buffers[size].append(_buffer)
+            except KeyError:
+                self.free_buffers[size] = [_buffer]
+            self.pooled_size += size
+
+    def clear(self):
+        self.free_buffers.clear()
+        self.pooled_size = 0
+
+
+def test_Buffer_Pool():
+    pool = Buffer_Pool(smallest=16, largest=1024, max_pooled_size=2048)
+    small, medium = pool.acquire(1), pool.acquire(100)
+    assert len(small) == 16 and len(medium) == 128 and pool.allocation_count == 2
+    pool.release(medium)
+    assert pool.acquire(65) is medium and pool.pooled_size == 0
+    buffers = [pool.acquire(1024) for count in range(3)]
+    for _buffer in buffers:
+        pool.release(_buffer)
+    assert pool.pooled_size == 2048 and pool.acquire(1000) in buffers[:2]
+    pool.release(pool.acquire(4096))
+    pool.release(bytearray(100)) # not a size class
+    assert pool.pooled_size == 1024
+    pool.clear()
+    assert not pool.pooled_size and pool.acquire(16) is not small
+    print("Passed Buffer_Pool unit test")
+
+def test_Timing_Wheel_peek(count=5000):
+    import random
+    wheel = Timing_Wheel(resolution=1.0, slot_count=8, level_count=2, now=0.0)
+    now = 0.0
+    for number in range(count):
+        if random.random() < .5 or not wheel:
+            wheel.push([now + random.choice((0, random.uniform(0, 4), random.uniform(0, 200))), number])
+        else:
+            entry = wheel.peek()
+            assert wheel.pop() is entry
+            now = max(now, entry[0])
+            assert wheel.current_tick <= int(now)
+    while wheel:
+        entry = wheel.peek()
+        assert wheel.pop() is entry
+    try:
+        wheel.peek()
+    except IndexError:
+        pass
+    else:
+        raise AssertionError("Peeked into an empty Timing_Wheel")
+    print("Passed Timing_Wheel peek unit test")
+
+def test_Ordered_Set():
+    ordered_set = Ordered_Set(range(10))
+    ordered_set.remove(0)
+    ordered_set.remove(9)
+    ordered_set.remove(4)
+    ordered_set.append(10)
+    assert list(ordered_set) == [1, 2, 3, 5, 6, 7, 8, 10]
+    assert ordered_set[0] == 1 and ordered_set[-1] == 10 and ordered_set[:] == list(ordered_set)
+    assert 4 not in ordered_set and 5 in ordered_set and len(ordered_set) == 8
+    import pickle
+    assert list(pickle.loads(pickle.dumps(ordered_set))) == list(ordered_set)
+    iterator = iter(ordered_set)
+    assert next(iterator) == 1
+    ordered_set.remove(2)
+    assert next(iterator) == 3
+    for item in list(ordered_set):
+        ordered_set.remove(item)
+    assert not ordered_set and list(ordered_set) == []
+    try:
+        ordered_set.remove(1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Removed an item that was not present")
+    print("Passed Ordered_Set unit test")
+
+if __name__ == "__main__":
+    test_Buffer_Pool()
+    test_Timing_Wheel_peek()
+    test_Ordered_Set()
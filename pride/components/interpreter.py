@@ -5,6 +5,7 @@ import os
 import traceback
 import time
 import contextlib
+from functools import partial
 try:
     import cStringIO as StringIO
 except ImportError:
@@ -21,6 +22,8 @@ import pride.functions.contextmanagers
 import pride.site_config
 import pride.functions.utilities
 
+timestamp = pride.timestamp
+
 @contextlib.contextmanager
 def main_as_name():
     backup = globals()["__name__"]
@@ -175,14 +178,41 @@ class Interpreter(pride.components.rpc2.Authenticated_Service):
         log = attributes["_logger"]
         log.seek(0)
         attributes["_logger"] = log.read()
+        # the namespaces hold live objects; users log in again after loading
+        attributes["user_namespaces"] = {}
+        attributes["user_session"] = {}
         return attributes
 
+    def on_load(self, attributes):
+        super(Interpreter, self).on_load(attributes)
+        _logger = pride.functions.utilities.invoke(self._logger_type)
+        _logger.write(self._logger)
+        self._logger = _logger
+
 
 class Program(base.Base):
     """ The "main" class. Provides an entry point to the environment.
         Instantiating this component and calling the start_machine method
         starts the execution of the Processor component.
 
+        The startup components in lazy_startup_components are created the
+        first time their reference is looked up in pride.objects, e.g. when
+        an Instruction targets them. A Shard_Manager whose shard_count is
+        greater than 1 is created at startup regardless, because shards
+        must be forked before sockets are opened. When lazy_startup is True,
+        every startup component that is not in eager_startup_components is
+        created lazily.
+        The --profile_startup flag alerts the initialization time of each
+        startup component; see startup_report.
+
+        When checkpoint_on_restart is True, main.main saves the Program
+        with Base.save when a restart is requested, and restores it from
+        the checkpoint instead of creating a new Program. Program.load logs
+        in the /User again and reruns the command once the children of the
+        Program have been restored. The components restored
+        with the Program, such as its Session and Persistent_Storage,
+        register their /Finalizer callbacks again in their own on_load.
+
         Warning: Using the following flag:
 
             --log_level debug
@@ -193,19 +223,36 @@ class Program(base.Base):
                 "startup_components" : ("pride.components.storage.Persistent_Storage",
                                         "pride.components.vcs.Version_Control",
                                         "pride.components.scheduler.Processor",
+                                        "pride.components.workerpool.Thread_Pool",
+                                        "pride.components.workerpool.Process_Pool",
                                         "pride.components.fileio.File_System",
                                         "pride.components.network.Network_Connection_Manager",
                                         "pride.components.network.Network",
+                                        "pride.components.shard.Shard_Manager",
                                         "pride.components.interpreter.Interpreter",
                                         "pride.components.rpc.Rpc_Connection_Manager",
                                         "pride.components.rpc.Rpc_Worker",
+                                        "pride.components.schedulerstats.Scheduler_Stats",
                                         "pride.components.datatransfer.Data_Transfer_Service",
                                         "pride.components.datatransfer.Background_Refresh",
                                         "pride.components.encryptedstorage.Encryption_Service"),
                 "startup_definitions" : '', "use_existing_server" : True,
                 "interpreter_type" : "pride.components.interpreter.Interpreter",
                 "rpc_server_type" : "pride.components.rpc.Rpc_Server",
-                }
+                "lazy_startup" : False, "profile_startup" : False,
+                "checkpoint_on_restart" : False,
+                "lazy_startup_components" : ("pride.components.workerpool.Thread_Pool",
+                                             "pride.components.workerpool.Process_Pool",
+                                             "pride.components.shard.Shard_Manager",
+                                             "pride.components.schedulerstats.Scheduler_Stats"),
+                "eager_startup_components" : ("pride.components.scheduler.Processor",
+                                              "pride.components.network.Network",
+                                              "pride.components.interpreter.Interpreter",
+                                              "pride.components.datatransfer.Background_Refresh")}
+
+    predefaults = {"_startup_started_at" : 0.0}
+
+    mutable_defaults = {"startup_times" : dict, "_lazy_references" : dict}
 
     parser_args = ("command", )
     # make an optional "command" positional argument and allow
@@ -216,27 +263,47 @@ class Program(base.Base):
                                   "nargs" : '?'},
                         "exit_on_help" : False}
 
-    verbosity = {"shutdown" : 0, "restart" : 0, "os_environ_set" : 'v'}
+    verbosity = {"shutdown" : 0, "restart" : 0, "os_environ_set" : 'v',
+                 "startup_profile" : 0, "lazy_component_created" : 'v'}
 
     def __init__(self, **kwargs):
         super(Program, self).__init__(**kwargs)
+        self._startup_started_at = timestamp()
         for component_type in self.startup_components:
-            component = self.create(component_type)
-            setattr(self, component.__class__.__name__.lower(),
-                    component.reference)
+            # a Shard_Manager that has not been created has no other shards
+            if (getattr(self, "shard_manager", '') and self.shard_manager in pride.objects and
+                not pride.objects[self.shard_manager].is_local_type(component_type)):
+                continue # pinned to a different shard
+            if self.is_lazy_startup_component(component_type):
+                reference = self.add_lazy_component(component_type)
+                setattr(self, component_type.rsplit('.', 1)[-1].lower(), reference)
+            else:
+                component = self.create_startup_component(component_type)
+                setattr(self, component.__class__.__name__.lower(),
+                        component.reference)
         try:
-            self.rpc_server = self.create(self.rpc_server_type)
+            self.rpc_server = self.create_startup_component(self.rpc_server_type)
         except socket.error as exception:
             if exception.errno != 98 or not self.use_existing_server:
                 raise
         self.setup_os_environ()
 
         # ephemeral keys for encrypted in memory only data storage
+        started_at = timestamp()
         self.session = self.create("pride.components.user.Session",
                                    username=os.urandom(16), auto_register=True,
                                    password=os.urandom(32), kdf_iterations=1)
-        pride.objects["/Finalizer"].add_callback((self.session.reference, "delete"), -1)
+        self.startup_times["pride.components.user.Session"] = timestamp() - started_at
+
+        started_at = timestamp()
+        self.login_machine_user()
+        self.startup_times["pride.components.user.User"] = timestamp() - started_at
+        if self.profile_startup:
+            self.alert(self.startup_report(), level=self.verbosity["startup_profile"])
+        self.run_command()
 
+    def login_machine_user(self):
+        """ Logs in the /User component with the machine credentials. """
         machine_id, machine_password = self.get_machine_credentials()
         User = pride.components.user.User
         with pride.functions.contextmanagers.backup(User, "verbosity"):
@@ -244,6 +311,11 @@ class Program(base.Base):
             user = User(username=machine_id, password=machine_password,
                         auto_register=True, kdf_iterations=1)
         assert user.reference == "/User"
+
+    def run_command(self):
+        """ Schedules the execution of the command file, preceded by
+            startup_definitions, by the Interpreter. The shell launcher is
+            used when command is not specified. """
         if not self.command:
             command = os.path.join((os.getcwd() if "__file__"
                                     not in globals() else
@@ -262,6 +334,60 @@ class Program(base.Base):
             raise SystemExit()
         pride.Instruction(self.interpreter, "_exec_command", source).execute()
 
+    def create_startup_component(self, component_type):
+        """ usage: program.create_startup_component(component_type) => component
+
+            Creates a child component of component_type and records how long
+            its initialization took in startup_times. """
+        started_at = timestamp()
+        component = self.create(component_type)
+        self.startup_times[component_type] = timestamp() - started_at
+        return component
+
+    def is_lazy_startup_component(self, component_type):
+        """ usage: program.is_lazy_startup_component(component_type) => bool
+
+            Returns True if the startup component of component_type is
+            created the first time it is looked up instead of at startup. """
+        if component_type in self.lazy_startup_components:
+            if component_type.endswith(".Shard_Manager"):
+                component_class = pride.functions.utilities.resolve_string(component_type)
+                return component_class.defaults["shard_count"] <= 1
+            return True
+        return self.lazy_startup and component_type not in self.eager_startup_components
+
+    def add_lazy_component(self, component_type):
+        """ usage: program.add_lazy_component(component_type) => reference
+
+            Registers a child component of component_type that is created the
+            first time its reference is looked up in pride.objects, for
+            example when an Instruction targets it. Returns the reference. """
+        reference = self.reference + '/' + component_type.rsplit('.', 1)[-1]
+        pride.objects.add_factory(reference, partial(self._create_lazy_component, reference))
+        self._lazy_references[reference] = component_type
+        return reference
+
+    def _create_lazy_component(self, reference):
+        component_type = self._lazy_references.pop(reference)
+        self.create_startup_component(component_type)
+        self.alert("Created lazy startup component {} in {:.4f}s".format(reference,
+                                                                        self.startup_times[component_type]),
+                   level=self.verbosity["lazy_component_created"])
+
+    def startup_report(self):
+        """ usage: program.startup_report() => str
+
+            Returns the initialization time of each startup component,
+            slowest first, along with the names of the lazy components that
+            have not been created. Enabled on the command line with --profile_startup. """
+        startup_times = self.startup_times
+        lines = ["Startup profile ({:.4f}s):".format(timestamp() - self._startup_started_at)]
+        for component_type in sorted(startup_times, key=startup_times.get, reverse=True):
+            lines.append("    {:.4f}s {}".format(startup_times[component_type], component_type))
+        for reference in self._lazy_references:
+            lines.append("    (not created) {}".format(reference))
+        return '\n'.join(lines)
+
     def get_machine_credentials(self):
         try:
             machine_id, machine_password = pride.objects["/Program/Persistent_Storage"]["_MACHINE_CREDENTIALS"]
@@ -302,3 +428,127 @@ class Program(base.Base):
 
     def exit(self, exit_code=0):
         raise SystemExit(exit_code)
+
+    def on_load(self, attributes):
+        super(Program, self).on_load(attributes)
+        self._startup_started_at = timestamp()
+        for reference in self._lazy_references:
+            pride.objects.add_factory(reference, partial(self._create_lazy_component, reference))
+        self.setup_os_environ()
+
+    @staticmethod
+    def load(checkpoint):
+        # the machine credentials are kept in the Persistent_Storage, which
+        # is only restored after the on_load of the Program
+        program = base.Base.load(checkpoint)
+        program.login_machine_user()
+        if program.profile_startup:
+            program.alert("Restored from checkpoint in {:.4f}s".format(timestamp() - program._startup_started_at),
+                          level=program.verbosity["startup_profile"])
+        program.run_command()
+        return program
+
+    def delete(self):
+        for reference in self._lazy_references:
+            pride.objects.remove_factory(reference)
+        self._lazy_references.clear()
+        super(Program, self).delete()
+
+def test_lazy_startup():
+    """ Creates a Program and checks that its lazy startup components are
+        created the first time they are looked up, and that the factories
+        of the components that were not created are removed by delete. """
+    import shutil
+    import tempfile
+    import pride.components.interpreter
+    import pride.components.storage
+
+    class Program(pride.components.interpreter.Program):
+
+        def run_command(self):
+            pass
+
+    objects = pride.objects
+    storage_defaults = pride.components.storage.Persistent_Storage.defaults
+    database_name = storage_defaults["database_name"]
+    directory = tempfile.mkdtemp()
+    storage_defaults["database_name"] = os.path.join(directory, "storage.db")
+    try:
+        program = Program(startup_components=("pride.components.storage.Persistent_Storage",
+                                              "pride.components.scheduler.Processor",
+                                              "pride.components.shard.Shard_Manager",
+                                              "pride.components.schedulerstats.Scheduler_Stats"),
+                          rpc_server_type="pride.components.base.Base")
+        lazy_references = ("/Program/Shard_Manager", "/Program/Scheduler_Stats")
+        assert (program.shard_manager, program.scheduler_stats) == lazy_references
+        for reference in lazy_references:
+            assert reference not in objects and reference in objects.factories
+        assert "/Program/Processor" in objects
+
+        scheduler_stats = objects["/Program/Scheduler_Stats"]
+        assert scheduler_stats.reference == "/Program/Scheduler_Stats"
+        assert scheduler_stats in program.children
+        assert "/Program/Scheduler_Stats" not in objects.factories
+        assert "pride.components.schedulerstats.Scheduler_Stats" in program.startup_times
+
+        program.session.delete()
+        objects["/User"].delete()
+        program.delete()
+        assert "/Program/Shard_Manager" not in objects.factories
+        assert "/Program/Shard_Manager" not in objects
+    finally:
+        storage_defaults["database_name"] = database_name
+        shutil.rmtree(directory)
+    print("Passed Program lazy startup unit test")
+
+def test_checkpoint_restart():
+    """ Restarts a Program from a checkpoint as main.main does when
+        checkpoint_on_restart is set, and checks that the /Finalizer
+        callbacks of the restored components are registered again. """
+    import shutil
+    import tempfile
+    import pride.components.interpreter
+    import pride.components.storage
+    Program = pride.components.interpreter.Program
+
+    objects = pride.objects
+    finalizer = objects["/Finalizer"]
+    def registered_callbacks():
+        return set(callback for priority, callback, args, kwargs in finalizer._callbacks)
+    storage_defaults = pride.components.storage.Persistent_Storage.defaults
+    database_name = storage_defaults["database_name"]
+    directory = tempfile.mkdtemp()
+    storage_defaults["database_name"] = os.path.join(directory, "storage.db")
+    command = os.path.join(directory, "command.py")
+    open(command, 'w').close()
+    try:
+        # the command would be executed by an Interpreter, which is not needed here
+        program = Program(startup_components=("pride.components.storage.Persistent_Storage",
+                                              "pride.components.scheduler.Processor"),
+                          rpc_server_type="pride.components.base.Base", command=command,
+                          interpreter="/Program/Interpreter", checkpoint_on_restart=True)
+        callbacks = set([(program.session.reference, "delete"), (program.persistent_storage, "delete")])
+        assert callbacks.issubset(registered_callbacks())
+
+        checkpoint = program.save()
+        finalizer.run()
+        objects["/User"].delete()
+        program.delete()
+        assert not callbacks.intersection(registered_callbacks())
+
+        program = Program.load(checkpoint)
+        assert (program.session.reference, "delete") in callbacks
+        assert callbacks.issubset(registered_callbacks())
+        finalizer.run()
+        assert not callbacks.intersection(registered_callbacks())
+        objects["/User"].delete()
+        program.delete()
+        pride.Instruction.purge("/Program/Interpreter")
+    finally:
+        storage_defaults["database_name"] = database_name
+        shutil.rmtree(directory)
+    print("Passed Program checkpoint restart unit test")
+
+if __name__ == "__main__":
+    test_lazy_startup()
+    test_checkpoint_restart()
@@ -4,6 +4,8 @@ import argparse
 import types
 import functools
 import ast
+import itertools
+import weakref
 from copy import copy, deepcopy
 
 import cython
@@ -55,8 +57,7 @@ class alert_on_call(object):
         method_name = self.method_name
         alert_handler = pride.objects["/Alert_Handler"]
         if (method_name != "on_load" and # can cause problems otherwise
-            "debug" in alert_handler.print_level or
-            "debug" in alert_handler.log_level):
+            alert_handler._debug):
             component = args[0]
             # if verbosity is something other than "debug" it is presumably already being used for some other alert
             if component.verbosity[method_name] == "debug":
@@ -181,9 +182,25 @@ class Runtime_Decorator(object):
         return wrapped_function
 
 
+class Lazy_Parser(object):
+    """ Stands in for the parser attribute of a class until the attribute is
+        first used. The Parser is then made by Parser_Metaclass.make_parser
+        and replaces the Lazy_Parser on the class. """
+
+    def __init__(self, modifiers, exit_on_help):
+        super(Lazy_Parser, self).__init__()
+        self.modifiers = modifiers
+        self.exit_on_help = exit_on_help
+
+    def __get__(self, instance, _class):
+        Parser_Metaclass.make_parser(_class, _class.__name__, self.modifiers, self.exit_on_help)
+        return _class.__dict__["parser"]
+
+
 class Parser_Metaclass(type):
     """ Provides a command line parser for a class based upon
-        the class.defaults dictionary"""
+        the class.defaults dictionary. The parser is made when the parser
+        attribute of the class is first used. """
 
     parser = argparse.ArgumentParser()
     command_parser = parser.add_subparsers(help="filename")
@@ -200,8 +217,7 @@ class Parser_Metaclass(type):
         new_modifiers = attributes.get("parser_modifiers", {})
         modifiers.update(new_modifiers)
 
-        new_class = Parser_Metaclass.make_parser(new_class, name,
-                                                 modifiers, exit_on_help)
+        new_class.parser = Lazy_Parser(modifiers, exit_on_help)
         return new_class
 
     @staticmethod
@@ -340,6 +356,9 @@ class Parser(object):
         return options
 
 
+_IMMUTABLE_TYPES = (type(None), bool, int, long, float, complex, str, unicode,
+                    frozenset, type, types.FunctionType, types.BuiltinFunctionType)
+
 class Inherited_Attributes(type):
 
     inherited_attributes = {}
@@ -352,12 +371,19 @@ class Inherited_Attributes(type):
 
         for attribute_name, attribute_type in inherited_attributes.items():
             if issubclass(attribute_type, dict):
+                # immutable values are shared with the base classes; the
+                # others are copied, so modifying them in place does not
+                # change the base classes. Config copies the Components that
+                # the new class overrides when it updates them
                 empty_dict = attribute_type()
                 _attribute = attribute_type()
                 for _class in bases:
-                    _attribute.update(deepcopy(getattr(_class, attribute_name,
-                                                       empty_dict)))
-                _attribute.update(attributes.get(attribute_name, empty_dict))
+                    _attribute.update(getattr(_class, attribute_name, empty_dict))
+                own_values = attributes.get(attribute_name, empty_dict)
+                for key, value in _attribute.items():
+                    if key not in own_values and not isinstance(value, _IMMUTABLE_TYPES):
+                        _attribute[key] = deepcopy(value)
+                _attribute.update(own_values)
 
             elif issubclass(attribute_type, tuple):
                 empty_tuple = attribute_type()
@@ -397,6 +423,44 @@ class Defaults(Inherited_Attributes):
                             "interface" : pride.components.Interface}
 
 
+class Compact_Instances(type):
+    """ Generates __slots__ for classes with a True compact attribute and
+        for their subclasses. Slots are made for the names in the defaults,
+        predefaults and mutable_defaults of the class, along with the
+        bookkeeping attributes that Base.__init__ assigns and any names in
+        a __slots__ declared by the class. Instances then store those
+        attributes in slots instead of a __dict__; a default that is not
+        overridden is a reference to the class default value.
+
+        Other attributes are still stored in a __dict__, which is created
+        on first use. Names that are class attributes of the new class or
+        data descriptors of its bases do not get slots. A compact class can
+        not inherit from two classes that both have slots. """
+
+    base_attributes = ("reference", "parent_name", "references_to", "objects")
+
+    def __new__(cls, name, bases, attributes):
+        if attributes.get("compact", any(getattr(base, "compact", False) for base in bases)):
+            slotted, base_attributes = set(), {}
+            for base in bases:
+                for _class in reversed(base.__mro__):
+                    _slots = _class.__dict__.get("__slots__", ())
+                    slotted.update((_slots, ) if isinstance(_slots, str) else _slots)
+                    base_attributes.update(_class.__dict__)
+
+            slots = attributes.get("__slots__", ())
+            slots = set((slots, ) if isinstance(slots, str) else slots)
+            for attribute in itertools.chain(cls.base_attributes, attributes["predefaults"],
+                                             attributes["defaults"], attributes["mutable_defaults"]):
+                if attribute in slotted or attribute in attributes:
+                    continue
+                if hasattr(type(base_attributes.get(attribute)), "__set__"):
+                    continue
+                slots.add(attribute)
+            attributes["__slots__"] = tuple(sorted(slots.difference(slotted)))
+        return super(Compact_Instances, cls).__new__(cls, name, bases, attributes)
+
+
 class Site_Configuration(type):
 
     def __new__(cls, name, bases, attributes):
@@ -448,8 +512,41 @@ class Autodereferencer(type):
         return super(Autodereferencer, cls).__new__(cls, name, bases, attributes)
 
 
-class Metaclass(Documented, Parser_Metaclass, Method_Hook, Defaults,
-                Site_Configuration, Autodereferencer):
+_data_descriptors = weakref.WeakKeyDictionary()
+
+def _data_descriptor_names(new_class):
+    # the names of the bases are cached, so deep hierarchies are not rescanned
+    names = set(name for name, value in new_class.__dict__.items() if
+                hasattr(type(value), "__set__"))
+    for _class in new_class.__bases__:
+        try:
+            names.update(_data_descriptors[_class])
+        except KeyError:
+            names.update(_data_descriptor_names(_class))
+    names = _data_descriptors[new_class] = frozenset(names)
+    return names
+
+class Direct_Assignment(type):
+    """ Sets the _assign_directly attribute of new classes. It is True when
+        the class does not customize __setattr__ or __getattribute__ and
+        none of its defaults are data descriptors such as properties or
+        slots; Base.__init__ then assigns the defaults of instances by
+        updating the instance __dict__ instead of one setattr call per
+        attribute. The flag is computed when the class is created. """
+
+    def __new__(cls, name, bases, attributes):
+        new_class = super(Direct_Assignment, cls).__new__(cls, name, bases, attributes)
+        descriptor_names = _data_descriptor_names(new_class)
+        new_class._assign_directly = (new_class.__setattr__ is object.__setattr__ and
+                                      new_class.__getattribute__ is object.__getattribute__ and
+                                      descriptor_names.isdisjoint(new_class.predefaults) and
+                                      descriptor_names.isdisjoint(new_class.defaults) and
+                                      descriptor_names.isdisjoint(new_class.mutable_defaults))
+        return new_class
+
+
+class Metaclass(Direct_Assignment, Documented, Parser_Metaclass, Method_Hook,
+                Defaults, Compact_Instances, Site_Configuration, Autodereferencer):
     """ A metaclass that applies other metaclasses. """
 
     @classmethod
@@ -20,6 +20,9 @@ import struct
 import errno
 import traceback
 import sys
+import time
+import math
+import collections
 
 import pride
 import pride.components.datastructures
@@ -28,6 +31,9 @@ import pride.components.base as base
 import pride.functions.utilities
 import pride.functions.persistence
 
+Ordered_Set = pride.components.datastructures.Ordered_Set
+Buffer_Pool = pride.components.datastructures.Buffer_Pool
+
 DEFAULT_SERIALIZER = type("Serializer", (object, ), {"dumps" : staticmethod(pride.functions.persistence.save_data),
                                                      "loads" : staticmethod(pride.functions.persistence.load_data)})
 
@@ -60,7 +66,27 @@ ERROR_CODES.update({CALL_WOULD_BLOCK : "CALL_WOULD_BLOCK",
                     CONNECTION_CLOSED : "CONNECTION_CLOSED",
                     11001 : "GETADDRINFO_FAILED"}) # not in errno.errorcode
 
-HOST = socket.gethostbyname(socket.gethostname())
+SEND_WOULD_BLOCK = (CALL_WOULD_BLOCK, errno.EAGAIN)
+
+# linux reports the accept queue length of a listening socket in the
+# tcpi_unacked field of tcp_info, after eight single byte fields
+TCP_INFO = getattr(socket, "TCP_INFO", None)
+TCP_INFO_HEADER = struct.Struct("8x6I")
+
+# makes recvfrom_into return the full size of a datagram that was truncated
+MSG_TRUNC = getattr(socket, "MSG_TRUNC", 0) if sys.platform.startswith("linux") else 0
+
+_host = []
+
+def get_host():
+    """ usage: get_host() => ip_address
+
+        Returns the address of the local host name. The name is resolved on
+        the first call rather than at import time, because resolution can
+        block on DNS. """
+    if not _host:
+        _host.append(socket.gethostbyname(socket.gethostname()))
+    return _host[0]
 
 class Socket_Error_Handler(pride.components.base.Base):
 
@@ -74,7 +100,7 @@ class Socket_Error_Handler(pride.components.base.Base):
         else:
             sock.timeout_count -= 1
             sock.alert("Waiting...", level=sock.verbosity["timeout_reset"])
-            objects["/Program/Network"].connecting.add(sock)
+            objects["/Program/Network"].add_connecting(sock)
 
 
 class Socket(base.Wrapper):
@@ -97,12 +123,22 @@ class Socket(base.Wrapper):
                 "serializer" : DEFAULT_SERIALIZER,
 
                 "shutdown_on_close" : True, "shutdown_flag" : 2,
-                "absolute_max_buffer_size" : 2 ** 20}
 
-    predefaults = {"_byte_count" : 0, "_connecting" : False,
+                # the receive buffer grows until it can hold this many bytes;
+                # data beyond that is left to the os until the next recv
+                "absolute_max_buffer_size" : 2 ** 20,
+
+                # on_send_high_water is called when the number of bytes queued
+                # by send reaches send_high_water_mark, and on_send_low_water
+                # when the queue drains back down to send_low_water_mark
+                "send_high_water_mark" : 2 ** 20, "send_low_water_mark" : 2 ** 18}
+
+    predefaults = {"_recv_buffer" : None, "_recv_view" : None, "_connecting" : False,
                    "_endpoint_reference" : '', "connected" : False,
                    "closed" : False, "_saved_in_attribute" : '',
-                   "timeout_count" : 1}
+                   "timeout_count" : 1, "_send_queue" : None,
+                   "_queued_bytes" : 0, "send_paused" : False,
+                   "_delete_when_drained" : False}
 
     verbosity = {"close" : "socket_close", "network_nonexistant" : "vv",
                  "recv_eof" : "vv", "connected" : "vv",
@@ -111,10 +147,14 @@ class Socket(base.Wrapper):
                  "connection_closed" : "vv", "connection_reset" : "vv",
                  "connection_was_aborted" : "vv", "eagain" : "vv",
                  "bad_target" : 0, "unhandled" : 0, "bind_error" : 0,
-                 "getaddrinfo_failed" : 0, "timeout_reset" : 'vv'}
+                 "getaddrinfo_failed" : 0, "timeout_reset" : 'vv',
+                 "queued_output_discarded" : 0}
+
+    # called for every readable event; the alert_on_call wrapper is too costly here
+    auto_verbosity_ignore = ("recv_view", "release_buffer")
 
-    _buffer = bytearray(1024 * 1024)
-    _memoryview = memoryview(_buffer)
+    # receive buffers are borrowed from buffer_pool, which all sockets share
+    buffer_pool = Buffer_Pool()
 
     def _get_address(self):
         return (self.ip, self.port)
@@ -174,60 +214,173 @@ class Socket(base.Wrapper):
             method is called for Tcp sockets and requires a connection.
 
             Note that this recv will return the entire contents of the buffer and
-            does not need to be called in a loop."""
+            does not need to be called in a loop. Subclasses that parse the data
+            can use recv_view instead to avoid copying it."""
+        data = self.recv_view(buffer_size).tobytes()
+        self.release_buffer()
+        return data
+
+    def recv_view(self, buffer_size=0):
+        """ usage: sock.recv_view(buffer_size=0) => memoryview
+
+            Receives data as recv does, without copying it out of the receive
+            buffer of the socket. The memoryview is only valid until the next
+            call to recv_view; release_buffer should be called once the data
+            has been consumed, so idle sockets do not hold a buffer. """
         buffer_size = buffer_size or self.recv_size
-        _memoryview = self._memoryview
+        if self._recv_buffer is None:
+            self._recv_buffer = self.buffer_pool.acquire(buffer_size)
+            self._recv_view = memoryview(self._recv_buffer)
+        view = self._recv_view
+        recv_into = self.socket.recv_into
+        byte_count = 0
         try:
             while True:
-                byte_count = self.socket.recv_into(_memoryview[self._byte_count:],
-                                                   buffer_size)
-                if not byte_count:
-                    if not self._byte_count:
+                free_space = len(view) - byte_count
+                if not free_space:
+                    if len(view) >= self.absolute_max_buffer_size: # prevent intentional data flood
+                        break
+                    view = self._grow_recv_buffer(byte_count, buffer_size)
+                    free_space = len(view) - byte_count
+                received = recv_into(view[byte_count:], min(buffer_size, free_space))
+                if not received:
+                    if not byte_count:
                         self.alert("Received EOF", level=self.verbosity["recv_eof"])
                         self.shutdown_on_close = False
                         error = socket.error(CONNECTION_CLOSED)
                         error.errno = CONNECTION_CLOSED
                         raise error
                     break
-                self._byte_count += byte_count
-        except (ValueError, socket.error) as error:
-            if isinstance(error, ValueError): # Socket._buffer is not big enough
-                old_buffer = Socket._buffer
-
-                # prevent intentional data flood
-                if len(old_buffer) > self.absolute_max_buffer_size:
-                    raise
-                del Socket._memoryview
-                del _memoryview
-                old_buffer.extend(bytearray(2 * len(old_buffer)))
-                Socket._memoryview = memoryview(old_buffer)
-                return self.recv(buffer_size)
-            elif error.errno not in (10035, 11, 2):
+                byte_count += received
+        except socket.error as error:
+            if error.errno not in (10035, 11, 2):
                 raise
-        _byte_count = self._byte_count
-        self._byte_count = 0
-        return bytes(self._buffer[:_byte_count])
+        return view[:byte_count]
+
+    def _grow_recv_buffer(self, byte_count, buffer_size):
+        buffer_pool = self.buffer_pool
+        old_buffer = self._recv_buffer
+        new_buffer = buffer_pool.acquire(min(byte_count + buffer_size, self.absolute_max_buffer_size))
+        new_buffer[:byte_count] = self._recv_view[:byte_count]
+        self._recv_buffer, self._recv_view = new_buffer, memoryview(new_buffer)
+        buffer_pool.release(old_buffer)
+        return self._recv_view
+
+    def release_buffer(self):
+        """ usage: sock.release_buffer()
+
+            Returns the receive buffer to buffer_pool. memoryviews returned
+            by recv_view must not be used afterwards. """
+        if self._recv_buffer is not None:
+            self.buffer_pool.release(self._recv_buffer)
+            self._recv_buffer = self._recv_view = None
 
     def recvfrom(self, buffer_size=0):
         """ Receives data from a host. For Udp sockets this method is event triggered
             and called when the socket becomes readable according to select.select. Subclasses
             should extend this method to customize functionality for when data is received."""
-        byte_count, _from = self.socket.recvfrom_into(self._memoryview,
-                                                      buffer_size or self.recv_size)
-        return bytes(self._buffer[:byte_count]), _from
+        buffer_size = buffer_size or self.recv_size
+        buffer_pool = self.buffer_pool
+        _buffer = buffer_pool.acquire(buffer_size)
+        try:
+            byte_count, _from = self.socket.recvfrom_into(_buffer, buffer_size)
+            return memoryview(_buffer)[:byte_count].tobytes(), _from
+        finally:
+            buffer_pool.release(_buffer)
 
     def send(self, data):
-        """ Sends data to the connected endpoint. All of the data will be sent. """
-        byte_count = len(data)
+        """ Sends data to the connected endpoint without blocking and returns
+            the number of bytes that were sent immediately. Data that the
+            operating system does not accept right away is queued and sent,
+            in order, when the socket becomes writable.
+
+            send_paused is set and on_send_high_water is called when the queue
+            reaches send_high_water_mark bytes. Blocking sockets and sockets
+            with a timeout send all of the data before returning.
+
+            Data that is still queued when the socket is closed is discarded,
+            with an alert that reports how many bytes were lost. Use
+            delete_when_drained to close the socket after the queue is sent. """
 #        assert not self.deleted
 #        assert not self.closed
+        if self.blocking or self.timeout:
+            self.socket.sendall(data)
+            return len(data)
+        if isinstance(data, bytearray): # the caller may reuse it
+            data = bytes(data)
+        if self._send_queue:
+            self._queue_output(memoryview(data))
+            return 0
+        try:
+            sent = self.socket.send(data)
+        except socket.error as error:
+            if error.errno not in SEND_WOULD_BLOCK:
+                raise
+            sent = 0
+        if sent < len(data):
+            self._queue_output(memoryview(data)[sent:])
+        return sent
+
+    def _queue_output(self, data):
+        if self._send_queue is None:
+            self._send_queue = collections.deque()
+        if not self._send_queue:
+            objects["/Program/Network"].add_writer(self)
+        self._send_queue.append(data)
+        self._queued_bytes += len(data)
+        if not self.send_paused and self._queued_bytes >= self.send_high_water_mark:
+            self.send_paused = True
+            self.on_send_high_water()
+
+    def _send_queued(self):
+        queue = self._send_queue
         _socket = self.socket
-        _data = memoryview(data)
-        position = 0
-        while position < byte_count:
-            sent = _socket.send(_data[position:])
-            position += sent
-        return position
+        try:
+            while queue:
+                data = queue[0]
+                sent = _socket.send(data)
+                self._queued_bytes -= sent
+                if sent < len(data):
+                    queue[0] = data[sent:]
+                    break
+                queue.popleft()
+        except socket.error as error:
+            if error.errno not in SEND_WOULD_BLOCK:
+                raise
+
+    def on_writable(self):
+        """ Sends queued data. Called by the Network when the socket is
+            writable while data is queued. """
+        self._send_queued()
+        if not self._send_queue:
+            objects["/Program/Network"].remove_writer(self)
+            if self._delete_when_drained:
+                self.delete()
+                return
+        if self.send_paused and self._queued_bytes <= self.send_low_water_mark:
+            self.send_paused = False
+            self.on_send_low_water()
+
+    def on_send_high_water(self):
+        """ Called when the data queued by send reaches send_high_water_mark
+            bytes. Producers should extend this method to stop generating
+            output until on_send_low_water is called. """
+
+    def on_send_low_water(self):
+        """ Called when the queued data has drained to send_low_water_mark
+            bytes after on_send_high_water was called. """
+
+    def delete_when_drained(self):
+        """ usage: socket.delete_when_drained()
+
+            Deletes the socket once the output queued by send has been sent,
+            or immediately if nothing is queued. The socket is no longer
+            read from in the meantime. """
+        if not self._send_queue:
+            self.delete()
+        else:
+            self._delete_when_drained = True
+            objects["/Program/Network"].pause_reading(self)
 
     def connect(self, address):
         """ Perform a non blocking connect to the specified address. The on_connect method
@@ -244,7 +397,7 @@ class Socket(base.Wrapper):
                 self._started_connecting_at = pride.functions.utilities.timestamp()
                 #self.latency = pride.components.datastructures.Latency(size=10)
                 self._connecting = True
-                objects["/Program/Network"].connecting.add(self)
+                objects["/Program/Network"].add_connecting(self)
             else:
                 raise
         else:
@@ -267,11 +420,23 @@ class Socket(base.Wrapper):
 
     def close(self):
         self.alert("Closing", level=self.verbosity["close"])
+        if self._send_queue:
+            # anything that still does not fit in the os buffer is discarded
+            try:
+                self._send_queued()
+            except socket.error:
+                pass
+            if self._queued_bytes:
+                self.alert("Discarded {} bytes of queued output".format(self._queued_bytes),
+                           level=self.verbosity["queued_output_discarded"])
+                self._send_queue.clear()
+                self._queued_bytes = 0
         objects["/Program/Network"].remove(self)
         if self.shutdown_on_close and self.connected:
             self.wrapped_object.shutdown(self.shutdown_flag)
         self.wrapped_object.close()
         self.closed = True
+        self.release_buffer()
 
     def __getstate__(self):
         stats = super(Socket, self).__getstate__()
@@ -280,6 +445,10 @@ class Socket(base.Wrapper):
         stats["serializer"] = stats["serializer"].__name__
         stats["connecting"] = False
         stats["_connected"] = False
+        stats["_send_queue"] = None
+        stats["_recv_buffer"] = stats["_recv_view"] = None
+        stats["_queued_bytes"] = 0
+        stats["send_paused"] = stats["_delete_when_drained"] = False
         return stats
 
     def on_load(self, attributes):
@@ -364,16 +533,43 @@ class Tcp_Socket(Socket):
 
 
 class Server(Tcp_Socket):
+    """ Listens on (interface, port) and creates a Tcp_Socket_type for each
+        connection that is accepted.
+
+        Each time the server is readable, up to accept_budget pending
+        connections are accepted before their sockets are created. Any
+        connections beyond the budget stay in the listen backlog until the
+        next time the Network polls. stats reports the accept rate and the
+        depth of the accept queue. """
 
     defaults = {"port" : 80,
-                "backlog" : 50,
+                "backlog" : socket.SOMAXCONN,
+                "accept_budget" : 64,
                 "reuse_port" : 1,
-                "Tcp_Socket_type" : "network.Tcp_Socket",
+                "Tcp_Socket_type" : "pride.components.network.Tcp_Socket",
                 "allow_port_zero" : False,
                 "dont_save" : False,
                 "replace_reference_on_load" : True,
                 "shutdown_on_close" : False}
 
+    predefaults = {"accepted_count" : 0, "budget_exhausted_count" : 0,
+                   "max_accept_queue_depth" : 0, "_rate_started_at" : 0.0,
+                   "_rate_count" : 0, "_accepts_per_second" : 0.0}
+
+    def _get_accept_queue_depth(self):
+        if TCP_INFO is None:
+            return None
+        try:
+            tcp_info = self.socket.getsockopt(socket.IPPROTO_TCP, TCP_INFO, TCP_INFO_HEADER.size)
+        except socket.error:
+            return None
+        if len(tcp_info) < TCP_INFO_HEADER.size:
+            return None
+        return TCP_INFO_HEADER.unpack_from(tcp_info)[4]
+    accept_queue_depth = property(_get_accept_queue_depth,
+                                  doc="The number of connections waiting to be accepted, or None " +
+                                      "if the os does not report it")
+
     def __init__(self, **kwargs):
         super(Server, self).__init__(**kwargs)
         self.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, self.reuse_port)
@@ -386,19 +582,77 @@ class Server(Tcp_Socket):
         pride.objects["/Program/Network_Connection_Manager"].servers[(self.interface, self.port)] = self.reference
 
     def on_select(self):
+        accept = self.socket.accept
+        accepted = []
+        append = accepted.append
         try:
-            while True:
-                self.accept()
+            for count in range(self.accept_budget):
+                append(accept())
         except socket.error as error:
+            # connections accepted before the error still get their sockets
+            self.create_connections(accepted)
             if error.errno not in (10035, 11):
                 raise
+        else:
+            self.budget_exhausted_count += 1
+            depth = self.accept_queue_depth
+            if depth is not None and depth > self.max_accept_queue_depth:
+                self.max_accept_queue_depth = depth
+            self.create_connections(accepted)
 
     def accept(self):
         _socket, address = self.socket.accept()
-        connection = self.create(self.Tcp_Socket_type, wrapped_object=_socket,
-                                 peername=address)
-        connection.on_connect()
-        return connection, address
+        return self.create_connections([(_socket, address)])[0], address
+
+    def create_connections(self, accepted):
+        """ usage: server.create_connections(accepted) => connections
+
+            Creates a Tcp_Socket_type for each (socket, address) pair in
+            accepted and calls its on_connect method. A socket.error raised
+            by on_connect is handled for that connection alone. """
+        if not accepted:
+            return []
+        self._count_accepted(len(accepted))
+        Tcp_Socket_type = self.Tcp_Socket_type
+        if isinstance(Tcp_Socket_type, str): # resolved once for the whole batch
+            Tcp_Socket_type = pride.functions.utilities.resolve_string(Tcp_Socket_type)
+        create = self.create
+        error_handler = objects["/Program/Network"].error_handler
+        connections = []
+        for _socket, address in accepted:
+            connection = create(Tcp_Socket_type, wrapped_object=_socket, peername=address)
+            connections.append(connection)
+            try:
+                connection.on_connect()
+            except socket.error as error:
+                error_handler.dispatch(connection, error, ERROR_CODES[error.errno].lower())
+        return connections
+
+    def _count_accepted(self, count):
+        self.accepted_count += count
+        now = pride.functions.utilities.timestamp()
+        elapsed = now - self._rate_started_at
+        if elapsed >= 1.0:
+            self._accepts_per_second = self._rate_count / elapsed
+            self._rate_started_at = now
+            self._rate_count = 0
+        self._rate_count += count
+
+    def stats(self):
+        """ usage: server.stats() => dict
+
+            Returns a dictionary with the total number of connections
+            accepted, the accepts per second over the last second or more,
+            the current and largest observed accept queue depth, the
+            backlog, and the number of times accept_budget ran out. The
+            queue depth is None where the os does not report it; the largest
+            depth is sampled when the budget runs out. """
+        elapsed = pride.functions.utilities.timestamp() - self._rate_started_at
+        accepts_per_second = self._rate_count / elapsed if elapsed >= 1.0 else self._accepts_per_second
+        return {"accepted" : self.accepted_count, "accepts_per_second" : accepts_per_second,
+                "accept_queue_depth" : self.accept_queue_depth,
+                "max_accept_queue_depth" : self.max_accept_queue_depth,
+                "backlog" : self.backlog, "budget_exhausted" : self.budget_exhausted_count}
 
     def on_connect(self, connection, address):
         pass
@@ -431,10 +685,23 @@ class Tcp_Client(Tcp_Socket):
 
 
 class Udp_Socket(Socket):
+    """ A datagram socket. By default each readable event receives one
+        datagram with recvfrom.
 
-    defaults = {"bind_on_init" : True}
+        When datagram_budget is not 0, the socket is drained instead: up to
+        datagram_budget pending datagrams are received into buffers that are
+        allocated once, then passed to on_datagrams in a single call. Datagrams
+        larger than max_datagram_size are truncated and counted in
+        truncated_count. """
+
+    defaults = {"bind_on_init" : True, "datagram_budget" : 0, "max_datagram_size" : 2048}
     #del defaults["connection_attempts"]
 
+    predefaults = {"_datagram_buffer" : None, "_datagram_slots" : None,
+                   "datagram_count" : 0, "truncated_count" : 0}
+
+    auto_verbosity_ignore = ("drain_datagrams", )
+
     def __init__(self, **kwargs):
         kwargs.setdefault("wrapped_object", socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
         super(Udp_Socket, self).__init__(**kwargs)
@@ -446,8 +713,68 @@ class Udp_Socket(Socket):
             self.port = self.getsockname()[1]
 
     def on_select(self):
+        if self.datagram_budget:
+            return self.drain_datagrams()
         return self.recvfrom()
 
+    def drain_datagrams(self):
+        """ usage: udp_socket.drain_datagrams() => datagram_count
+
+            Receives up to datagram_budget pending datagrams and passes them
+            to on_datagrams. Returns the number of datagrams received. """
+        slots = self._datagram_slots
+        if slots is None:
+            slots = self._allocate_datagram_slots()
+        recvfrom_into = self.socket.recvfrom_into
+        max_datagram_size = self.max_datagram_size
+        batch = []
+        append = batch.append
+        try:
+            for slot in slots:
+                byte_count, address = recvfrom_into(slot, max_datagram_size, MSG_TRUNC)
+                if byte_count > max_datagram_size:
+                    self.truncated_count += 1
+                    byte_count = max_datagram_size
+                append((slot[:byte_count], address))
+        except socket.error as error:
+            # datagrams received before the error are still delivered
+            if batch:
+                self.datagram_count += len(batch)
+                self.on_datagrams(batch)
+            if error.errno not in (10035, 11):
+                raise
+        else:
+            self.datagram_count += len(batch)
+            self.on_datagrams(batch)
+        return len(batch)
+
+    def _allocate_datagram_slots(self):
+        # allocated on first use, so idle sockets do not hold the memory
+        size = self.max_datagram_size
+        self._datagram_buffer = self.buffer_pool.acquire(self.datagram_budget * size)
+        view = memoryview(self._datagram_buffer)
+        self._datagram_slots = [view[index * size:(index + 1) * size] for
+                                index in range(self.datagram_budget)]
+        return self._datagram_slots
+
+    def on_datagrams(self, batch):
+        """ Called by drain_datagrams with a list of (data, address) pairs.
+            data is a memoryview that is only valid until the next call, so
+            datagrams that are kept must be copied with data.tobytes().
+            Subclasses should extend this method to handle the datagrams. """
+
+    def release_buffer(self):
+        super(Udp_Socket, self).release_buffer()
+        if self._datagram_buffer is not None:
+            self._datagram_slots = None
+            self.buffer_pool.release(self._datagram_buffer)
+            self._datagram_buffer = None
+
+    def __getstate__(self):
+        state = super(Udp_Socket, self).__getstate__()
+        state["_datagram_buffer"] = state["_datagram_slots"] = None
+        return state
+
 
 class Multicast_Beacon(Udp_Socket):
 
@@ -483,7 +810,8 @@ class Multicast_Beacon(Udp_Socket):
 
 class Multicast_Receiver(Udp_Socket):
 
-    defaults = {"multicast_group" : "224.0.0.0", "port" : 1929}
+    # a multicast feed can arrive faster than one datagram per poll
+    defaults = {"multicast_group" : "224.0.0.0", "port" : 1929, "datagram_budget" : 128}
 
     def __init__(self, **kwargs):
         super(Multicast_Receiver, self).__init__(**kwargs)
@@ -522,43 +850,197 @@ class Network_Connection_Manager(pride.components.base.Base):
 
 
 class Network(scheduler.Process):
-    """ Manages socket objects and is responsible for calling select.select to determine
+    """ Manages socket objects and is responsible for determining the
         readability/writability of sockets. Also responsible for non blocking connect logic.
         This component is created by default upon application startup, and in most cases will
-        not require user interaction."""
-    defaults = {"priority" : .01, "run_condition" : "sockets"}
-
-    mutable_defaults = {"connecting" : set, "sockets" : list,
+        not require user interaction.
+
+        By default the network is polled every priority seconds. When the
+        Processor is configured with wait_for_sockets, the Processor calls
+        wait instead, and blocks until a socket is ready or the next
+        Instruction is due.
+
+        Sockets are only checked for writability while they are connecting
+        or have output queued by send (see add_writer), and are not checked
+        for readability while reading is paused with pause_reading.
+
+        readiness_backend selects how sockets are polled. The "epoll" and
+        "poll" backends register each socket once, when it is added, and
+        modify the registration when the interest of the socket changes.
+        The "select" backend passes every socket to select.select on each
+        poll, in slices of select_limit. "auto" uses epoll where available,
+        then poll, then select. """
+    defaults = {"priority" : .01, "run_condition" : "sockets",
+                # select has a max # of file descriptors it can handle, which
+                # is about 500 (at least on windows).
+                "select_limit" : 500, "readiness_backend" : "auto"}
+
+    allowed_values = {"readiness_backend" : ("auto", "epoll", "poll", "select")}
+
+    predefaults = {"_poller" : None, "_read_events" : 0, "_write_events" : 0,
+                   "_timeout_scale" : 1}
+
+    mutable_defaults = {"connecting" : set, "sockets" : Ordered_Set,
+                        "writers" : set, "paused_readers" : set,
+                        "_socket_descriptors" : dict, "_registered_sockets" : dict,
                      #   "_timestamp" : pride.functions.utilities.timestamp,
                         "error_handler" : Socket_Error_Handler}
 
+    def __init__(self, **kwargs):
+        super(Network, self).__init__(**kwargs)
+        self.reset_poller()
+
+    def reset_poller(self):
+        """ usage: network.reset_poller()
+
+            Creates a new poller for readiness_backend and registers the
+            current sockets with it. Called when a forked process needs a
+            poller that is not shared with its parent. """
+        self._close_poller()
+        self._socket_descriptors.clear()
+        self._registered_sockets.clear()
+        backend = self.readiness_backend
+        if backend == "auto":
+            backend = ("epoll" if hasattr(select, "epoll") else
+                       "poll" if hasattr(select, "poll") else "select")
+        if backend == "epoll":
+            self._poller = select.epoll()
+            self._read_events, self._write_events = select.EPOLLIN | select.EPOLLPRI, select.EPOLLOUT
+            self._timeout_scale = 1
+        elif backend == "poll":
+            self._poller = select.poll()
+            self._read_events, self._write_events = select.POLLIN | select.POLLPRI, select.POLLOUT
+            self._timeout_scale = 1000 # milliseconds
+        for sock in self.sockets:
+            self._register(sock)
+
+    def _close_poller(self):
+        # poll objects do not hold a file descriptor
+        if hasattr(self._poller, "close"):
+            self._poller.close()
+        self._poller = None
+
+    def _register(self, sock):
+        if self._poller is not None:
+            file_descriptor = sock.fileno()
+            self._socket_descriptors[sock] = file_descriptor
+            events = self._events_of(sock)
+            if events:
+                self._poller.register(file_descriptor, events)
+                self._registered_sockets[file_descriptor] = sock
+
+    def _events_of(self, sock):
+        events = 0 if sock in self.paused_readers else self._read_events
+        if sock in self.connecting or sock in self.writers:
+            events |= self._write_events
+        return events
+
+    def _update_events(self, sock):
+        # called whenever sock enters or leaves connecting, writers or paused_readers
+        try:
+            file_descriptor = self._socket_descriptors[sock]
+        except KeyError:
+            return
+        events = self._events_of(sock)
+        if file_descriptor not in self._registered_sockets:
+            if events:
+                self._poller.register(file_descriptor, events)
+                self._registered_sockets[file_descriptor] = sock
+        elif events:
+            self._poller.modify(file_descriptor, events)
+        else:
+            # hang ups and errors are reported even when no events are
+            # requested, so a paused reader is not polled at all
+            del self._registered_sockets[file_descriptor]
+            self._poller.unregister(file_descriptor)
+
+    def add_writer(self, sock):
+        """ usage: network.add_writer(sock)
+
+            Calls sock.on_writable when sock is writable, until sock is
+            removed with remove_writer. Used by sockets with queued output. """
+        if sock not in self.writers:
+            self.writers.add(sock)
+            self._update_events(sock)
+
+    def remove_writer(self, sock):
+        """ usage: network.remove_writer(sock)
+
+            Stops checking sock for writability. """
+        if sock in self.writers:
+            self.writers.remove(sock)
+            self._update_events(sock)
+
+    def pause_reading(self, sock):
+        """ usage: network.pause_reading(sock)
+
+            Stops calling sock.on_select until resume_reading is called.
+            Unread data is left to the os, so tcp flow control slows down
+            the remote endpoint. """
+        if sock not in self.paused_readers:
+            self.paused_readers.add(sock)
+            self._update_events(sock)
+
+    def resume_reading(self, sock):
+        """ usage: network.resume_reading(sock)
+
+            Resumes calling sock.on_select after pause_reading. """
+        if sock in self.paused_readers:
+            self.paused_readers.remove(sock)
+            self._update_events(sock)
+
     def add(self, sock):
         super(Network, self).add(sock)
         self.sockets.append(sock)
+        self._register(sock)
 
     def remove(self, sock):
         super(Network, self).remove(sock)
         self.sockets.remove(sock)
+        self.connecting.discard(sock)
+        self.writers.discard(sock)
+        self.paused_readers.discard(sock)
+        file_descriptor = self._socket_descriptors.pop(sock, None)
+        if self._registered_sockets.pop(file_descriptor, None) is not None:
+            try:
+                self._poller.unregister(file_descriptor)
+            except (IOError, OSError, ValueError, KeyError): # already closed
+                pass
+
+    def add_connecting(self, sock):
+        """ usage: network.add_connecting(sock)
+
+            Waits for the non blocking connect of sock to complete. """
+        self.connecting.add(sock)
+        self._update_events(sock)
 
     def delete(self):
         super(Network, self).delete()
+        self._close_poller()
         del self.sockets
         del self.connecting
 
     def run(self):
+        self.wait(0.0)
+
+    def wait(self, timeout=None):
+        """ usage: network.wait(timeout=None)
+
+            Blocks until a socket is readable, a connecting socket or a
+            socket with queued output is writable, or timeout seconds have
+            passed, then handles the ready sockets and any pending connections. A timeout of None
+            waits indefinitely, or for priority seconds while connections
+            are pending. """
+        if timeout is None and self.connecting:
+            timeout = self.priority
+        readable, writable = self._select(timeout)
+        self._handle_readable(readable)
+        self._handle_connecting(writable)
+        if writable and self.writers:
+            self._handle_writable(writable)
+
+    def _handle_readable(self, readable):
         error_handler = self.error_handler
-        readable, writable, empty_list = [], [], []
-        # select has a max # of file descriptors it can handle, which
-        # is about 500 (at least on windows). step through in slices (0, 500), (500, 100), ...
-        for socket_list in pride.functions.utilities.slide(self.sockets, 500):
-            (readable_sockets,
-             writable_sockets, _) = select.select(socket_list, socket_list,
-                                                  empty_list, 0.0)
-            if readable_sockets:
-                readable.extend(readable_sockets)
-            if writable_sockets:
-                writable.extend(writable_sockets)
-
         read_progress = 0
         readable_count = len(readable)
         # nesting the for within the while so we don't have to
@@ -580,37 +1062,558 @@ class Network(scheduler.Process):
             else:
                 break
 
+    def _handle_writable(self, writable):
+        error_handler = self.error_handler
+        writers = self.writers
+        for _socket in writable:
+            if _socket not in writers: # connecting, or deleted by an earlier socket
+                continue
+            try:
+                _socket.on_writable()
+            except socket.error as error:
+                error_handler.dispatch(_socket, error, ERROR_CODES[error.errno].lower())
+            except Exception:
+                message = "Caught non socket.error during send: {}".format(traceback.format_exc())
+                _socket.alert(message, level=0)
+                _socket.delete()
+
+    def _handle_connecting(self, writable):
+        error_handler = self.error_handler
         connecting = self.connecting
-        self.connecting = set()
         if connecting:
             if writable:
-                # if a connecting tcp client is now writable, it's connected
+                # if a connecting tcp client is now writable, it's connected.
+                # it stops being checked for writability before on_connect is
+                # called, so if on_connect raises an exception, the sockets
+                # that were not handled yet are still connecting
                 for accepted in connecting.intersection(writable):
+                    if accepted not in connecting: # deleted by an earlier on_connect
+                        continue
+                    connecting.remove(accepted)
+                    self._update_events(accepted)
                     accepted.on_connect()
 
             # if not, then it's still waiting or the connection timed out
-            still_connecting = connecting.difference(writable)
             elapsed_time = self.priority
 
           #  old_timestamp = self._timestamp
           #  self._timestamp = now = pride.functions.utilities.timestamp()
           #  elapsed_time = now - old_timestamp
             now = pride.functions.utilities.timestamp()
-            for connection in still_connecting:
-                if now - connection._started_connecting_at > connection.connect_timeout:
-                    try:
-                        connection.connect(connection.host_info)
-                    except socket.error as error:
-                        error_handler.dispatch(connection, error,
-                                               ERROR_CODES[error.errno].lower())
-                else:
-                    self.connecting.add(connection)
+            timed_out = [connection for connection in connecting if
+                         now - connection._started_connecting_at > connection.connect_timeout]
+            for connection in timed_out:
+                connecting.remove(connection)
+                self._update_events(connection)
+                try:
+                    connection.connect(connection.host_info)
+                except socket.error as error:
+                    error_handler.dispatch(connection, error,
+                                           ERROR_CODES[error.errno].lower())
+
+    def _select(self, timeout):
+        if self._poller is not None:
+            return self._poll(timeout)
+        # only connecting sockets and sockets with queued output are checked
+        # for writability; a connected socket is nearly always writable and
+        # would end the wait immediately
+        sockets = self.sockets
+        if self.paused_readers:
+            paused_readers = self.paused_readers
+            sockets = [sock for sock in sockets if sock not in paused_readers]
+        writers = list(self.connecting.union(self.writers) if self.writers else self.connecting)
+        select_limit = self.select_limit
+        if not sockets and not writers:
+            time.sleep(self.priority if timeout is None else timeout)
+            return [], []
+        if len(sockets) <= select_limit and len(writers) <= select_limit:
+            readable, writable, _ = select.select(sockets, writers, [], timeout)
+            return readable, writable
+
+        # too many sockets for a single select; step through in slices
+        # (0, 500), (500, 1000), ... without blocking
+        slide = pride.functions.utilities.slide
+        readable, writable, empty_list = [], [], []
+        for socket_list in slide(sockets, select_limit):
+            readable.extend(select.select(socket_list, empty_list, empty_list, 0.0)[0])
+        for socket_list in slide(writers, select_limit):
+            writable.extend(select.select(empty_list, socket_list, empty_list, 0.0)[1])
+        if timeout and not (readable or writable):
+            time.sleep(min(timeout, self.priority))
+        return readable, writable
+
+    def _poll(self, timeout):
+        registered_sockets = self._registered_sockets
+        if not registered_sockets:
+            time.sleep(self.priority if timeout is None else timeout)
+            return [], []
+        if timeout is None:
+            timeout = -1
+        elif self._timeout_scale != 1:
+            timeout = int(math.ceil(timeout * self._timeout_scale))
+        events = self._poller.poll(timeout)
+        # errors and hang ups are reported as readable, as select does
+        write_events = self._write_events
+        readable = [registered_sockets[file_descriptor] for file_descriptor, event in events if
+                    event & ~write_events]
+        writable = [registered_sockets[file_descriptor] for file_descriptor, event in events if
+                    event & write_events]
+        if self.paused_readers and readable: # paused, but still waiting to write
+            paused_readers = self.paused_readers
+            readable = [sock for sock in readable if sock not in paused_readers]
+        return readable, writable
 
     def __getstate__(self):
         state = super(Network, self).__getstate__()
         state["connecting"] = set()
-        state["sockets"] = []
+        state["sockets"] = Ordered_Set()
+        state["writers"] = set()
+        state["paused_readers"] = set()
+        state["_poller"] = None
+        state["_socket_descriptors"] = {}
+        state["_registered_sockets"] = {}
         return state
 
+    def on_load(self, attributes):
+        super(Network, self).on_load(attributes)
+        # sockets that were loaded first are registered here
+        self.reset_poller()
+
     def __contains__(self, _socket):
         return _socket in self.sockets
+
+
+def test_send_queue(data_size=2 ** 24):
+    """ Sends data_size bytes to a slow reader through a socket pair. send
+        returns immediately, and the rest of the data is sent as the Network
+        finds the socket writable, with backpressure callbacks in between. """
+    import timeit
+    import pride.components.base
+    import pride.components.network
+    timestamp = timeit.default_timer
+
+    class Producer(pride.components.network.Tcp_Socket):
+
+        mutable_defaults = {"events" : list}
+
+        def on_send_high_water(self):
+            self.events.append(("high", self._queued_bytes))
+
+        def on_send_low_water(self):
+            self.events.append(("low", self._queued_bytes))
+
+    pride.components.base._test_program()
+    network = objects["/Program/Network"]
+    sender, receiver = socket.socketpair()
+    producer = Producer(wrapped_object=sender, connected=True,
+                        send_high_water_mark=2 ** 22, send_low_water_mark=2 ** 20)
+    data = bytes(bytearray(index % 251 for index in range(data_size)))
+    first_half, second_half = data[:data_size // 2], data[data_size // 2:]
+    started_at = timestamp()
+    sent = producer.send(first_half)
+    sent += producer.send(second_half)
+    send_time = timestamp() - started_at
+    assert sent < data_size and producer.send_paused and producer in network.writers
+    assert producer._queued_bytes == data_size - sent
+    assert [event for event, queued_bytes in producer.events] == ["high"], producer.events
+
+    received = []
+    receiver.setblocking(0)
+    while producer in network.writers:
+        network.wait(0.0)
+        try:
+            received.append(receiver.recv(65536))
+        except socket.error:
+            pass
+    while True:
+        try:
+            received.append(receiver.recv(65536))
+        except socket.error:
+            break
+    elapsed = timestamp() - started_at
+    assert b''.join(received) == data
+    assert not producer.send_paused and producer._queued_bytes == 0
+    assert len(producer.events) == 2 and producer.events[1][0] == "low"
+    assert producer.events[1][1] <= producer.send_low_water_mark
+    producer.delete()
+    receiver.close()
+    assert producer not in network.writers
+    print("send returned in {:.1f}us; {} bytes delivered in {:.3f}s".format(1000000 * send_time,
+                                                                          data_size, elapsed))
+    print("Passed send queue unit test")
+
+def test_queued_output_on_close(data_size=2 ** 23):
+    """ Checks that close alerts the number of queued bytes it discards,
+        and that delete_when_drained delivers all of the queued output
+        before the socket is deleted. """
+    import pride.components.base
+    import pride.components.network
+
+    class Producer(pride.components.network.Tcp_Socket):
+
+        mutable_defaults = {"alerts" : list}
+
+        def alert(self, message, level=0):
+            self.alerts.append((message, level))
+
+    pride.components.base._test_program()
+    network = objects["/Program/Network"]
+    data = bytes(bytearray(index % 251 for index in range(data_size)))
+
+    sender, receiver = socket.socketpair()
+    producer = Producer(wrapped_object=sender, connected=True)
+    sent = producer.send(data)
+    assert sent < data_size
+    producer.delete()
+    discarded = [(text, level) for text, level in producer.alerts if text.startswith("Discarded")]
+    assert len(discarded) == 1 and discarded[0][1] == 0, producer.alerts
+    assert int(discarded[0][0].split()[1]) > 0
+    receiver.close()
+
+    sender, receiver = socket.socketpair()
+    producer = Producer(wrapped_object=sender, connected=True)
+    producer.send(data)
+    producer.delete_when_drained()
+    assert not producer.deleted and producer in network.paused_readers
+    received = []
+    receiver.setblocking(0)
+    while not producer.deleted:
+        network.wait(0.0)
+        try:
+            received.append(receiver.recv(65536))
+        except socket.error:
+            pass
+    receiver.setblocking(1)
+    while True:
+        chunk = receiver.recv(65536)
+        if not chunk:
+            break
+        received.append(chunk)
+    assert b''.join(received) == data
+    assert not [text for text, level in producer.alerts if text.startswith("Discarded")]
+    assert producer not in network.writers and producer not in network.paused_readers
+    receiver.close()
+    print("Passed queued output on close unit test")
+
+def test_paused_readers():
+    """ Checks with each readiness backend that a paused socket is not
+        handled, and does not end the wait, when its peer sends data and
+        hangs up, and that it is handled again after resume_reading. """
+    import timeit
+    import pride.components.base
+    import pride.components.network
+    Network = pride.components.network.Network
+    timestamp = timeit.default_timer
+
+    class Reader(pride.components.network.Tcp_Socket):
+
+        predefaults = {"select_count" : 0}
+
+        def on_select(self):
+            self.select_count += 1
+
+    program = pride.components.base._test_program()
+    objects["/Program/Network"].delete()
+    backends = [backend for backend, available in (("epoll", hasattr(select, "epoll")),
+                                                   ("poll", hasattr(select, "poll")),
+                                                   ("select", True)) if available]
+    for backend in backends:
+        network = program.create(Network, readiness_backend=backend, running=False)
+        sender, receiver = socket.socketpair()
+        reader = Reader(wrapped_object=receiver, connected=True)
+        network.pause_reading(reader)
+        sender.send(b'x')
+        sender.close()
+        started_at = timestamp()
+        network.wait(.05)
+        assert timestamp() - started_at >= .04, backend
+        assert not reader.select_count, backend
+        network.resume_reading(reader)
+        network.wait(.05)
+        assert reader.select_count == 1, (backend, reader.select_count)
+        reader.delete()
+        network.delete()
+    program.create(Network)
+    print("Passed paused readers unit test")
+
+def test_on_connect_exception():
+    """ Checks with each readiness backend that when on_connect raises an
+        exception, the other connected sockets are handled by the next wait,
+        and that sockets that have connected are no longer checked for
+        writability. """
+    import timeit
+    import pride.components.base
+    import pride.components.network
+    Network = pride.components.network.Network
+    timestamp = timeit.default_timer
+
+    class Failing_Client(pride.components.network.Tcp_Client):
+
+        predefaults = {"connect_count" : 0}
+
+        def on_connect(self):
+            super(Failing_Client, self).on_connect()
+            self.connect_count += 1
+            raise ValueError("on_connect failed")
+
+    program = pride.components.base._test_program()
+    objects["/Program/Network"].delete()
+    listener = socket.socket()
+    listener.bind(("localhost", 0))
+    listener.listen(8)
+    backends = [backend for backend, available in (("epoll", hasattr(select, "epoll")),
+                                                   ("poll", hasattr(select, "poll")),
+                                                   ("select", True)) if available]
+    for backend in backends:
+        network = program.create(Network, readiness_backend=backend, running=False)
+        clients = [Failing_Client(host_info=listener.getsockname()) for count in range(2)]
+        for count in range(2):
+            try:
+                network.wait(1.0)
+            except ValueError:
+                pass
+            else:
+                assert False, backend
+        assert [client.connect_count for client in clients] == [1, 1], backend
+        started_at = timestamp()
+        network.wait(.05)
+        assert timestamp() - started_at >= .04, backend
+        for client in clients:
+            client.delete()
+            listener.accept()[0].close()
+        network.delete()
+    listener.close()
+    program.create(Network)
+    print("Passed on_connect exception unit test")
+
+def test_recv_buffers(data_size=3 * 2 ** 20, rounds=200):
+    """ Checks that receive buffers grow up to absolute_max_buffer_size, are
+        returned to the Buffer_Pool and are reused, then measures recv and
+        recv_view throughput through a socket pair. """
+    import timeit
+    import pride.components.base
+    import pride.components.network
+    timestamp = timeit.default_timer
+    buffer_pool = pride.components.network.Socket.buffer_pool
+
+    pride.components.base._test_program()
+    sender, receiver = socket.socketpair()
+    sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2 ** 22)
+    sock = pride.components.network.Tcp_Socket(wrapped_object=receiver, connected=True)
+    data = bytes(bytearray(index % 251 for index in range(data_size)))
+    sender.setblocking(0)
+    received, position = [], 0
+    while position < data_size or len(b''.join(received)) < data_size:
+        try:
+            position += sender.send(data[position:position + 2 ** 20])
+        except socket.error:
+            pass
+        received.append(sock.recv())
+        assert len(received[-1]) <= sock.absolute_max_buffer_size
+        assert sock._recv_buffer is None
+    assert b''.join(received) == data
+
+    chunk = data[:65536]
+    allocation_count = buffer_pool.allocation_count
+    for method in ("recv", "recv_view"):
+        started_at = timestamp()
+        for count in range(rounds):
+            sender.send(chunk)
+            view = getattr(sock, method)()
+            if method == "recv_view":
+                sock.release_buffer()
+        elapsed = timestamp() - started_at
+        print("{}: {:.1f}MB/s".format(method, rounds * len(chunk) / elapsed / 2 ** 20))
+    assert buffer_pool.allocation_count == allocation_count
+    view = sock.recv_view() if sender.send(chunk) else None
+    assert view.tobytes() == chunk
+    sock._recv_buffer[:1] = b'\xff' # the view is not a copy
+    assert view[:1].tobytes() == b'\xff'
+    sock.release_buffer()
+    sock.delete()
+    sender.close()
+    assert sock._recv_buffer is None
+    print("Passed recv buffer unit test")
+
+def test_accept_batching(connection_count=1000, budgets=(1, 16, 64, 1024)):
+    """ Connects connection_count clients to a Server before the Network
+        polls, then measures how many polls and how long each accept_budget
+        takes to accept all of them. """
+    import timeit
+    import pride.components.base
+    import pride.components.network
+    timestamp = timeit.default_timer
+
+    program = pride.components.base._test_program()
+    if "/Program/Network_Connection_Manager" not in objects:
+        program.create(pride.components.network.Network_Connection_Manager)
+    network = objects["/Program/Network"]
+    for budget in budgets:
+        server = program.create(pride.components.network.Server, interface="127.0.0.1", port=0,
+                                backlog=connection_count, accept_budget=budget)
+        address = server.getsockname()
+        clients = []
+        for count in range(connection_count):
+            client = socket.socket()
+            client.setblocking(0)
+            client.connect_ex(address)
+            clients.append(client)
+        assert server.accept_queue_depth in (None, connection_count), server.accept_queue_depth
+        poll_count = 0
+        started_at = timestamp()
+        while server.accepted_count < connection_count and poll_count < 10 * connection_count:
+            network.wait(0.0)
+            poll_count += 1
+        elapsed = timestamp() - started_at
+        stats = server.stats()
+        assert stats["accepted"] == connection_count and stats["accept_queue_depth"] in (None, 0)
+        assert stats["budget_exhausted"] == connection_count // budget
+        print("accept_budget {}: {} connections accepted in {} polls, {:.1f}ms".format(budget, connection_count,
+                                                                                     poll_count, 1000 * elapsed))
+        for connection in list(server.children):
+            connection.delete()
+        for client in clients:
+            client.close()
+        server.delete()
+    print("Passed accept batching unit test")
+
+def test_multicast_drain(packet_count=20000, burst_size=50, budgets=(0, 128)):
+    """ Sends packet_count datagrams from a Multicast_Beacon to a
+        Multicast_Receiver over loopback, burst_size at a time with one
+        Network poll per burst, and reports the packets per second received
+        and the drop rate for each datagram_budget. A budget of 0 receives
+        one datagram per poll. """
+    import timeit
+    import pride.components.base
+    import pride.components.network
+    timestamp = timeit.default_timer
+
+    class Counting_Receiver(pride.components.network.Multicast_Receiver):
+
+        predefaults = {"received_count" : 0}
+
+        def on_select(self):
+            # drain_datagrams returns the number received; recvfrom receives one
+            result = super(Counting_Receiver, self).on_select()
+            self.received_count += result if self.datagram_budget else 1
+            return result
+
+    pride.components.base._test_program()
+    network = objects["/Program/Network"]
+    payload = b'x' * 512
+    for budget in budgets:
+        receiver = Counting_Receiver(datagram_budget=budget, interface="0.0.0.0", port=0)
+        beacon = pride.components.network.Multicast_Beacon(multicast_port=receiver.port)
+        multicast_address = (beacon.multicast_group, beacon.multicast_port)
+        try:
+            beacon.sendto(payload, multicast_address)
+        except socket.error as error:
+            print("Multicast is unavailable: {}; skipping benchmark".format(error))
+            beacon.delete()
+            receiver.delete()
+            return
+        started_at = timestamp()
+        while not receiver.received_count and timestamp() - started_at < 1.0:
+            network.wait(.01)
+        if not receiver.received_count:
+            print("Multicast datagrams are not looped back; skipping benchmark")
+            beacon.delete()
+            receiver.delete()
+            return
+        receiver.received_count = 0
+
+        sent_count = 0
+        started_at = timestamp()
+        while sent_count < packet_count:
+            for count in range(burst_size):
+                try:
+                    beacon.sendto(payload, multicast_address)
+                except socket.error: # the send buffer is full
+                    break
+                sent_count += 1
+            network.wait(0.0)
+        idle_polls = 0
+        while idle_polls < 10: # collect what is still queued
+            received_count = receiver.received_count
+            network.wait(.001)
+            idle_polls = idle_polls + 1 if receiver.received_count == received_count else 0
+        elapsed = timestamp() - started_at
+        received_count = receiver.received_count
+        print("datagram_budget {}: {:.0f} packets/second; {:.1%} of {} packets dropped".format(
+              budget, received_count / elapsed, 1 - float(received_count) / sent_count, sent_count))
+        assert received_count <= sent_count
+        if budget:
+            assert receiver.datagram_count >= received_count and not receiver.truncated_count
+        beacon.delete()
+        receiver.delete()
+        assert receiver._datagram_buffer is None
+    print("Passed multicast drain unit test")
+
+def test_readiness_backends(idle_counts=(1000, 10000, 50000), hot_count=8, polls=200):
+    """ Measures the time taken by Network.wait(0.0) with each readiness
+        backend while idle_counts idle sockets and hot_count sockets that
+        receive data before every poll are added. Sizes that exceed the
+        file descriptor limit of the process are skipped. """
+    import resource
+    import timeit
+    import pride.components.base
+    import pride.components.network
+    Network = pride.components.network.Network
+    timestamp = timeit.default_timer
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard_limit != resource.RLIM_INFINITY and soft_limit < hard_limit:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+    try:
+        fd_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+        program = pride.components.base._test_program()
+        network = objects["/Program/Network"]
+        network.delete()
+        backends = [backend for backend, available in (("epoll", hasattr(select, "epoll")),
+                                                       ("poll", hasattr(select, "poll")),
+                                                       ("select", True)) if available]
+        for idle_count in idle_counts:
+            if idle_count + 2 * hot_count + 64 > fd_limit:
+                print("{} idle sockets: skipped; the file descriptor limit is {}".format(idle_count, fd_limit))
+                continue
+            for backend in backends:
+                network = program.create(Network, readiness_backend=backend, running=False)
+                assert network.reference == "/Program/Network"
+                idle_sockets = [Udp_Socket(bind_on_init=False) for count in range(idle_count)]
+                senders, hot_sockets = [], []
+                for count in range(hot_count):
+                    sender, receiver = socket.socketpair()
+                    senders.append(sender)
+                    hot_sockets.append(Tcp_Socket(wrapped_object=receiver, connected=True))
+                # select only accepts file descriptors below FD_SETSIZE, usually 1024
+                skipped = backend == "select" and max(sock.fileno() for sock in network.sockets) >= 1024
+                started_at = timestamp()
+                for count in range(0 if skipped else polls):
+                    for sender in senders:
+                        sender.send(b'x')
+                    network.wait(0.0)
+                elapsed = timestamp() - started_at
+                for sock in idle_sockets + hot_sockets:
+                    sock.delete()
+                for sender in senders:
+                    sender.close()
+                network.delete()
+                if skipped:
+                    print("{}: {} idle sockets: skipped; file descriptors are too large for select".format(backend,
+                                                                                                         idle_count))
+                else:
+                    print("{}: {} idle + {} hot sockets: {:.1f}us per poll".format(backend, idle_count, hot_count,
+                                                                                  1000000 * elapsed / polls))
+        program.create(Network)
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft_limit, hard_limit))
+
+if __name__ == "__main__":
+    test_send_queue()
+    test_queued_output_on_close()
+    test_paused_readers()
+    test_on_connect_exception()
+    test_recv_buffers()
+    test_accept_batching()
+    test_multicast_drain()
+    test_readiness_backends()
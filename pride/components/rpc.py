@@ -12,32 +12,42 @@ import pride.components.base
 import pride.components.scheduler
 import pride.components.networkssl
 import pride.components.network
+import pride.components.shard
 import pride.functions.persistence
 import pride.functions.decorators
 
 DEFAULT_SERIALIZER = pride.components.network.DEFAULT_SERIALIZER
+Pending_Result = pride.components.scheduler.Pending_Result
 
 class UnauthorizedError(Warning): pass
 
 @pride.functions.decorators.required_arguments(no_args=True)
 def remote_procedure_call(callback_name='', callback=None):
+    """ usage: @remote_procedure_call(callback_name='', callback=None)
+
+        Decorates a method of an RPC_Client so that calling it makes a
+        request to the method of the same name on the target_service.
+        The call returns a scheduler.Pending_Result for the response, which
+        is also passed to the callback, if one is specified. """
     def decorate(function):
         call_name = function.__name__
 
         @functools.wraps(function)
         def _make_rpc(self, *args, **kwargs):
+            response = Pending_Result()
             if callback_name:
-                _callback = getattr(self, callback_name)
-            else:
-                _callback = callback or None
+                response.add_callback(getattr(self, callback_name))
+            elif callback:
+                response.add_callback(callback)
 
             instruction = pride.Instruction(self.target_service, call_name, *args, **kwargs)
             if not getattr(self, "logged_in", True) and call_name not in ("register", "login", "login_stage_two"):
-                self.handle_not_logged_in(instruction, _callback)
+                self.handle_not_logged_in(instruction, response.set_result)
             else:
                 self.alert("Making request '{}.{}'".format(self.target_service, call_name),
                            level=self.verbosity.get(call_name, 'v'))
-                self.session.execute(instruction, _callback)
+                self.session.execute(instruction, response.set_result)
+            return response
         return _make_rpc
     return decorate
 
@@ -81,6 +91,50 @@ class Session(pride.components.base.Base):
         return self._callbacks.pop(0)
 
 
+def split_packets(data, data_size=None):
+    """ usage: split_packets(data, data_size=None) => (packets, remaining_data)
+
+        Splits data into the packets sent by Packet_Client.send and
+        Packet_Socket.send, which are prefixed with their size and a space.
+        remaining_data is the incomplete packet at the end of data, if any.
+
+        data may be a bytearray such as the receive buffer of a socket, of
+        which only the first data_size bytes are parsed; only the packets
+        and remaining_data are copied out of it. """
+    view = memoryview(data)
+    packets = []
+    position = 0
+    if data_size is None:
+        data_size = len(data)
+    while position < data_size:
+        separator = data.find(' ', position, data_size)
+        if separator == -1:
+            break
+        end = separator + 1 + int(view[position:separator].tobytes())
+        if end > data_size:
+            break
+        packets.append(view[separator + 1:end].tobytes())
+        position = end
+    return packets, view[position:data_size].tobytes()
+
+
+def _recv_packets(sock, buffer_size):
+    # packets are parsed out of the receive buffer of sock; only the packets
+    # themselves and any partial packet at the end are copied
+    try:
+        view = sock.recv_view(buffer_size)
+    except socket.error as error: # which error did we really intend to catch here?
+        if error.errno == pride.components.network.CONNECTION_CLOSED:
+            raise
+        view = memoryview(bytes())
+    if sock._old_data:
+        packets, sock._old_data = split_packets(sock._old_data + view.tobytes())
+    else:
+        packets, sock._old_data = split_packets(sock._recv_buffer, len(view))
+    sock.release_buffer()
+    return packets
+
+
 class Packet_Client(pride.components.networkssl.SSL_Client):
     """ An SSL_Client that uses packetized send and recv (client side) """
     defaults = {"_old_data" : bytes()}
@@ -89,30 +143,7 @@ class Packet_Client(pride.components.networkssl.SSL_Client):
         return super(Packet_Client, self).send(str(len(data)) + ' ' + data)
 
     def recv(self, buffer_size=0):
-        try:
-            data = self._old_data + super(Packet_Client, self).recv(buffer_size)
-        except socket.error as error: # which error did we really intend to catch here?
-            if error.errno == pride.components.network.CONNECTION_CLOSED:
-                raise
-            data = self._old_data
-
-        self._old_data = bytearray()
-        packets = []
-        while data:
-            try:
-                packet_size, data = data.split(' ', 1)
-            except ValueError:
-                self._old_data = data
-                break
-
-            packet_size = int(packet_size)
-            if len(data) < packet_size:
-                self._old_data = bytes(packet_size) + ' ' + data
-                break
-
-            packets.append(data[:packet_size])
-            data = data[packet_size:]
-        return packets
+        return _recv_packets(self, buffer_size)
 
 
 class Packet_Socket(pride.components.networkssl.SSL_Socket):
@@ -123,30 +154,7 @@ class Packet_Socket(pride.components.networkssl.SSL_Socket):
         return super(Packet_Socket, self).send(str(len(data)) + ' ' + data)
 
     def recv(self, buffer_size=0):
-        try:
-            data = self._old_data + super(Packet_Socket, self).recv(buffer_size)
-        except socket.error as error: # which error did we really intend to catch here?
-            if error.errno == pride.components.network.CONNECTION_CLOSED:
-                raise
-            data = self._old_data
-
-        self._old_data = bytearray()
-        packets = []
-        while data:
-            try:
-                packet_size, data = data.split(' ', 1)
-            except ValueError:
-                self._old_data = data
-                break
-
-            packet_size = int(packet_size)
-            if len(data) < packet_size:
-                self._old_data = bytes(packet_size) + ' ' + data
-                break
-
-            packets.append(data[:packet_size])
-            data = data[packet_size:]
-        return packets
+        return _recv_packets(self, buffer_size)
 
 
 class Rpc_Connection_Manager(pride.components.base.Base):
@@ -212,13 +220,13 @@ class Rpc_Client_Socket(Packet_Client):
                        level=self.verbosity["request_delayed"])
             self._requests.append((request, callback_owner))
         else:
-            self.alert("Making request for {}".format(callback_owner), level=self.verbosity["request_sent"])
+            self.lazy_alert("request_sent", "Making request for {}", callback_owner)
             self._callbacks.append(callback_owner)
             self.send(request)
 
     def recv(self, packet_count=0):
         for response in super(Rpc_Client_Socket, self).recv():
-            _response = self.deserialize(bytes(response))
+            _response = self.deserialize(response)
             callback_owner = self._callbacks.pop(0)
             try:
                 _call, callback = pride.objects[callback_owner].next_callback()
@@ -244,9 +252,18 @@ class Rpc_Client_Socket(Packet_Client):
 
 
 class Rpc_Socket(Packet_Socket):
-    """ Packetized tcp socket for receiving and delegating rpc requests """
+    """ Packetized tcp socket for receiving and delegating rpc requests.
+
+        Requests may return a scheduler.Pending_Result. Responses are sent
+        in the order the requests were received, so responses that follow a
+        Pending_Result wait until it has been resolved.
+
+        Requests are not read while more than send_high_water_mark bytes of
+        responses are waiting to be sent, so a client that does not read its
+        responses is slowed down instead of filling memory. """
 
     defaults = {"idle_after" : 600}
+    mutable_defaults = {"_pending_responses" : list}
     verbosity = {"request_exception" : 0, "request_result" : "vvv"}
 
     def __init__(self, **kwargs):
@@ -269,7 +286,7 @@ class Rpc_Socket(Packet_Socket):
         peername = self.peername
         assert self.ssl_authenticated
         for (session_id, component_name, method,
-             serialized_arguments) in (self.deserialize(bytes(packet)) for
+             serialized_arguments) in (self.deserialize(packet) for
                                        packet in super(Rpc_Socket, self).recv()):
             try:
                 result = next(self.rpc_workers).handle_request(peername, session_id, component_name,
@@ -287,9 +304,34 @@ class Rpc_Socket(Packet_Socket):
                                                                                      method, stack_trace),
                                    level=self.verbosity["request_exception"])
             else:
-                self.alert("Sending result of {}.{}: {}".format(component_name, method, result),
-                           level=self.verbosity["request_result"])
-            self.send(self.serialize(result))
+                self.lazy_alert("request_result", "Sending result of {}.{}: {}",
+                                component_name, method, result)
+            if isinstance(result, Pending_Result) or self._pending_responses:
+                if not isinstance(result, Pending_Result):
+                    response, result = result, Pending_Result()
+                    result.set_result(response)
+                self._pending_responses.append(result)
+                result.add_callback(self._send_ready_responses)
+            else:
+                self.send(self.serialize(result))
+
+    def on_send_high_water(self):
+        super(Rpc_Socket, self).on_send_high_water()
+        objects["/Program/Network"].pause_reading(self)
+
+    def on_send_low_water(self):
+        super(Rpc_Socket, self).on_send_low_water()
+        objects["/Program/Network"].resume_reading(self)
+        # data that was already decrypted does not make the socket readable
+        if self.ssl_authenticated and self.socket.pending():
+            self.on_select()
+
+    def _send_ready_responses(self, result):
+        if self.deleted:
+            return
+        pending_responses = self._pending_responses
+        while pending_responses and pending_responses[0].done:
+            self.send(self.serialize(pending_responses.pop(0).result))
 
     def delete(self):
         pride.Instruction.purge(self.reference)
@@ -303,6 +345,10 @@ class Rpc_Worker(pride.components.base.Base):
 
     def handle_request(self, peername, session_id, component_name, method,
                        serialized_arguments):
+        if pride.components.shard.is_remote(component_name):
+            return pride.objects["/Program/Shard_Manager"].call(component_name, self.reference, "handle_request",
+                                                                peername, session_id, component_name,
+                                                                method, serialized_arguments)
         instance = pride.objects[component_name]
         if not instance.validate(session_id, peername, method):
             raise UnauthorizedError()
@@ -404,8 +450,7 @@ class RPC_Service(pride.components.base.Base):
                     self.alert(message, level=self.verbosity["validate_failure"])
                     return False
 
-        self.alert("Authorizing: {} for {}".format(peername, method_name),
-                  level=self.verbosity["validate_success"])
+        self.lazy_alert("validate_success", "Authorizing: {} for {}", peername, method_name)
         return True
 
     def execute_remote_procedure_call(self, session_id, peername, method_name, args, kwargs):
@@ -413,14 +458,11 @@ class RPC_Service(pride.components.base.Base):
             self.current_session = (session_id, peername)
             return getattr(self, method_name)(*args, **kwargs)
 
-    def __getstate__(self):
-        state = super(RPC_Service, self).__getstate__()
-        del state["database"]
-        return state
-
     def on_load(self, attributes):
         super(RPC_Service, self).on_load(attributes)
-        self._load_database()
+        # Base.save restores the database as a child, unless it was not saved
+        if self.database is None:
+            self._load_database()
 
 
 class RPC_Client(pride.components.base.Base):
@@ -439,3 +481,17 @@ class RPC_Client(pride.components.base.Base):
     def __init__(self, **kwargs):
         super(RPC_Client, self).__init__(**kwargs)
         self.session = self.create("pride.components.rpc.Session", session_id='0', host_info=self.host_info)
+
+
+def test_split_packets():
+    packets = ("first", "", "third packet")
+    data = ''.join(str(len(packet)) + ' ' + packet for packet in packets)
+    assert split_packets(data) == (list(packets), '')
+    assert split_packets(data + "12 partial") == (list(packets), "12 partial")
+    buffer = bytearray(data + "unused buffer space")
+    assert split_packets(buffer, len(data)) == (list(packets), '')
+    assert split_packets(buffer, len(data) - 2) == (list(packets[:2]), "12 third pack")
+    print("Passed split_packets unit test")
+
+if __name__ == "__main__":
+    test_split_packets()
@@ -3,16 +3,20 @@ import random
 import hashlib
 import os
 import getpass
+import traceback
 
 from pride import Instruction
 import pride.components.rpc
 import pride.functions.security
 import pride.functions.decorators
 import pride.functions.utilities
+import pride.functions.contextmanagers
+import pride.components.scheduler
 from pride.functions.security import hash_function
 from pride.errors import SecurityError, UnauthorizedError
 
 remote_procedure_call = pride.components.rpc.remote_procedure_call
+Pending_Result = pride.components.scheduler.Pending_Result
 
 class Authenticated_Service(pride.components.rpc.RPC_Service):
     """ Faq: My new authenticated service keeps raising UnauthorizedErrors
@@ -25,6 +29,10 @@ class Authenticated_Service(pride.components.rpc.RPC_Service):
                 "sub_algorithm" : "sha512", "salt_size" : 16, "output_size" : 32,
                 "session_id_size" : 16,
 
+                # reference of a workerpool.Process_Pool to hash passwords in
+                # when set, login and register return a Pending_Result
+                "process_pool" : '',
+
                 # chooses whether or not to hash passwords for invalid registration attempts
                 # if False and a registration request fails, the hashing step will be skipped
                 "constant_time_registration" : True,
@@ -90,14 +98,26 @@ class Authenticated_Service(pride.components.rpc.RPC_Service):
         if identifier_in_use:
             if self.constant_time_registration:
                 verifier_hash = self._hash_password(password_verifier, salt)
+                return self._then(verifier_hash, lambda verifier_hash: self.register_failure(identifier))
             return self.register_failure(identifier)
         else:
             verifier_hash = self._hash_password(password_verifier, salt)
-            self.database.insert_into("Users", (identifier, verifier_hash, salt))
-            return self.register_success(identifier)
+            return self._then(verifier_hash, self._store_verifier_hash, identifier, salt)
+
+    def _store_verifier_hash(self, verifier_hash, identifier, salt):
+        # when hashing in the process_pool, another registration for the same
+        # identifier may have been stored while this hash was being computed
+        if self.database.query("Users", retrieve_fields=("identifier", ),
+                                        where={"identifier" : identifier}):
+            return self.register_failure(identifier)
+        self.database.insert_into("Users", (identifier, verifier_hash, salt))
+        return self.register_success(identifier)
 
     def change_credentials(self, new_identifier, new_password_verifier):
         result = self.register(new_identifier, new_password_verifier)
+        return self._then(result, self._remove_old_credentials)
+
+    def _remove_old_credentials(self, result):
         if result[0]:
             self.database.delete_from("Users", where={"identifier" : self.current_user})
         return result
@@ -148,14 +168,17 @@ class Authenticated_Service(pride.components.rpc.RPC_Service):
             #       - print does not happen until well after the code is executed
             #self.alert("Login failure; {} does not exist".format(username),
             #           level=0)#self.verbosity["username_does_not_exist"])
-            return self.login_failure(username)
+            return self._then(constant_time, lambda constant_time: self.login_failure(username))
         else:
             password_hash = self._hash_password(password, salt)
-            if pride.functions.security.constant_time_comparison(password_hash, correct_hash):
-                return self.login_success(username)
-            else:
-                #self.alert("Login failure; invalid hash:\n{}\ncorrect hash:\n{}".format(password_hash, correct_hash))
-                return self.login_failure(username)
+            return self._then(password_hash, self._compare_password_hash, username, correct_hash)
+
+    def _compare_password_hash(self, password_hash, username, correct_hash):
+        if pride.functions.security.constant_time_comparison(password_hash, correct_hash):
+            return self.login_success(username)
+        else:
+            #self.alert("Login failure; invalid hash:\n{}\ncorrect hash:\n{}".format(password_hash, correct_hash))
+            return self.login_failure(username)
 
 
     def login_success(self, username):
@@ -187,9 +210,41 @@ class Authenticated_Service(pride.components.rpc.RPC_Service):
         return False, self.login_failure_message.format(self.reference, username, user_ip), '0'
 
     def _hash_password(self, password, salt):
+        if self.process_pool:
+            try:
+                pool = pride.objects[self.process_pool]
+            except KeyError:
+                pass
+            else:
+                return pool.submit(pride.functions.security.hash_password, password, self.iterations,
+                                   algorithm=self.password_hashing_algorithm, sub_algorithm=self.sub_algorithm,
+                                   salt=salt, output_size=self.output_size)
         return pride.functions.security.hash_password(password, self.iterations, algorithm=self.password_hashing_algorithm,
                                                                        sub_algorithm=self.sub_algorithm,
                                                                        salt=salt, output_size=self.output_size)
+
+    def _then(self, value, function, *args):
+        """ Returns function(value, *args). If value is a Pending_Result,
+            returns a Pending_Result for the return value of function instead,
+            which is called once value is resolved, with the current_session
+            of the request restored. """
+        if not isinstance(value, Pending_Result):
+            return function(value, *args)
+        session = self.current_session
+        result = Pending_Result()
+        def _continue(value):
+            with pride.functions.contextmanagers.backup(self, "current_session"):
+                self.current_session = session
+                try:
+                    if isinstance(value, Exception):
+                        raise value
+                    response = function(value, *args)
+                except Exception as error:
+                    error.traceback = getattr(error, "traceback", None) or traceback.format_exc()
+                    response = error
+            result.set_result(response)
+        value.add_callback(_continue)
+        return result
     def logout(self):
         """ usage:
 
@@ -512,5 +567,31 @@ def test_Authenticated_Service3():
 
     client.change_credentials()
 
+def test_concurrent_registration():
+    import tempfile
+    import pride.components.scheduler
+    import pride.components.workerpool
+    processor = pride.components.scheduler.Processor()
+    pool = pride.components.workerpool.Thread_Pool(thread_count=2)
+    service = Authenticated_Service(process_pool=pool.reference, iterations=1000,
+                                    database_name=os.path.join(tempfile.mkdtemp(), "users.db"))
+    results = []
+    def callback(result):
+        results.append(result)
+        if len(results) == 2:
+            raise SystemExit()
+    for count in range(2):
+        service.register("concurrent_registration_unit_test", "verifier").add_callback(callback)
+    processor.running = True
+    try:
+        processor.run()
+    except SystemExit:
+        pass
+    assert sorted(success for success, message in results) == [False, True], results
+    for component in (service, pool, processor):
+        component.delete()
+    print("Passed concurrent registration unit test")
+
 if __name__ == "__main__":
+    test_concurrent_registration()
     test_Authenticated_Service3()
@@ -22,6 +22,7 @@ from functools import partial
 
 import pride
 import pride.components.base
+import pride.components.datastructures
 
 Instruction = pride.Instruction
 timestamp = timeit.default_timer
@@ -70,8 +71,7 @@ class Process(pride.components.base.Base):
             result = self.run()
         if self.running:
             if self.run_condition and not getattr(self, self.run_condition):
-                self.alert("Run condition False; Not running",
-                           level=self.verbosity["run_condition_false"])
+                self.lazy_alert("run_condition_false", "Run condition False; Not running")
             else:
                 self.run_instruction.execute(priority=self.priority,
                                              callback=self.run_callback)
@@ -111,19 +111,89 @@ class Process(pride.components.base.Base):
             self.run_instruction.execute(priority=self.priority)
 
 
+class Pending_Result(object):
+    """ usage: Pending_Result() => pending_result
+
+        Stands in for the return value of a call whose result will be
+        available later, such as a call made on a workerpool.Thread_Pool.
+        When the method of an Instruction returns a Pending_Result, the
+        Processor passes the Instruction callback to add_callback instead
+        of calling it with the Pending_Result. """
+
+    def __init__(self):
+        super(Pending_Result, self).__init__()
+        self.done = False
+        self.result = None
+        self.callbacks = []
+
+    def add_callback(self, callback):
+        """ usage: pending_result.add_callback(callback)
+
+            callback will be called with the result once it is available.
+            If the result is already available, callback is called immediately. """
+        if self.done:
+            callback(self.result)
+        else:
+            self.callbacks.append(callback)
+
+    def set_result(self, result):
+        """ usage: pending_result.set_result(result)
+
+            Stores the result and calls the callbacks with it. Should be
+            called from the Processor thread. """
+        self.result = result
+        self.done = True
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(result)
+
+
 class Processor(Process):
-    """ Removes enqueued Instructions via heapq.heappop, then
+    """ Removes enqueued Instructions from the instruction queue, then
         performs the specified method call while handling the
         possibility of the specified component/method not existing,
         and any exception that could be raised inside the method call
-        itself."""
+        itself.
+
+        The instruction queue is a heap by default. Setting queue_type to
+        "timing_wheel" installs a Timing_Wheel instead, which has O(1)
+        insertion; tick_resolution, wheel_slot_count and wheel_level_count
+        configure the wheel.
+
+        By default the Processor sleeps until the next Instruction is due.
+        When wait_for_sockets is True, it instead waits on the sockets of
+        the Network component specified by network_reference, handling
+        them as soon as they are ready. The Network then no longer polls on
+        its own.
 
-    defaults = {"running" : False}
+        When record_statistics is True, the Processor records how late each
+        Instruction runs and how long each component method takes in the
+        Scheduler_Stats component specified by statistics_reference. The
+        setting is read when run is called. """
+
+    defaults = {"running" : False, "queue_type" : "heap",
+                "tick_resolution" : .001, "wheel_slot_count" : 256,
+                "wheel_level_count" : 3, "wait_for_sockets" : False,
+                "network_reference" : "/Program/Network",
+                "record_statistics" : False,
+                "statistics_reference" : "/Program/Scheduler_Stats"}
+
+    allowed_values = {"queue_type" : ("heap", "timing_wheel")}
 
     parser_modifiers = {"exit_on_help" : False}
 
     verbosity = {"instruction_execution" : "instruction_execution", "component_alert" : 0,
-                 "exception_alert" : 0, "callback_exception" : 0}
+                 "exception_alert" : 0, "callback_exception" : 0,
+                 "network_unavailable" : 0, "statistics_unavailable" : 0}
+
+    def __init__(self, **kwargs):
+        super(Processor, self).__init__(**kwargs)
+        if self.queue_type == "timing_wheel":
+            Timing_Wheel = pride.components.datastructures.Timing_Wheel
+            wheel = Timing_Wheel(resolution=self.tick_resolution,
+                                 slot_count=self.wheel_slot_count,
+                                 level_count=self.wheel_level_count)
+            Instruction.set_queue(wheel, Timing_Wheel.push, Timing_Wheel.pop, Timing_Wheel.peek)
 
     def run(self):
         self._return = {}
@@ -131,41 +201,102 @@ class Processor(Process):
         objects = pride.objects
 
         sleep = time.sleep
-        heappop = heapq.heappop
+        pop = pride.Instruction._pop
+        peek = pride.Instruction._peek
+        remove_from_index = pride.Instruction._remove_from_index
         _getattr = getattr
 
         component_errors = (AttributeError, KeyError)
         reraise_exceptions = (SystemExit, KeyboardInterrupt)
-        alert = self.alert
+        lazy_alert = self.lazy_alert
         verbosity = self.verbosity
         exception_message = "\nException encountered when processing {0}.{1}\n{2}"
         callback_message = "Exception in callback '{}'"
 
+        wait = None
+        if self.wait_for_sockets:
+            try:
+                network = objects[self.network_reference]
+            except KeyError:
+                self.alert("Unable to wait for sockets; '{}' does not exist".format(self.network_reference),
+                           level=verbosity["network_unavailable"])
+            else:
+                network.running = False # the network is handled here instead
+                wait = network.wait
+                network_reference = network.reference
+
+        record_statistics = False
+        if self.record_statistics:
+            try:
+                statistics = objects[self.statistics_reference]
+            except KeyError:
+                self.alert("Unable to record statistics; '{}' does not exist".format(self.statistics_reference),
+                           level=verbosity["statistics_unavailable"])
+            else:
+                record_statistics = True
+                lag_histogram = statistics.lag
+                method_histograms = statistics.methods
+                Histogram = pride.components.datastructures.Histogram
+
         format_traceback = traceback.format_exc
         result = null_result = [] # a unique object
-        while instructions and self.running:
+        while self.running:
             try:
                 while True:
+                    if not instructions:
+                        if wait is None or not network.sockets:
+                            return
+                        # exceptions from socket handlers are reported as Network.wait
+                        component_name, method, callback = network_reference, "wait", None
+                        wait(None)
+                        continue
+
+                    # the entry stays queued until it is due: ready sockets may
+                    # schedule instructions that are due sooner than this one
+                    entry = peek(instructions)
+                    if entry[-1]:
+                        time_until = entry[0] - timestamp()
+                        if time_until > 0:
+                            if wait is None:
+                                sleep(time_until)
+                            else:
+                                component_name, method, callback = network_reference, "wait", None
+                                wait(time_until)
+                            continue
+
+                    entry = pop(instructions)
                     (execute_at, instruction, callback,
                      component_name, method, args, kwargs,
-                     execute_flag) = heappop(instructions)
+                     execute_flag) = entry
 
                     if execute_flag: # facilitates Instruction.purge and Instruction.unschedule
-                        call = _getattr(objects[component_name], method)
+                        remove_from_index(entry)
+                        instance = objects[component_name]
+                        call = _getattr(instance, method)
 
-                        time_until = max(0, (execute_at - timestamp()))
-                        if time_until:
-                            sleep(time_until)
+                        lazy_alert("instruction_execution", "executing instruction {}", instruction)
 
-                        alert("executing instruction {}".format(instruction),
-                              level=verbosity["instruction_execution"])
+                        if record_statistics:
+                            started_at = timestamp()
+                            lag_histogram.add(started_at - execute_at)
 
                         if callback:
                             result = call(*args, **kwargs)
-                            callback(result)
+                            if isinstance(result, Pending_Result):
+                                result.add_callback(callback)
+                            else:
+                                callback(result)
                             result = null_result
                         else:
                             call(*args, **kwargs)
+
+                        if record_statistics:
+                            key = (instance.__class__.__name__, method)
+                            try:
+                                histogram = method_histograms[key]
+                            except KeyError:
+                                histogram = method_histograms[key] = Histogram()
+                            histogram.add(timestamp() - started_at)
             except KeyError:
                 if component_name in objects:
                     if callback:
@@ -225,3 +356,88 @@ class Idle_Process(Process):
             self.single_callbacks.append((reference, method_name))
         else:
             self.callbacks.append((reference, method_name))
+
+
+def test_instruction_queue_throughput(sizes=(1000, 100000, 1000000),
+                                      operations=100000):
+    """ Measures pop + push throughput of the heap and Timing_Wheel instruction
+        queues while the specified numbers of instructions are pending.
+        Popped entries are rescheduled, as recurring Processes do. """
+    import random
+    Timing_Wheel = pride.components.datastructures.Timing_Wheel
+    instruction = Instruction("/Program/Test_Component", "run")
+    backends = (("heap", list, heapq.heappush, heapq.heappop),
+                ("timing_wheel", Timing_Wheel, Timing_Wheel.push, Timing_Wheel.pop))
+    for size in sizes:
+        now = timestamp()
+        deadlines = [now + random.uniform(0, 60) for count in range(size)]
+        delays = [random.uniform(0, 60) for count in range(operations)]
+        for name, queue_type, push, pop in backends:
+            queue = queue_type()
+            for deadline in deadlines:
+                push(queue, [deadline, instruction, None, instruction.component_name,
+                             instruction.method, instruction.args,
+                             instruction.kwargs, True])
+            started_at = timestamp()
+            for delay in delays:
+                entry = pop(queue)
+                entry[0] += delay
+                push(queue, entry)
+            elapsed = timestamp() - started_at
+            print("{}: {} pending: {:.0f} instructions/second".format(name, size,
+                                                                     operations / elapsed))
+
+def test_wait_for_sockets(queue_types=("heap", "timing_wheel")):
+    """ Checks that an Instruction scheduled by a socket handler while the
+        Processor waits on sockets runs before an Instruction that was
+        already pending but is due later. """
+    import operator
+    import pride.components.network
+    pride.components.base._test_program()
+    network = pride.objects["/Program/Network"]
+
+    class Recorder(pride.components.base.Base):
+
+        mutable_defaults = {"records" : list}
+
+        def record(self, label):
+            self.records.append((label, timestamp()))
+
+        def stop(self):
+            raise SystemExit()
+
+    class Receiver(pride.components.network.Udp_Socket):
+
+        defaults = {"recorder" : ''}
+
+        def recvfrom(self, buffer_size=0):
+            result = super(Receiver, self).recvfrom(buffer_size)
+            Instruction(self.recorder, "record", "received").execute()
+            return result
+
+    for queue_type in queue_types:
+        processor = Processor(queue_type=queue_type, wait_for_sockets=True,
+                              network_reference=network.reference)
+        recorder = Recorder()
+        receiver = Receiver(recorder=recorder.reference, interface="127.0.0.1", port=0)
+        sender = pride.components.network.Udp_Socket(interface="127.0.0.1", port=0)
+        started_at = timestamp()
+        Instruction(recorder.reference, "stop").execute(priority=1.0)
+        Instruction(sender.reference, "sendto", b'x', ("127.0.0.1", receiver.port)).execute(priority=.05)
+        processor.running = True
+        try:
+            processor.run()
+        except SystemExit:
+            pass
+        assert [label for label, time in recorder.records] == ["received"], (queue_type, recorder.records)
+        latency = recorder.records[0][1] - started_at - .05
+        assert latency < .1, (queue_type, latency)
+        for component in (sender, receiver, recorder, processor):
+            component.delete()
+    Instruction.set_queue([], heapq.heappush, heapq.heappop, operator.itemgetter(0))
+    network.running = True
+    print("Passed wait_for_sockets unit test")
+
+if __name__ == "__main__":
+    test_wait_for_sockets()
+    test_instruction_queue_throughput()
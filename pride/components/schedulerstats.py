@@ -0,0 +1,92 @@
+""" pride.components.schedulerstats - Scheduling lag and per method execution
+    time recorded by the Processor. """
+import pride
+import pride.components.rpc
+import pride.components.datastructures
+
+class Scheduler_Stats(pride.components.rpc.RPC_Service):
+    """ Stores the statistics recorded by a Processor with record_statistics
+        enabled. lag is a datastructures.Histogram of the seconds between when
+        Instructions were due and when they ran; methods maps
+        (component class name, method name) to a Histogram of the seconds each
+        call took, including the callback of the Instruction.
+
+        summary and lag_summary may also be called remotely. """
+
+    mutable_defaults = {"lag" : pride.components.datastructures.Histogram,
+                        "methods" : dict}
+
+    remotely_available_procedures = ("summary", "lag_summary")
+
+    summary_fields = ("class", "method", "count", "total", "average",
+                      "maximum", "99th_percentile")
+
+    def summary(self, sort_by="total", count=10):
+        """ usage: scheduler_stats.summary(sort_by="total", count=10) => rows
+
+            Returns up to count (class, method, count, total, average,
+            maximum, 99th_percentile) tuples, largest first according to
+            the field named by sort_by. Times are in seconds. """
+        rows = [(class_name, method, histogram.count, histogram.total,
+                 histogram.average, histogram.maximum, histogram.percentile(.99)) for
+                ((class_name, method), histogram) in self.methods.items()]
+        index = self.summary_fields.index(sort_by)
+        rows.sort(key=lambda row: row[index], reverse=True)
+        return rows[:count]
+
+    def lag_summary(self):
+        """ usage: scheduler_stats.lag_summary() => (count, average, maximum,
+                                                     median, 99th_percentile)
+
+            Summarizes how late Instructions ran, in seconds. """
+        lag = self.lag
+        return (lag.count, lag.average, lag.maximum,
+                lag.percentile(.5), lag.percentile(.99))
+
+    def reset(self):
+        self.lag.clear()
+        self.methods.clear()
+
+
+def test_Scheduler_Stats():
+    import time
+    import pride.components.base
+    import pride.components.scheduler
+
+    class Slow_Component(pride.components.base.Base):
+
+        def slow(self):
+            time.sleep(.01)
+
+        def fast(self):
+            pass
+
+        def stop(self):
+            raise SystemExit()
+
+    stats = Scheduler_Stats()
+    processor = pride.components.scheduler.Processor(record_statistics=True,
+                                                     statistics_reference=stats.reference)
+    component = Slow_Component()
+    for count in range(5):
+        pride.Instruction(component.reference, "slow").execute(priority=count * .02)
+        pride.Instruction(component.reference, "fast").execute(priority=count * .02)
+    pride.Instruction(component.reference, "stop").execute(priority=.2)
+    processor.running = True
+    try:
+        processor.run()
+    except SystemExit:
+        pass
+
+    rows = stats.summary()
+    assert rows[0][:3] == ("Slow_Component", "slow", 5), rows
+    assert rows[0][3] >= .05
+    lag_count, lag_average, lag_maximum, lag_median, lag_99 = stats.lag_summary()
+    assert lag_count == 11
+    for row in rows:
+        print(row)
+    print("lag: count {} average {:.6f}s maximum {:.6f}s".format(lag_count, lag_average, lag_maximum))
+    stats.delete()
+
+if __name__ == "__main__":
+    test_Scheduler_Stats()
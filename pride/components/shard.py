@@ -0,0 +1,370 @@
+""" pride.components.shard - Runs a Program as several processes, with
+    components pinned to a process by reference prefix. """
+import os
+import socket
+import struct
+import traceback
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import pride
+import pride.components.base
+import pride.components.network
+import pride.components.scheduler
+
+Pending_Result = pride.components.scheduler.Pending_Result
+
+HEADER = struct.Struct("!I")
+
+def is_remote(reference):
+    """ usage: is_remote(reference) => bool
+
+        Returns True if the component with the specified reference is
+        pinned to a different shard than the current process. """
+    return reference.startswith(pride.Instruction._remote_prefixes)
+
+
+class Shard_Channel(pride.components.network.Tcp_Socket):
+    """ One end of the unix socket pair that connects two shards. Messages
+        are pickled and prefixed with their length. """
+
+    # shutdown would also close the end of the pair held by forked processes
+    defaults = {"shard_index" : 0, "socket_family" : socket.AF_UNIX,
+                "shutdown_on_close" : False}
+
+    predefaults = {"_partial_message" : bytes(), "connected" : True}
+
+    verbosity = {"recv_eof" : 'v'}
+
+    def recv(self, buffer_size=0):
+        # messages are parsed out of the receive buffer; only the messages
+        # themselves and any partial message at the end are copied
+        data = self.recv_view(buffer_size)
+        if self._partial_message:
+            data = memoryview(self._partial_message + data.tobytes())
+        header_size = HEADER.size
+        manager = pride.objects[self.parent_name]
+        position, data_size = 0, len(data)
+        while data_size - position >= header_size:
+            message_size = HEADER.unpack_from(data, position)[0]
+            end = position + header_size + message_size
+            if end > data_size:
+                break
+            manager.handle_message(data[position + header_size:end].tobytes(), self.shard_index)
+            position = end
+        self._partial_message = data[position:].tobytes()
+        self.release_buffer()
+
+    def send_message(self, message):
+        self.send(HEADER.pack(len(message)) + message)
+
+    def delete(self):
+        try:
+            manager = pride.objects[self.parent_name]
+        except KeyError:
+            manager = None
+        super(Shard_Channel, self).delete()
+        if manager is not None:
+            manager.channel_closed(self.shard_index)
+
+
+class Shard_Manager(pride.components.base.Base):
+    """ Starts shard_count - 1 worker processes when shard_count is greater
+        than 1. The original process is shard 0.
+
+        Components are pinned to a shard by reference prefix via affinity,
+        a sequence of (reference_prefix, shard_index) pairs; references that
+        match no prefix belong to shard 0. Each worker shard has its own
+        Processor and pride.objects, inherited from the main process when the
+        shard was forked. A worker creates the Program startup components
+        that are pinned to it, along with shard_components, then runs.
+
+        In a worker shard, references that match no prefix are local, so
+        each shard uses its own Processor, Network and so on; components of
+        shard 0 that workers need to reach should be pinned to shard 0
+        explicitly.
+
+        Instructions for components pinned to another shard are sent to that
+        shard over a unix socket, and their callbacks are called with the
+        result when it is returned. Arguments and return values must be
+        picklable. Worker shards are only connected to shard 0, which relays
+        messages between workers.
+
+        Shard_Manager should be created by the Program before the components
+        that open sockets, so that forked workers do not share them. """
+
+    defaults = {"shard_count" : 1, "affinity" : tuple(),
+                "shard_components" : ("pride.components.rpc.Rpc_Worker", ),
+                "pickle_protocol" : 2}
+
+    predefaults = {"shard_index" : 0, "_request_counter" : 0}
+
+    mutable_defaults = {"_callbacks" : dict, "channels" : dict, "pids" : dict}
+
+    verbosity = {"shard_started" : 'v', "shard_stopped" : 'v',
+                 "unpicklable_message" : 0, "call_exception" : 0,
+                 "unknown_shard" : 0}
+
+    def __init__(self, **kwargs):
+        super(Shard_Manager, self).__init__(**kwargs)
+        if self.shard_count > 1:
+            self.start_shards()
+
+    def shard_of(self, reference):
+        """ usage: shard_manager.shard_of(reference) => shard_index
+
+            Returns the index of the shard that the reference is pinned to.
+            The longest matching prefix in affinity is used. """
+        shard_index, match_size = 0, -1
+        for prefix, index in self.affinity:
+            if len(prefix) > match_size and reference.startswith(prefix):
+                shard_index, match_size = index, len(prefix)
+        return shard_index
+
+    def is_local_type(self, component_type):
+        """ usage: shard_manager.is_local_type(component_type) => bool
+
+            Returns True if a component of component_type created by the
+            parent of the Shard_Manager belongs in the current shard.
+            component_type is a dotted string as in Program.startup_components """
+        name = self.parent_name + '/' + component_type.rsplit('.', 1)[-1]
+        return self.shard_of(name) == self.shard_index
+
+    def start_shards(self):
+        for shard_index in range(1, self.shard_count):
+            parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            pid = os.fork()
+            if pid:
+                child_end.close()
+                self.pids[shard_index] = pid
+                self._add_channel(shard_index, parent_end)
+                self.alert("Started shard {} as process {}".format(shard_index, pid),
+                           level=self.verbosity["shard_started"])
+            else:
+                pride.objects["/Alert_Handler"].reset_after_fork()
+                parent_end.close()
+                # the epoll instance of the Network is shared with the parent
+                network = pride.objects.get("/Program/Network")
+                if network is not None:
+                    network.reset_poller()
+                # the channels to previously started shards belong to shard 0
+                channels = list(self.channels.values())
+                self.channels.clear()
+                for channel in channels:
+                    channel.delete()
+                self.pids.clear()
+                self.shard_index = shard_index
+                self._add_channel(0, child_end)
+                self._run_shard()
+        self._update_routes()
+
+    def _add_channel(self, shard_index, _socket):
+        self.channels[shard_index] = self.create(Shard_Channel, wrapped_object=_socket,
+                                                 shard_index=shard_index)
+
+    def _update_routes(self):
+        prefixes = tuple(prefix for prefix, shard_index in self.affinity if
+                         shard_index != self.shard_index)
+        pride.Instruction._remote_prefixes = prefixes
+        pride.Instruction._route = staticmethod(self.route)
+
+    def _run_shard(self):
+        # does not return; the worker exits when its Processor stops
+        self._update_routes()
+        parent = self.parent
+        startup_components = getattr(parent, "startup_components", ())
+        for component_type in startup_components + self.shard_components:
+            reference = self.parent_name + '/' + component_type.rsplit('.', 1)[-1]
+            if (reference not in pride.objects and reference not in pride.objects.factories and
+                (self.is_local_type(component_type) or component_type in self.shard_components)):
+                parent.create(component_type)
+        exit_code = 0
+        try:
+            processor = pride.objects[parent.processor]
+            processor.running = True
+            processor.run()
+        except SystemExit as error:
+            exit_code = error.code if isinstance(error.code, int) else 0
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            pride.objects["/Finalizer"].run()
+            pride.objects["/Alert_Handler"].flush() # atexit functions do not run
+        os._exit(exit_code)
+
+    def route(self, instruction, priority, callback):
+        """ usage: shard_manager.route(instruction, priority, callback) => bool
+
+            Sends the instruction to the shard its component is pinned to.
+            Returns False if the component belongs to the current shard.
+            Called by Instruction.execute. """
+        shard_index = self.shard_of(instruction.component_name)
+        if shard_index == self.shard_index:
+            return False
+        self._send_call(shard_index, callback, priority, instruction.component_name,
+                        instruction.method, instruction.args, instruction.kwargs)
+        return True
+
+    def call(self, shard_reference, component_name, method, *args, **kwargs):
+        """ usage: shard_manager.call(shard_reference, component_name, method,
+                                      *args, **kwargs) => pending_result
+
+            Calls component_name.method(*args, **kwargs) on the shard that
+            shard_reference is pinned to. Exceptions raised by the call are
+            returned as the result. """
+        pending_result = Pending_Result()
+        self._send_call(self.shard_of(shard_reference), pending_result.set_result, 0.0,
+                        component_name, method, args, kwargs)
+        return pending_result
+
+    def _send_call(self, shard_index, callback, priority, component_name, method, args, kwargs):
+        if callback is None:
+            request_id = 0
+        else:
+            self._request_counter = request_id = self._request_counter + 1
+            self._callbacks[request_id] = callback
+        self._send(shard_index, ("call", request_id,
+                                 (priority, component_name, method, args, kwargs)))
+
+    def _send(self, shard_index, message):
+        message = (shard_index, self.shard_index) + message
+        try:
+            data = pickle.dumps(message, self.pickle_protocol)
+        except Exception as error:
+            self.alert("Unable to send message to shard {}: {}".format(shard_index, error),
+                       level=self.verbosity["unpicklable_message"])
+            callback = self._callbacks.pop(message[3], None)
+            if callback is not None:
+                callback(error)
+            return
+        self._send_data(shard_index, data)
+
+    def _send_data(self, shard_index, data):
+        # worker shards are only connected to shard 0
+        try:
+            channel = self.channels[shard_index if not self.shard_index else 0]
+        except KeyError:
+            self.alert("Shard {} does not exist".format(shard_index),
+                       level=self.verbosity["unknown_shard"])
+        else:
+            channel.send_message(data)
+
+    def handle_message(self, data, from_shard):
+        """ Called by a Shard_Channel for each message it receives """
+        destination, origin, kind, request_id, payload = pickle.loads(data)
+        if destination != self.shard_index:
+            self._send_data(destination, data)
+        elif kind == "call":
+            priority, component_name, method, args, kwargs = payload
+            if priority > 0:
+                pride.Instruction(self.reference, "_execute_call", origin, request_id,
+                                  component_name, method, args, kwargs).execute(priority=priority)
+            else:
+                self._execute_call(origin, request_id, component_name, method, args, kwargs)
+        else:
+            self._callbacks.pop(request_id)(payload)
+
+    def _execute_call(self, origin, request_id, component_name, method, args, kwargs):
+        try:
+            result = getattr(pride.objects[component_name], method)(*args, **kwargs)
+        except Exception as error:
+            error.traceback = traceback.format_exc()
+            self.alert("Exception calling {}.{} for shard {}:\n{}".format(component_name, method,
+                                                                         origin, error.traceback),
+                       level=self.verbosity["call_exception"])
+            result = error
+        if request_id:
+            if isinstance(result, Pending_Result):
+                result.add_callback(lambda result: self._send(origin, ("result", request_id, result)))
+            else:
+                self._send(origin, ("result", request_id, result))
+
+    def channel_closed(self, shard_index):
+        """ Called when the channel to shard_index closes. A worker shard
+            exits when its channel to shard 0 closes. """
+        if self.channels.pop(shard_index, None) is None:
+            return
+        if self.shard_index:
+            raise SystemExit()
+        pid = self.pids.pop(shard_index, None)
+        if pid is not None:
+            os.waitpid(pid, 0)
+            self.alert("Shard {} stopped".format(shard_index),
+                       level=self.verbosity["shard_stopped"])
+
+    def delete(self):
+        for channel in list(self.channels.values()):
+            channel.delete()
+        pride.Instruction._remote_prefixes = ()
+        super(Shard_Manager, self).delete()
+
+
+def test_Shard_Manager():
+    import pride.functions.contextmanagers
+    import pride.components.shard
+    backup = pride.functions.contextmanagers.backup
+    Shard_Manager = pride.components.shard.Shard_Manager
+
+    class Program(pride.components.base.Base):
+        defaults = {"startup_components" : ("pride.components.scheduler.Processor",
+                                            "pride.components.network.Network",
+                                            "pride.components.shard.Shard_Manager",
+                                            "pride.components.base.Base")}
+
+        def __init__(self, **kwargs):
+            super(Program, self).__init__(**kwargs)
+            for component_type in self.startup_components:
+                if (getattr(self, "shard_manager", '') and
+                    not pride.objects[self.shard_manager].is_local_type(component_type)):
+                    continue
+                component = self.create(component_type)
+                setattr(self, component.__class__.__name__.lower(), component.reference)
+
+    with backup(Shard_Manager, "defaults"):
+        Shard_Manager.defaults = dict(Shard_Manager.defaults, shard_count=2,
+                                      affinity=(("/Program/Base", 1), ),
+                                      shard_components=())
+        program = Program()
+    manager = pride.objects[program.shard_manager]
+    assert "/Program/Base" not in pride.objects
+    assert is_remote("/Program/Base") and not is_remote("/Program/Network")
+
+    results = []
+    def callback(result):
+        results.append(result)
+        if len(results) == 2:
+            raise SystemExit()
+    pride.Instruction("/Program/Base", "__getattribute__", "reference").execute(callback=callback)
+    manager.call("/Program/Base", manager.reference, "__getattribute__",
+                 "shard_index").add_callback(callback)
+    processor = pride.objects[program.processor]
+    processor.running = True
+    try:
+        processor.run()
+    except SystemExit:
+        pass
+    assert results == ["/Program/Base", 1], results
+    manager.delete()
+    assert not manager.pids
+    print("Passed Shard_Manager unit test")
+
+def test_alert_handler_after_fork():
+    alert_handler = pride.objects["/Alert_Handler"]
+    message = "alert handler after fork unit test {}".format(os.getpid())
+    with alert_handler._log_lock: # as if the writer thread was writing during the fork
+        pid = os.fork()
+        if not pid:
+            alert_handler.reset_after_fork()
+            alert_handler.append_to_log(message, 0)
+            alert_handler.flush()
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert message in alert_handler.dump_log(lines=100)
+    print("Passed Alert_Handler after fork unit test")
+
+if __name__ == "__main__":
+    test_Shard_Manager()
+    test_alert_handler_after_fork()
@@ -70,6 +70,7 @@ class User(pride.components.base.Base):
                 "logged_in" : False,
 
                 "storage_reference" : "/Program/Persistent_Storage",
+                "process_pool" : "/Program/Process_Pool",
                 "password_prompt" : "{}: Please enter the password for '{}': ",
                 "auto_register" : False, "auto_login" : True, "prompt_flag" : True,
                 "prompt_for_creds" : True}
@@ -230,6 +231,27 @@ class User(pride.components.base.Base):
             encryption key is used to decrypt the data. """
         return pride.functions.security.decrypt(packed_encrypted_data, self.data_encryption_key, self.data_mac_key)
 
+    def encrypt_in_pool(self, data, extra_data=''):
+        """ usage: pride.objects["/User"].encrypt_in_pool(data, extra_data='') => pending_result
+
+            Encrypts data in the same manner as encrypt, but in the
+            workerpool.Process_Pool specified by process_pool, so that
+            encrypting large amounts of data does not block the Processor.
+            The Pending_Result resolves with the packed encrypted bytes. """
+        return pride.objects[self.process_pool].submit(pride.functions.security.encrypt, data=data,
+                                                       key=self.data_encryption_key, mac_key=self.data_mac_key,
+                                                       iv=urandom(self.iv_size), extra_data=extra_data,
+                                                       algorithm=self.encryption_algorithm, mode=self.encryption_mode)
+
+    def decrypt_in_pool(self, packed_encrypted_data):
+        """ usage: pride.objects["/User"].decrypt_in_pool(packed_encrypted_data) => pending_result
+
+            Decrypts packed encrypted data in the process_pool. The
+            Pending_Result resolves with the plaintext, or with InvalidTag
+            if authentication fails. """
+        return pride.objects[self.process_pool].submit(pride.functions.security.decrypt, packed_encrypted_data,
+                                                       self.data_encryption_key, self.data_mac_key)
+
     def authenticate(self, data):
         """ Returns tagged data.
 
@@ -310,11 +332,25 @@ class User(pride.components.base.Base):
 
 
 class Session(User):
-    """ An ID that only persists for one application execution. """
+    """ An ID that only persists for one application execution. The session
+        is deleted by the /Finalizer when the application exits, including
+        when it is restored from a checkpoint. """
     verbosity = {"login_success" : "vvv", "registering" : "vvv"}
 
+    def __init__(self, **kwargs):
+        super(Session, self).__init__(**kwargs)
+        pride.objects["/Finalizer"].add_callback((self.reference, "delete"), -1)
+
+    def on_load(self, attributes):
+        super(Session, self).on_load(attributes)
+        # the Finalizer runs its callbacks before a restart
+        finalizer = pride.objects["/Finalizer"]
+        finalizer.remove_callback((self.reference, "delete"), -1)
+        finalizer.add_callback((self.reference, "delete"), -1)
+
     def delete(self):
         self.forget_identity(self.username)
+        pride.objects["/Finalizer"].remove_callback((self.reference, "delete"), -1)
         super(Session, self).delete()
 
 def test_User():
@@ -0,0 +1,394 @@
+""" pride.components.workerpool - Runs blocking and CPU bound calls on worker
+    threads and processes and delivers the results back to the Processor thread. """
+import threading
+import traceback
+import functools
+import multiprocessing
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import pride
+import pride.components.scheduler
+import pride.components.datastructures
+import pride.functions.decorators
+
+Pending_Result = pride.components.scheduler.Pending_Result
+timestamp = pride.components.scheduler.timestamp
+
+@pride.functions.decorators.required_arguments(no_args=True)
+def run_in_thread(thread_pool="/Program/Thread_Pool"):
+    """ usage: @run_in_thread(thread_pool="/Program/Thread_Pool")
+
+        Decorates a method so that calling it submits the call to the
+        specified Thread_Pool and returns a scheduler.Pending_Result. When the
+        method is the target of an Instruction, the Instruction callback
+        receives the actual result on the Processor thread.
+
+        If the Thread_Pool does not exist, the method is called inline. """
+    def decorate(function):
+        @functools.wraps(function)
+        def _submit(self, *args, **kwargs):
+            try:
+                pool = pride.objects[thread_pool]
+            except KeyError:
+                return function(self, *args, **kwargs)
+            return pool.submit(function, self, *args, **kwargs)
+        return _submit
+    return decorate
+
+
+def _call_job(function, args, kwargs):
+    started_at = timestamp()
+    try:
+        result = function(*args, **kwargs)
+    except Exception as error:
+        error.traceback = traceback.format_exc()
+        result = error
+    return result, started_at, timestamp()
+
+
+class Worker_Pool(pride.components.scheduler.Process):
+    """ Base class for pools that call functions outside of the Processor.
+        submit returns a scheduler.Pending_Result; the run method delivers the
+        results to their callbacks on the Processor thread. If a job raises an
+        exception, the exception is alerted and delivered as the result, with
+        the formatted stack trace available as its traceback attribute.
+
+        The pool only runs while jobs are outstanding, and then checks for
+        results every priority seconds, so a result is delivered about a
+        millisecond after the job finishes. For monitoring,
+        outstanding is the number of jobs whose results have not been
+        delivered yet, and wait_time and execution_time are running averages
+        of the seconds jobs spent queued and executing.
+
+        Subclasses implement _submit_job, which must eventually place
+        (pending_result, (result, started_at, finished_at), submitted_at)
+        on self._results. """
+
+    defaults = {"priority" : .001, "run_condition" : "outstanding"}
+
+    predefaults = {"outstanding" : 0, "completed_count" : 0}
+
+    mutable_defaults = {"_results" : queue.Queue,
+                        "wait_time" : pride.components.datastructures.Average,
+                        "execution_time" : pride.components.datastructures.Average}
+
+    verbosity = {"job_exception" : 0}
+
+    def submit(self, function, *args, **kwargs):
+        """ usage: pool.submit(function, *args, **kwargs) => pending_result
+
+            Queues function(*args, **kwargs) to be called by the pool. """
+        pending_result = Pending_Result()
+        self.outstanding += 1
+        self._submit_job(pending_result, function, args, kwargs)
+        if not self._run_queued:
+            self.start()
+        return pending_result
+
+    def _submit_job(self, pending_result, function, args, kwargs):
+        raise NotImplementedError()
+
+    def run(self):
+        results = self._results
+        while True:
+            try:
+                (pending_result, (result, started_at, finished_at),
+                 submitted_at) = results.get_nowait()
+            except queue.Empty:
+                break
+            self.outstanding -= 1
+            self.completed_count += 1
+            self.wait_time.add(started_at - submitted_at)
+            self.execution_time.add(finished_at - started_at)
+            if isinstance(result, Exception) and hasattr(result, "traceback"):
+                self.alert("Exception in pool job:\n{}".format(result.traceback),
+                           level=self.verbosity["job_exception"])
+            pending_result.set_result(result)
+
+    def __getstate__(self):
+        attributes = super(Worker_Pool, self).__getstate__()
+        del attributes["_results"]
+        return attributes
+
+    def on_load(self, attributes):
+        super(Worker_Pool, self).on_load(attributes)
+        self._results = queue.Queue()
+        # results of jobs that were outstanding when the pool was saved are lost
+        self.outstanding = 0
+
+
+class Thread_Pool(Worker_Pool):
+    """ Calls functions on a bounded number of worker threads. Suitable for
+        calls that block on I/O; calls that are CPU bound and hold the GIL
+        should use a Process_Pool instead.
+
+        Worker threads are started when the first job is submitted. If
+        max_queued_jobs is not 0, submit does not block when that many jobs
+        are waiting for a thread; the job is rejected instead, and its
+        Pending_Result receives a queue.Full exception as the result.
+        queue_depth is the number of jobs waiting for a thread. """
+
+    defaults = {"thread_count" : 4, "max_queued_jobs" : 0}
+
+    mutable_defaults = {"_threads" : list}
+
+    verbosity = {"threads_started" : 'v'}
+
+    def _get_queue_depth(self):
+        return self._jobs.qsize()
+    queue_depth = property(_get_queue_depth)
+
+    def __init__(self, **kwargs):
+        super(Thread_Pool, self).__init__(**kwargs)
+        self._jobs = queue.Queue(self.max_queued_jobs)
+
+    def call(self, reference, method, *args, **kwargs):
+        """ usage: thread_pool.call(reference, method, *args, **kwargs) => pending_result
+
+            Calls the method of the component with the specified reference
+            on a worker thread. Used by Instruction.execute(thread_pool=...) """
+        return self.submit(getattr(pride.objects[reference], method), *args, **kwargs)
+
+    def _submit_job(self, pending_result, function, args, kwargs):
+        if not self._threads:
+            self._start_threads()
+        submitted_at = timestamp()
+        try:
+            self._jobs.put_nowait((pending_result, function, args, kwargs, submitted_at))
+        except queue.Full:
+            # delivered by run like any other result, so the Processor never blocks here
+            error = queue.Full("{} already has {} queued jobs".format(self.reference, self.max_queued_jobs))
+            self._results.put((pending_result, (error, submitted_at, submitted_at), submitted_at))
+
+    def _start_threads(self):
+        for count in range(self.thread_count):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        self.alert("Started {} threads".format(self.thread_count),
+                   level=self.verbosity["threads_started"])
+
+    def _work(self):
+        jobs, results = self._jobs, self._results
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            pending_result, function, args, kwargs, submitted_at = job
+            results.put((pending_result, _call_job(function, args, kwargs), submitted_at))
+
+    def delete(self):
+        for thread in self._threads:
+            self._jobs.put(None)
+        super(Thread_Pool, self).delete()
+
+    def __getstate__(self):
+        attributes = super(Thread_Pool, self).__getstate__()
+        del attributes["_jobs"]
+        del attributes["_threads"]
+        return attributes
+
+    def on_load(self, attributes):
+        super(Thread_Pool, self).on_load(attributes)
+        self._jobs = queue.Queue(self.max_queued_jobs)
+        self._threads = [] # the worker threads start when a job is submitted
+
+
+class Process_Pool(Worker_Pool):
+    """ Calls functions in a pool of worker processes, so that CPU bound work
+        such as key derivation and password hashing does not hold the GIL of
+        the Processor. Functions, arguments and results must be picklable;
+        functions should be defined at module level.
+
+        The worker processes are started when the first job is submitted.
+        process_count defaults to the number of cpus when set to 0. """
+
+    defaults = {"process_count" : 0}
+
+    predefaults = {"_pool" : None}
+
+    verbosity = {"processes_started" : 'v'}
+
+    def _submit_job(self, pending_result, function, args, kwargs):
+        if self._pool is None:
+            self._start_processes()
+        submitted_at = timestamp()
+        results = self._results
+        def _deliver(result):
+            # called on the result handling thread of the multiprocessing.Pool
+            results.put((pending_result, result, submitted_at))
+        self._pool.apply_async(_call_job, (function, args, kwargs), callback=_deliver)
+
+    def _start_processes(self):
+        process_count = self.process_count or multiprocessing.cpu_count()
+        self._pool = multiprocessing.Pool(process_count)
+        self.alert("Started {} processes".format(process_count),
+                   level=self.verbosity["processes_started"])
+
+    def delete(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+        super(Process_Pool, self).delete()
+
+    def __getstate__(self):
+        attributes = super(Process_Pool, self).__getstate__()
+        attributes["_pool"] = None
+        return attributes
+
+
+def test_Thread_Pool():
+    import time
+    import pride.components.base
+
+    class Blocking_Component(pride.components.base.Base):
+
+        @run_in_thread(thread_pool="/Thread_Pool")
+        def slow_call(self, duration):
+            time.sleep(duration)
+            return duration
+
+    processor = pride.components.scheduler.Processor()
+    pool = Thread_Pool(thread_count=4)
+    component = Blocking_Component()
+    results = []
+    def callback(result):
+        results.append(result)
+        if len(results) == 8:
+            raise SystemExit()
+
+    started_at = timestamp()
+    for count in range(8):
+        pride.Instruction(component.reference, "slow_call", .25).execute(callback=callback)
+    processor.running = True
+    try:
+        processor.run()
+    except SystemExit:
+        pass
+    elapsed = timestamp() - started_at
+    assert results == [.25] * 8, results
+    assert elapsed < 1.0, elapsed
+    print("8 calls of .25 seconds on 4 threads took {:.2f} seconds".format(elapsed))
+    print("Average wait time: {:.3f}s; Average execution time: {:.3f}s".format(pool.wait_time.average,
+                                                                             pool.execution_time.average))
+
+def test_Thread_Pool_purge():
+    import pride.components.base
+
+    class Recorder(pride.components.base.Base):
+
+        mutable_defaults = {"calls" : list}
+
+        def record(self, label):
+            self.calls.append(label)
+
+    processor = pride.components.scheduler.Processor()
+    pool = Thread_Pool(thread_count=1)
+    recorder = Recorder()
+    pool_pending_count = pride.Instruction.pending_count(pool.reference)
+    purged = pride.Instruction(recorder.reference, "record", "purged")
+    purged.execute(priority=.01, thread_pool=pool.reference)
+    unscheduled = pride.Instruction(recorder.reference, "record", "unscheduled")
+    unscheduled.execute(priority=.01, thread_pool=pool.reference)
+    assert pride.Instruction.pending_count(recorder.reference) == 2
+    assert pride.Instruction.pending_count(pool.reference) == pool_pending_count
+    unscheduled.unschedule()
+    assert pride.Instruction.pending_count(recorder.reference) == 1
+    pride.Instruction.purge(recorder.reference)
+    assert not pride.Instruction.pending_count(recorder.reference)
+
+    def callback(result):
+        raise SystemExit()
+    pride.Instruction(recorder.reference, "record", "executed").execute(callback=callback,
+                                                                       thread_pool=pool.reference)
+    processor.running = True
+    try:
+        processor.run()
+    except SystemExit:
+        pass
+    assert recorder.calls == ["executed"], recorder.calls
+    assert not pride.Instruction.pending_count(recorder.reference)
+    pool.delete()
+    processor.delete()
+    print("Passed Thread_Pool purge unit test")
+
+def test_Thread_Pool_overflow():
+    """ Checks that submitting to a full Thread_Pool does not block, that
+        the rejected job receives queue.Full, and measures how long results
+        take to reach their callbacks. """
+    import time
+    processor = pride.components.scheduler.Processor()
+    pool = Thread_Pool(thread_count=1, max_queued_jobs=1)
+    started, release = threading.Event(), threading.Event()
+    def block():
+        started.set()
+        return release.wait()
+    blocked = pool.submit(block)
+    started.wait()
+    queued = pool.submit(len, "queued")
+    started_at = timestamp()
+    rejected = pool.submit(len, "rejected")
+    assert timestamp() - started_at < .1
+
+    finished_at, latency = [], []
+    def sleep():
+        time.sleep(.002)
+        finished_at.append(timestamp())
+    def measure(result):
+        latency.append(timestamp() - finished_at[-1])
+        if len(latency) < 50:
+            pool.submit(sleep).add_callback(measure)
+        else:
+            raise SystemExit()
+    queued.add_callback(lambda result: pool.submit(sleep).add_callback(measure))
+    release.set()
+    processor.running = True
+    try:
+        processor.run()
+    except SystemExit:
+        pass
+    assert isinstance(rejected.result, queue.Full), rejected.result
+    assert blocked.result is True and queued.result == len("queued")
+    print("Average delay between a job finishing and its callback: {:.2f}ms".format(1000 * sum(latency) / len(latency)))
+    pool.delete()
+    processor.delete()
+    print("Passed Thread_Pool overflow unit test")
+
+def test_Process_Pool():
+    import pride.functions.security
+    processor = pride.components.scheduler.Processor()
+    pool = Process_Pool()
+    hash_password = pride.functions.security.hash_password
+    verify_hashed_password = pride.functions.security.verify_hashed_password
+    job_count = 8
+    hashes = []
+    def callback(result):
+        hashes.append(result)
+        if len(hashes) == job_count:
+            raise SystemExit()
+
+    started_at = timestamp()
+    for count in range(job_count):
+        pride.Instruction(pool.reference, "submit", hash_password,
+                          "password", 100000).execute(callback=callback)
+    processor.running = True
+    try:
+        processor.run()
+    except SystemExit:
+        pass
+    elapsed = timestamp() - started_at
+    assert all(verify_hashed_password("password", _hash) for _hash in hashes)
+    print("{} password hashes on {} processes took {:.2f} seconds".format(job_count,
+                                                                         multiprocessing.cpu_count(),
+                                                                         elapsed))
+    pool.delete()
+
+if __name__ == "__main__":
+    test_Thread_Pool()
+    test_Thread_Pool_purge()
+    test_Thread_Pool_overflow()
+    test_Process_Pool()
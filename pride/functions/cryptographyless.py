@@ -13,7 +13,8 @@ from persistence import save_data, load_data
 __all__ = ("InvalidTag", "random_bytes", "psuedorandom_bytes", "encrypt", "decrypt",
            "Hash_Object", "Key_Derivation_Object", "HKDFExpand", "hkdf_expand",
            "key_derivation_function", "generate_mac", "apply_mac", "verify_mac",
-           "hash_function")
+           "hash_function", "hash_password", "verify_hashed_password",
+           "constant_time_comparison")
 
 _TEST_KEY = "\x00" * 16
 _TEST_MESSAGE = "This is a sweet test message :)"
@@ -121,7 +122,7 @@ class Hash_Object(object):
 def hash_password(password, iterations, algorithm="pbkdf2hmac", sub_algorithm="sha256",
                                         salt=None, salt_size=16, output_size=32,
                                         backend="cryptographyless"):
-    salt = os.urandom(salt_size)
+    salt = os.urandom(salt_size) if salt is None else salt
     header = save_data(algorithm, sub_algorithm, iterations, salt_size, output_size)
     if algorithm == "pbkdf2hmac":
         return save_data(header, salt, hashlib.pbkdf2_hmac(sub_algorithm, header + password, salt, iterations, output_size))
@@ -384,7 +384,7 @@ class SDL_Window(SDL_Component):
 
     def delete(self):
         # delete window objects before sdl components
-        for child in self.children:
+        for child in list(self.children):
             if hasattr(child, "pack"):
                 child.delete()
         self.run_instruction.unschedule()
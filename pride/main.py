@@ -11,14 +11,22 @@ if python_version_tuple()[0] == '3':
 def main():
     import pride.components.interpreter
     running = True
+    checkpoint = None
     while running:
         assert "/Program" not in pride.objects
-        python = pride.components.interpreter.Program(parse_args=True)
+        if checkpoint is None:
+            python = pride.components.interpreter.Program(parse_args=True)
+        else:
+            python = pride.components.interpreter.Program.load(checkpoint)
+            checkpoint = None
 
         try:
             python.start_machine()
         except BaseException as error:
             running = False
+            if getattr(error, "code", '') == "Restart" and python.checkpoint_on_restart:
+                # saved before the finalizer callbacks close databases and files
+                checkpoint = python.save()
             pride.objects["/Finalizer"].run()
             if isinstance(error, SystemExit) or isinstance(error, KeyboardInterrupt):
                 python.alert("Session shutdown intiated... ", level=python.verbosity["shutdown"])
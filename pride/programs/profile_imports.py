@@ -0,0 +1,116 @@
+""" pride.programs.profile_imports - Reports the time taken to import each
+    pride module.
+
+    usage: python -m pride.programs.profile_imports [--all] [module_name ...]
+
+    The modules (pride.components.network by default) are imported in a new
+    interpreter, so that pride itself is imported from scratch. For each
+    module loaded, the cumulative time includes the modules it imported;
+    self time excludes them. Only pride modules are reported unless --all
+    is specified. """
+import os
+import sys
+import subprocess
+import tempfile
+
+import pride
+
+# runs in the new interpreter before anything else is imported
+_PROFILER = '''
+import sys
+import timeit
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+timer = timeit.default_timer
+_import = builtins.__import__
+modules = sys.modules
+loaded = set(modules)
+records = []
+# one [nested_time, module_names] entry per active import
+stack = [[0.0, []]]
+module_count = [len(modules)]
+
+def claim_new_modules():
+    # modules that appeared since the last check were loaded by the innermost
+    # active import; a module is in sys.modules while its body executes.
+    # python 2 also adds None entries for failed implicit relative imports
+    if len(modules) != module_count[0]:
+        module_count[0] = len(modules)
+        new_modules = [module_name for module_name, module in list(modules.items()) if
+                       module is not None and module_name not in loaded]
+        loaded.update(new_modules)
+        stack[-1][1].extend(new_modules)
+
+def profiled_import(name, globals=None, locals=None, fromlist=(), level=-1 if sys.version_info[0] == 2 else 0):
+    claim_new_modules()
+    stack.append([0.0, []])
+    started_at = timer()
+    try:
+        return _import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = timer() - started_at
+        claim_new_modules()
+        nested_time, module_names = stack.pop()
+        if module_names:
+            records.append((" + ".join(sorted(module_names)), elapsed, elapsed - nested_time))
+            stack[-1][0] += elapsed
+
+builtins.__import__ = profiled_import
+output_file = sys.argv[1]
+for module_name in sys.argv[2:]:
+    # packages are imported first so that they are reported separately
+    names = module_name.split('.')
+    for index in range(1, len(names) + 1):
+        __import__('.'.join(names[:index]))
+builtins.__import__ = _import
+with open(output_file, 'w') as _file:
+    _file.write(repr(records))
+'''
+
+def profile_imports(module_names=("pride.components.network", ), python=sys.executable):
+    """ usage: profile_imports(module_names=("pride.components.network", ),
+                               python=sys.executable) => [(module_name, cumulative, self_time), ...]
+
+        Imports module_names in a new python interpreter and returns the
+        cumulative and self import time, in seconds, of each module that was
+        loaded, in the order the imports finished. """
+    package_directory = os.path.dirname(os.path.dirname(os.path.abspath(pride.__file__)))
+    environment = os.environ.copy()
+    environment["PYTHONPATH"] = os.pathsep.join(path for path in (package_directory,
+                                                                  environment.get("PYTHONPATH", '')) if path)
+    handle, output_file = tempfile.mkstemp(suffix=".txt")
+    os.close(handle)
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([python, "-c", _PROFILER, output_file] + list(module_names),
+                                  env=environment, stdout=devnull)
+        with open(output_file, 'r') as _file:
+            return eval(_file.read())
+    finally:
+        os.remove(output_file)
+
+def format_report(records, prefix="pride"):
+    """ usage: format_report(records, prefix="pride") => str
+
+        Formats the records returned by profile_imports as a table sorted by
+        cumulative time. Only modules whose names start with prefix are
+        included. """
+    lines = ["{:>10} {:>10}  {}".format("cumulative", "self", "module")]
+    for module_name, cumulative, self_time in sorted(records, key=lambda record: record[1],
+                                                     reverse=True):
+        if module_name.startswith(prefix):
+            lines.append("{:>9.4f}s {:>9.4f}s  {}".format(cumulative, self_time, module_name))
+    return '\n'.join(lines)
+
+def main(arguments=None):
+    arguments = list(sys.argv[1:] if arguments is None else arguments)
+    prefix = "pride"
+    if "--all" in arguments:
+        arguments.remove("--all")
+        prefix = ''
+    print(format_report(profile_imports(arguments or ("pride.components.network", )), prefix))
+
+if __name__ == "__main__":
+    main()